@@ -0,0 +1,230 @@
+"""Load test of the game routes with simulated players.
+
+Every player starts a game with `/new/{user_id}/{user_elo}`, loads
+`/game/{token}` and plays random legal moves with `PUT /move/{token}` until
+the game ends, then starts the next game. See README.md for usage.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import re
+import statistics
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Union
+
+import chess
+import httpx
+import psutil
+
+log = logging.getLogger()
+
+FEN_PATTERN = re.compile(r'var current_fen = "([^"]*)";')
+
+
+class Recorder:
+    """Collect latencies and status codes per route."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.status: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Counter = Counter()
+        self.engine_processes: List[int] = []
+        self.games = 0
+        self.moves = 0
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str, **kwargs) -> Union[httpx.Response, None]:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors[f"{route}: {type(e).__name__}"] += 1
+            return None
+
+        self.latencies[route].append(time.perf_counter() - start)
+        self.status[route][response.status_code] += 1
+        return response
+
+    def summary(self, seconds: float) -> Dict:
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            quantiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+            routes[route] = {
+                'requests': len(latencies),
+                'throughput': round(len(latencies) / seconds, 2),
+                'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+                'p50_ms': round(quantiles[49] * 1000, 2),
+                'p95_ms': round(quantiles[94] * 1000, 2),
+                'p99_ms': round(quantiles[98] * 1000, 2),
+                'max_ms': round(max(latencies) * 1000, 2),
+                'status': {str(code): count for code, count in sorted(self.status[route].items())},
+            }
+
+        return {
+            'seconds': round(seconds, 1),
+            'games': self.games,
+            'moves': self.moves,
+            'moves_per_second': round(self.moves / seconds, 2),
+            'errors': dict(self.errors),
+            'engine_processes_max': max(self.engine_processes, default=0),
+            'engine_processes_mean': round(statistics.mean(self.engine_processes), 2) if self.engine_processes else 0,
+            'routes': routes,
+        }
+
+
+def pick_engine_move(board: chess.Board, source: str, target: str) -> chess.Move:
+    # the API only returns the squares, a promotion is played as queen like in game.js
+    candidates = [
+        move for move in board.legal_moves
+        if chess.square_name(move.from_square) == source and chess.square_name(move.to_square) == target
+    ]
+    return next((move for move in candidates if move.promotion in (None, chess.QUEEN)), candidates[0])
+
+
+async def play(
+        client: httpx.AsyncClient, recorder: Recorder, player: int, args: argparse.Namespace, deadline: float,
+        ) -> None:
+    user_elo = random.choice(args.elo)
+
+    while time.monotonic() < deadline:
+        response = await recorder.request(
+            client, '/new', 'GET', f'/new/bench-{player}/{user_elo}',
+            params={'redirect_url': 'https://example.org', 'game_number': 0},
+        )
+        if response is None or response.status_code != 307:
+            await asyncio.sleep(1)
+            continue
+
+        game_path = response.headers['location']
+        token = game_path.rsplit('/', 1)[-1]
+        response = await recorder.request(client, '/game', 'GET', game_path)
+        if response is None or response.status_code != 200:
+            continue
+
+        fen = FEN_PATTERN.search(response.text)
+        board = chess.Board(fen.group(1)) if fen and fen.group(1) else chess.Board()
+        recorder.games += 1
+
+        while time.monotonic() < deadline:
+            await asyncio.sleep(random.uniform(args.think_min, args.think_max))
+
+            old_fen = board.fen()
+            # game.js always promotes to a queen
+            move = random.choice([move for move in board.legal_moves if move.promotion in (None, chess.QUEEN)])
+            piece = board.piece_at(move.from_square)
+            board.push(move)
+            data = {
+                'source': chess.square_name(move.from_square),
+                'target': chess.square_name(move.to_square),
+                'piece': f"{'w' if piece.color else 'b'}{piece.symbol().upper()}",
+                'new_fen': board.fen(),
+                'old_fen': old_fen,
+                'promotion': 'q' if move.promotion else None,
+            }
+
+            response = await recorder.request(client, '/move', 'PUT', f'/move/{token}', json={'data': data})
+            if response is None or response.status_code != 200:
+                # the move was not saved, e.g. 503 with Retry-After
+                board.pop()
+                if response is not None and 'retry-after' in response.headers:
+                    await asyncio.sleep(float(response.headers['retry-after']))
+                continue
+
+            result = response.json()
+            if result.get('error'):
+                board.pop()
+                continue
+
+            recorder.moves += 1
+            if result.get('move'):
+                board.push(pick_engine_move(board, *result['move']))
+
+            if result.get('game_end'):
+                break
+
+
+def count_engine_processes(name: str) -> int:
+    count = 0
+    for process in psutil.process_iter(['name', 'cmdline']):
+        if process.pid == os.getpid():
+            continue
+
+        try:
+            if name in (process.info['name'] or '') or any(name in part for part in process.info['cmdline'] or []):
+                count += 1
+        except psutil.Error:
+            continue
+
+    return count
+
+
+async def sample_engines(recorder: Recorder, name: str, deadline: float) -> None:
+    while time.monotonic() < deadline:
+        recorder.engine_processes.append(await asyncio.to_thread(count_engine_processes, name))
+        await asyncio.sleep(1)
+
+
+async def main(args: argparse.Namespace) -> Dict:
+    recorder = Recorder()
+    started = datetime.now()
+    limits = httpx.Limits(max_connections=args.players, max_keepalive_connections=args.players)
+    start = time.monotonic()
+    deadline = start + args.duration
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        players = []
+        for player in range(args.players):
+            players.append(asyncio.create_task(play(client, recorder, player, args, deadline)))
+            # ramp up, so the first requests do not all arrive at once
+            await asyncio.sleep(args.ramp_up / args.players)
+
+        await asyncio.gather(sample_engines(recorder, args.engine_name, deadline), *players)
+
+        status = None
+        try:
+            headers = {'Authorization': f"Bearer {args.status_token}"} if args.status_token else None
+            status = (await client.get('/status', headers=headers)).json()
+        except (httpx.HTTPError, ValueError):
+            pass
+
+    return {
+        'started': started.isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'cpus': psutil.cpu_count(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'status_token')},
+        **recorder.summary(time.monotonic() - start),
+        'server_status': status,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate concurrent players against a running UHH-Chess server.")
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help="base URL of the server")
+    parser.add_argument('--players', type=int, default=10, help="simultaneous players")
+    parser.add_argument('--duration', type=float, default=60, help="seconds to run")
+    parser.add_argument('--ramp-up', type=float, default=5, help="seconds until all players started")
+    parser.add_argument('--think-min', type=float, default=1.0, help="minimum think time of a player in seconds")
+    parser.add_argument('--think-max', type=float, default=3.0, help="maximum think time of a player in seconds")
+    parser.add_argument('--elo', type=int, nargs='+', default=[1200, 1500, 1800], help="user Elo levels, one is picked per player")
+    parser.add_argument('--timeout', type=float, default=30, help="request timeout in seconds")
+    parser.add_argument('--engine-name', default='stockfish', help="process name or command line part of the engine to count")
+    parser.add_argument('--status-token', help="[metrics] token of the server, needed for /status from another host")
+    parser.add_argument('--output', type=Path, default=Path('benchmark', 'results'), help="directory for the JSON result")
+    args = parser.parse_args()
+
+    result = asyncio.run(main(args))
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    output_file = args.output / f"{datetime.now():%Y%m%d-%H%M%S}_{args.players}p.json"
+    output_file.write_text(json.dumps(result, indent=4))
+
+    for route, stats in result['routes'].items():
+        print(f"{route:6} {stats['requests']:6} req  p50 {stats['p50_ms']:8} ms  p95 {stats['p95_ms']:8} ms  p99 {stats['p99_ms']:8} ms  {stats['status']}")
+    print(f"{result['moves_per_second']} moves/s, max {result['engine_processes_max']} engine processes")
+    print(f"Saved result to {output_file}")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Minimal UCI engine for load tests: answers every search with a random legal move.
+
+Set `[stockfish] path` to this file to measure the app without the CPU cost
+of real searches. The reply delay is the search time limit of the request,
+capped by `STUB_ENGINE_MAX_DELAY` (seconds, default 0.1).
+"""
+import os
+import random
+import sys
+import time
+
+import chess
+
+MAX_DELAY = float(os.environ.get('STUB_ENGINE_MAX_DELAY', '0.1'))
+OPTIONS = (
+    'option name Threads type spin default 1 min 1 max 512',
+    'option name Hash type spin default 16 min 1 max 33554432',
+    'option name UCI_LimitStrength type check default false',
+    'option name UCI_Elo type spin default 1320 min 1320 max 3190',
+    'option name Slow Mover type spin default 100 min 10 max 1000',
+)
+
+
+def main():
+    board = chess.Board()
+
+    for line in sys.stdin:
+        parts = line.split()
+        if not parts:
+            continue
+
+        command = parts[0]
+        if command == 'uci':
+            print('id name UHH-Chess stub engine')
+            print('\n'.join(OPTIONS))
+            print('uciok')
+        elif command == 'isready':
+            print('readyok')
+        elif command == 'ucinewgame':
+            board = chess.Board()
+        elif command == 'position':
+            moves = parts.index('moves') if 'moves' in parts else len(parts)
+            board = chess.Board(' '.join(parts[2:moves])) if parts[1] == 'fen' else chess.Board()
+            for move in parts[moves + 1:]:
+                board.push_uci(move)
+        elif command == 'go':
+            delay = MAX_DELAY
+            if 'movetime' in parts:
+                delay = min(delay, int(parts[parts.index('movetime') + 1]) / 1000)
+            time.sleep(delay)
+
+            move = random.choice(list(board.legal_moves)) if not board.is_game_over() else None
+            print(f"info depth 1 score cp 0{f' pv {move.uci()}' if move else ''}")
+            print(f"bestmove {move.uci() if move else '(none)'}")
+        elif command == 'quit':
+            break
+
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import time
+from datetime import datetime
+from pathlib import Path
+
+log = logging.getLogger()
+
+
+def shard_path(output: Path, shard: int, shards: int) -> Path:
+    if shards == 1:
+        return output
+
+    return output.with_name(f"{output.stem}.{shard + 1}-of-{shards}{output.suffix}")
+
+
+async def export_shard(args: argparse.Namespace, shard: int) -> int:
+    # imported here, so every worker process sets up its own database pool
+    from src.lib.bulk_export import ExportWriter, stream_games
+    from src.lib.settings import create_sql, load_config, setup_cli_logging
+
+    config = load_config()
+    setup_cli_logging(config)
+    sql_conn = create_sql(config)
+
+    path = shard_path(args.output, shard, args.shards)
+    writer = ExportWriter(path, args.format)
+    games = 0
+    start = time.monotonic()
+
+    await sql_conn.connect()
+    try:
+        async for rows in stream_games(
+                sql_conn, user_id=args.user_id, start_from=args.start_from, start_to=args.start_to,
+                game_number=args.game_number, shard=shard, shards=args.shards,
+                max_user_draw_time=config['game'].getfloat('max_draw_time', 30.0),
+                ):
+            writer.write(rows)
+            games += 1
+    finally:
+        writer.close()
+        await sql_conn.close()
+
+    print(f"{path}: {games} games, {writer.rows} moves in {time.monotonic() - start:.1f} s")
+    return games
+
+
+def run_shard(args: argparse.Namespace, shard: int) -> int:
+    return asyncio.run(export_shard(args, shard))
+
+
+def main(args: argparse.Namespace) -> int:
+    if args.shards == 1:
+        games = run_shard(args, 0)
+    else:
+        # spawn, so no worker inherits the connections or threads of the parent
+        with multiprocessing.get_context('spawn').Pool(args.shards) as pool:
+            games = sum(pool.starmap(run_shard, [(args, shard) for shard in range(args.shards)]))
+
+    print(f"Exported {games} games")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export finished games with the derived fields of the game data files.")
+    parser.add_argument('output', type=Path, help="output file, shards get '.<n>-of-<shards>' before the suffix")
+    parser.add_argument('--format', choices=('jsonl', 'csv', 'parquet'), default='jsonl', help="output format, parquet needs pyarrow")
+    parser.add_argument('--user-id', help="only games of this user")
+    parser.add_argument('--start-from', type=datetime.fromisoformat, help="only games started at or after this ISO date")
+    parser.add_argument('--start-to', type=datetime.fromisoformat, help="only games started before this ISO date")
+    parser.add_argument('--game-number', type=int, help="only games with this game number")
+    parser.add_argument('--shards', type=int, default=1, help="split the games by id into this many files, written by parallel processes")
+    args = parser.parse_args()
+
+    raise SystemExit(main(args))
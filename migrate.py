@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import logging
+
+from src.lib.migrations import Migrations
+from src.lib.settings import create_sql, load_config, setup_cli_logging
+
+log = logging.getLogger()
+
+
+async def main(status: bool = False, explain: bool = False) -> int:
+    config = load_config()
+    setup_cli_logging(config)
+    sql_conn = create_sql(config)
+
+    await sql_conn.connect()
+    migrations = Migrations(sql_conn)
+
+    try:
+        if status:
+            for version, name, _ in await migrations.pending():
+                print(f"pending: {version} {name}")
+        else:
+            for version in await migrations.apply():
+                print(f"applied: {version}")
+
+        if explain:
+            full_scans = await migrations.explain()
+            for name, rows in full_scans.items():
+                print(f"full scan in '{name}': {rows}")
+
+            if full_scans:
+                return 1
+
+            print("No request path or export query does a full scan.")
+    finally:
+        await sql_conn.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the database migrations in queries/migrations.")
+    parser.add_argument('--status', action='store_true', help="only list pending migrations")
+    parser.add_argument('--explain', action='store_true', help="check the request path and export queries for full scans with EXPLAIN")
+    args = parser.parse_args()
+
+    raise SystemExit(asyncio.run(main(args.status, args.explain)))
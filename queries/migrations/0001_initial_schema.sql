@@ -0,0 +1,35 @@
+-- Schema of queries/db.sql before migrations existed. Existing databases keep their tables.
+CREATE TABLE IF NOT EXISTS games (
+	id BIGINT UNSIGNED auto_increment NOT NULL PRIMARY KEY,
+	`start` TIMESTAMP DEFAULT NOW() NOT NULL,
+	stop TIMESTAMP NULL DEFAULT NULL,
+	token VARCHAR(64) DEFAULT sha2(uuid(), 0) NULL,
+	user_elo INT UNSIGNED NOT NULL,
+	ki_elo INT UNSIGNED NOT NULL,
+	user_id varchar(100) NOT NULL,
+	end_reasons VARCHAR(100) DEFAULT NULL NULL,
+	winning_color VARCHAR(100) NULL,
+	first_game_start TIMESTAMP DEFAULT NOW() NOT NULL,
+	redirect_url varchar(255) NOT NULL,
+	game_number INT NULL
+)
+ENGINE=InnoDB
+DEFAULT CHARSET=utf8mb4
+COLLATE=utf8mb4_german2_ci;
+
+CREATE TABLE IF NOT EXISTS moves (
+	game_id BIGINT UNSIGNED NOT NULL,
+	source CHAR(2) NOT NULL,
+	target CHAR(2) NOT NULL,
+	new_fen VARCHAR(100) NOT NULL,
+	old_fen VARCHAR(100) NOT NULL,
+	piece CHAR(2) NULL,
+	promotion_symbol CHAR NULL,
+	t_stamp TIMESTAMP(3) DEFAULT NOW(3) NOT NULL,
+	castling VARCHAR(128) NULL,
+	color varchar(5) NULL,
+	CONSTRAINT NewTable_FK FOREIGN KEY (game_id) REFERENCES games(id) ON DELETE CASCADE
+)
+ENGINE=InnoDB
+DEFAULT CHARSET=utf8mb4
+COLLATE=utf8mb4_german2_ci;
@@ -0,0 +1,51 @@
+-- Every request looks up its game by token. Tokens of finished or abandoned games are no longer used
+-- (older versions also overwrote the token of every game), so clear them before adding the unique index.
+UPDATE games SET token = NULL WHERE stop IS NOT NULL OR end_reasons IS NOT NULL OR `start` < NOW() - INTERVAL 1 DAY;
+-- a token shared by running games cannot be told apart either
+UPDATE games g
+	JOIN (SELECT token FROM games WHERE token IS NOT NULL GROUP BY token HAVING COUNT(*) > 1) d USING (token)
+SET g.token = NULL;
+
+CREATE UNIQUE INDEX games_token_uq ON games (token);
+
+-- Rebuild moves with the ply number as part of a clustered (game_id, ply) primary key,
+-- so the move history of a game is read in order from one index range.
+CREATE TABLE moves_new (
+	game_id BIGINT UNSIGNED NOT NULL,
+	ply SMALLINT UNSIGNED NOT NULL,
+	source CHAR(2) NOT NULL,
+	target CHAR(2) NOT NULL,
+	new_fen VARCHAR(100) NOT NULL,
+	old_fen VARCHAR(100) NOT NULL,
+	piece CHAR(2) NULL,
+	promotion_symbol CHAR NULL,
+	t_stamp TIMESTAMP(3) DEFAULT NOW(3) NOT NULL,
+	castling VARCHAR(128) NULL,
+	color varchar(5) NULL,
+	PRIMARY KEY (game_id, ply),
+	CONSTRAINT moves_game_fk FOREIGN KEY (game_id) REFERENCES games(id) ON DELETE CASCADE
+)
+ENGINE=InnoDB
+DEFAULT CHARSET=utf8mb4
+COLLATE=utf8mb4_german2_ci;
+
+-- Plies saved in the same millisecond are ordered by the ply of their FEN:
+-- 2 * (fullmove number - 1), plus one if black is to move.
+INSERT INTO moves_new
+	(game_id, ply, source, target, new_fen, old_fen, piece, promotion_symbol, t_stamp, castling, color)
+SELECT
+	game_id,
+	ROW_NUMBER() OVER (
+		PARTITION BY game_id
+		ORDER BY
+			t_stamp,
+			2 * (CAST(SUBSTRING_INDEX(new_fen, ' ', -1) AS UNSIGNED) - 1)
+				+ (SUBSTRING_INDEX(SUBSTRING_INDEX(new_fen, ' ', 2), ' ', -1) = 'b')
+	),
+	source, target, new_fen, old_fen, piece, promotion_symbol, t_stamp, castling, color
+FROM
+	moves;
+
+RENAME TABLE moves TO moves_old, moves_new TO moves;
+
+DROP TABLE moves_old;
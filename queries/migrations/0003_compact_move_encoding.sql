@@ -0,0 +1,39 @@
+-- Store each ply as a 16 bit code (from | to << 6 | promotion << 12) instead of two FENs.
+-- Source, target, FENs, piece, castling and color are rebuilt by replaying the codes (src/lib/move_codec.py).
+ALTER TABLE moves
+	ADD COLUMN move_code SMALLINT UNSIGNED NULL AFTER ply,
+	ADD COLUMN fen_checkpoint VARCHAR(100) NULL AFTER move_code;
+
+UPDATE moves SET
+	move_code =
+		(ASCII(source) - 97) + 8 * (CAST(SUBSTRING(source, 2, 1) AS UNSIGNED) - 1)
+		+ ((ASCII(target) - 97) + 8 * (CAST(SUBSTRING(target, 2, 1) AS UNSIGNED) - 1)) * 64
+		+ FIELD(promotion_symbol, 'p', 'n', 'b', 'r', 'q', 'k') * 4096,
+	-- new moves keep a FEN every 20 plies (FEN_CHECKPOINT_INTERVAL). Older versions saved the user and
+	-- engine moves in separate steps and may have lost some, so every stored FEN is kept: the replay
+	-- continues from the checkpoint of each ply and exports the FENs as they were stored.
+	fen_checkpoint = new_fen;
+
+ALTER TABLE moves
+	MODIFY move_code SMALLINT UNSIGNED NOT NULL,
+	DROP COLUMN source,
+	DROP COLUMN target,
+	DROP COLUMN new_fen,
+	DROP COLUMN old_fen,
+	DROP COLUMN piece,
+	DROP COLUMN promotion_symbol,
+	DROP COLUMN castling,
+	DROP COLUMN color;
+
+-- Source, target and promotion of the former move columns. FENs, piece, castling and color
+-- need the replay of src/lib/move_codec.py, e.g. as done by export.py.
+CREATE OR REPLACE VIEW moves_legacy AS
+SELECT
+	game_id,
+	ply,
+	CONCAT(CHAR(97 + (move_code & 7) USING utf8mb4), 1 + (move_code >> 3 & 7)) AS source,
+	CONCAT(CHAR(97 + (move_code >> 6 & 7) USING utf8mb4), 1 + (move_code >> 9 & 7)) AS target,
+	ELT(move_code >> 12 & 7, 'p', 'n', 'b', 'r', 'q', 'k') AS promotion_symbol,
+	t_stamp
+FROM
+	moves;
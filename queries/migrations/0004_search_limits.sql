@@ -0,0 +1,7 @@
+-- Search limit each engine move was played with (src/lib/search_limits.py), NULL for user moves.
+-- search_source tells whether the reply was searched, served from the move cache or from the opening book.
+ALTER TABLE moves
+	ADD COLUMN search_time FLOAT NULL AFTER t_stamp,
+	ADD COLUMN search_depth TINYINT UNSIGNED NULL AFTER search_time,
+	ADD COLUMN search_nodes INT UNSIGNED NULL AFTER search_depth,
+	ADD COLUMN search_source ENUM('engine', 'cache', 'book') NULL AFTER search_nodes;
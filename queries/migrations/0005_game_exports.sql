@@ -0,0 +1,16 @@
+-- Queue of finished games whose data file still has to be written (src/lib/game_export.py).
+-- Rows are inserted in the transaction which saves the game end and deleted once the file is written.
+CREATE TABLE IF NOT EXISTS game_exports (
+	game_id BIGINT UNSIGNED NOT NULL PRIMARY KEY,
+	-- the token of a finished game is removed from games, but it is part of the file name
+	token VARCHAR(64) NOT NULL,
+	created TIMESTAMP DEFAULT NOW() NOT NULL,
+	attempts INT UNSIGNED DEFAULT 0 NOT NULL,
+	claimed_until TIMESTAMP NULL DEFAULT NULL,
+	last_error TEXT NULL,
+	CONSTRAINT game_exports_game_fk FOREIGN KEY (game_id) REFERENCES games(id) ON DELETE CASCADE,
+	INDEX game_exports_pending_idx (attempts, claimed_until, created)
+)
+ENGINE=InnoDB
+DEFAULT CHARSET=utf8mb4
+COLLATE=utf8mb4_german2_ci;
@@ -0,0 +1,19 @@
+-- Offline engine analysis of the user moves, written by reanalyze.py (src/lib/reanalysis.py).
+-- Evaluations are centipawns from the view of the player who moved, mates count as +-10000.
+CREATE TABLE IF NOT EXISTS move_analysis (
+	game_id BIGINT UNSIGNED NOT NULL,
+	ply SMALLINT UNSIGNED NOT NULL,
+	best_move_code SMALLINT UNSIGNED NULL,
+	eval_before INT NOT NULL,
+	eval_after INT NOT NULL,
+	centipawn_loss INT UNSIGNED NOT NULL,
+	best_move BOOL NOT NULL,
+	blunder BOOL NOT NULL,
+	depth TINYINT UNSIGNED NULL,
+	analysed_at TIMESTAMP DEFAULT NOW() NOT NULL,
+	PRIMARY KEY (game_id, ply),
+	CONSTRAINT move_analysis_move_fk FOREIGN KEY (game_id, ply) REFERENCES moves(game_id, ply) ON DELETE CASCADE
+)
+ENGINE=InnoDB
+DEFAULT CHARSET=utf8mb4
+COLLATE=utf8mb4_german2_ci;
@@ -0,0 +1,29 @@
+-- SQLite schema of games and moves as of MariaDB migration 0003, the SQLite backend starts there.
+-- Timestamps are local time text like NOW(), which src/lib/sqlite.py reads back as datetime.
+CREATE TABLE IF NOT EXISTS games (
+	id INTEGER PRIMARY KEY AUTOINCREMENT,
+	`start` TIMESTAMP DEFAULT (datetime('now', 'localtime')) NOT NULL,
+	stop TIMESTAMP NULL DEFAULT NULL,
+	token VARCHAR(64) DEFAULT (lower(hex(randomblob(32)))) NULL,
+	user_elo INTEGER NOT NULL,
+	ki_elo INTEGER NOT NULL,
+	user_id VARCHAR(100) NOT NULL,
+	end_reasons VARCHAR(100) DEFAULT NULL NULL,
+	winning_color VARCHAR(100) NULL,
+	first_game_start TIMESTAMP DEFAULT (datetime('now', 'localtime')) NOT NULL,
+	redirect_url VARCHAR(255) NOT NULL,
+	game_number INTEGER NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS games_token_uq ON games (token);
+
+-- clustered (game_id, ply) primary key, see MariaDB migration 0002
+CREATE TABLE IF NOT EXISTS moves (
+	game_id INTEGER NOT NULL,
+	ply INTEGER NOT NULL,
+	move_code INTEGER NOT NULL,
+	fen_checkpoint VARCHAR(100) NULL,
+	t_stamp TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')) NOT NULL,
+	PRIMARY KEY (game_id, ply),
+	CONSTRAINT moves_game_fk FOREIGN KEY (game_id) REFERENCES games(id) ON DELETE CASCADE
+) WITHOUT ROWID;
@@ -0,0 +1 @@
+-- Part of 0001_initial_schema.sql for SQLite.
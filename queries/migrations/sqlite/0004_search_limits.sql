@@ -0,0 +1,5 @@
+-- Search limit each engine move was played with (src/lib/search_limits.py), NULL for user moves.
+ALTER TABLE moves ADD COLUMN search_time FLOAT NULL;
+ALTER TABLE moves ADD COLUMN search_depth INTEGER NULL;
+ALTER TABLE moves ADD COLUMN search_nodes INTEGER NULL;
+ALTER TABLE moves ADD COLUMN search_source VARCHAR(6) NULL CHECK (search_source IN ('engine', 'cache', 'book'));
@@ -0,0 +1,12 @@
+-- Queue of finished games whose data file still has to be written (src/lib/game_export.py).
+CREATE TABLE IF NOT EXISTS game_exports (
+	game_id INTEGER NOT NULL PRIMARY KEY,
+	token VARCHAR(64) NOT NULL,
+	created TIMESTAMP DEFAULT (datetime('now', 'localtime')) NOT NULL,
+	attempts INTEGER DEFAULT 0 NOT NULL,
+	claimed_until TIMESTAMP NULL DEFAULT NULL,
+	last_error TEXT NULL,
+	CONSTRAINT game_exports_game_fk FOREIGN KEY (game_id) REFERENCES games(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS game_exports_pending_idx ON game_exports (attempts, claimed_until, created);
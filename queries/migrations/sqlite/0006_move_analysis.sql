@@ -0,0 +1,15 @@
+-- Offline engine analysis of the user moves, written by reanalyze.py (src/lib/reanalysis.py).
+CREATE TABLE IF NOT EXISTS move_analysis (
+	game_id INTEGER NOT NULL,
+	ply INTEGER NOT NULL,
+	best_move_code INTEGER NULL,
+	eval_before INTEGER NOT NULL,
+	eval_after INTEGER NOT NULL,
+	centipawn_loss INTEGER NOT NULL,
+	best_move BOOL NOT NULL,
+	blunder BOOL NOT NULL,
+	depth INTEGER NULL,
+	analysed_at TIMESTAMP DEFAULT (datetime('now', 'localtime')) NOT NULL,
+	PRIMARY KEY (game_id, ply),
+	CONSTRAINT move_analysis_move_fk FOREIGN KEY (game_id, ply) REFERENCES moves(game_id, ply) ON DELETE CASCADE
+) WITHOUT ROWID;
@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import logging
+import os
+
+from src.lib.reanalysis import Reanalysis
+from src.lib.settings import create_sql, load_config, setup_cli_logging
+
+log = logging.getLogger()
+
+
+async def main(args: argparse.Namespace) -> int:
+    config = load_config()
+    setup_cli_logging(config)
+    sql_conn = create_sql(config)
+
+    await sql_conn.connect()
+    reanalysis = Reanalysis(
+        sql_conn,
+        config['stockfish']['path'],
+        workers=args.workers,
+        depth=args.depth,
+        hash_size=args.hash,
+        blunder_threshold=args.blunder_threshold,
+    )
+
+    try:
+        result = await reanalysis.run(user_moves_only=not args.all_moves)
+    finally:
+        await sql_conn.close()
+
+    print(
+        f"Analysed {result['analysed']} moves ({result['skipped']} already analysed, {result['failed']} failed) "
+        f"in {result['seconds']} s, {result['positions_per_second']} positions/s"
+    )
+    return 1 if result['failed'] else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score the stored moves of finished games with full strength engines.")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="engine processes, defaults to the number of CPUs")
+    parser.add_argument('--depth', type=int, default=16, help="search depth of each analysed position")
+    parser.add_argument('--hash', type=int, default=64, help="hash of each engine in MB")
+    parser.add_argument('--blunder-threshold', type=int, default=300, help="centipawn loss from which a move is a blunder")
+    parser.add_argument('--all-moves', action='store_true', help="also analyse the engine moves")
+    args = parser.parse_args()
+
+    raise SystemExit(asyncio.run(main(args)))
@@ -2,15 +2,30 @@ import logging
 import uvicorn
 import asyncio
 
-from src import app
 from src.lib.constants import Color
+from src.lib.settings import load_config, setup_cli_logging
 
 log = logging.getLogger()
 
 def main(**kwargs):
     log.debug(kwargs)
-    log.info(f"Start new game at: {Color.BOLD}{Color.GREEN}http://0.0.0.0:8000/start/example/1285?redirect_url=https://www.startpage.com/{Color.END*2}")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    config = load_config()
+    host = config.get('server', 'host', fallback='0.0.0.0')
+    port = config.getint('server', 'port', fallback=8000)
+    workers = config.getint('server', 'workers', fallback=1)
+    start_url = f"Start new game at: {Color.BOLD}{Color.GREEN}http://{host}:{port}/start/example/1285?redirect_url=https://www.startpage.com/{Color.END*2}"
+
+    if workers > 1:
+        # the parent only supervises, every worker imports the app itself and opens its own database and engine pools
+        setup_cli_logging(config)
+        log.info(start_url)
+        log.info(f"Start {workers} workers")
+        uvicorn.run("src:app", host=host, port=port, workers=workers)
+    else:
+        from src import app
+
+        log.info(start_url)
+        uvicorn.run(app, host=host, port=port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,303 @@
+import json
+import logging
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple, Union
+
+import numpy as np
+
+from src.lib.bulk_export import stream_games
+from src.lib.sql import SQL
+
+log = logging.getLogger(__name__)
+
+# game columns of the game data files, one value per game
+GAME_FIELDS = ('user_id', 'game_number', 'user_elo', 'ki_elo', 'end_reasons', 'winning_color')
+# end reasons (chess.Termination names) which are a draw
+DRAW_REASONS = (
+    'STALEMATE', 'INSUFFICIENT_MATERIAL', 'SEVENTYFIVE_MOVES', 'FIVEFOLD_REPETITION',
+    'FIFTY_MOVES', 'THREEFOLD_REPETITION',
+)
+PERCENTILES = (50, 90, 95, 99)
+
+
+def _parse_game(rows: List[Dict]) -> Union[Dict, None]:
+    """Convert the rows of one game (file content or exported rows) into NumPy arrays."""
+    if not rows:
+        return None
+
+    last = rows[-1]
+    game = {field: last.get(field) for field in GAME_FIELDS}
+    game['start'] = np.datetime64(rows[0]['start'], 'us')
+    game['t_stamp'] = np.array([row['t_stamp'] for row in rows], dtype='datetime64[us]')
+    # values written by calc_game_data, kept to check the vectorized results
+    game['stored_draw_time'] = np.array([row.get('draw_time', np.nan) for row in rows], dtype=np.float64)
+    game['stored_overdrawn'] = np.array([bool(row.get('overdrawn')) for row in rows], dtype=bool)
+    game['stored_avg_move_duration'] = last.get('avg_move_duration', np.nan)
+
+    return game
+
+
+def _load_file(path: str) -> Union[Dict, None]:
+    with open(path, encoding='utf-8') as file:
+        return _parse_game(json.load(file))
+
+
+def _round_us(us: np.ndarray, digits: int = 3) -> np.ndarray:
+    """Round microseconds to seconds with `digits` decimals exactly like `round(td.total_seconds(), digits)`."""
+    unit = 10 ** (6 - digits)
+    quotient, remainder = np.divmod(us, unit)
+    rounded = (quotient + (2 * remainder > unit)) / 10 ** digits
+
+    # an exact half is decided by the binary value of the float, as Python does
+    ties = 2 * remainder == unit
+    if ties.any():
+        rounded[ties] = [round(value, digits) for value in (us[ties] / 1e6).tolist()]
+
+    return rounded
+
+
+def _divide_and_round(dividend: np.ndarray, divisor: np.ndarray) -> np.ndarray:
+    """Integer division with round half to even, as `timedelta / int` does."""
+    quotient, remainder = np.divmod(dividend, divisor)
+    twice = 2 * remainder
+    return quotient + ((twice > divisor) | ((twice == divisor) & (quotient % 2 == 1)))
+
+
+class GameTable:
+    """Finished games as columnar NumPy arrays.
+
+    Game columns (`user_id`, `user_elo`, ...) hold one value per game. Move
+    columns hold one value per move of all games, `game_index` maps each move
+    to its game and `offsets` marks where the moves of a game begin. The
+    derived fields of `calc_game_data` are computed for all games at once.
+    """
+
+    def __init__(self, games: List[Dict], max_user_draw_time: float = 30.0) -> None:
+        """
+        Args:
+            games (List[Dict]): Games parsed by `_parse_game`.
+            max_user_draw_time (float): Seconds after which a move counts as overdrawn. Defaults to 30.
+        """
+        self.max_user_draw_time = max_user_draw_time
+
+        self.user_id = np.array([game['user_id'] for game in games], dtype=object)
+        self.end_reasons = np.array([game['end_reasons'] or '' for game in games], dtype=object)
+        self.winning_color = np.array([game['winning_color'] or '' for game in games], dtype=object)
+        self.game_number = np.array([game['game_number'] or 0 for game in games], dtype=np.int64)
+        self.user_elo = np.array([game['user_elo'] for game in games], dtype=np.int64)
+        self.ki_elo = np.array([game['ki_elo'] for game in games], dtype=np.int64)
+        self.start = np.array([game['start'] for game in games], dtype='datetime64[us]')
+
+        self.move_count = np.array([len(game['t_stamp']) for game in games], dtype=np.int64)
+        # empty without games, so an empty data dir or filter gives an empty table
+        self.offsets = np.cumsum(self.move_count) - self.move_count
+        self.game_index = np.repeat(np.arange(len(games)), self.move_count)
+
+        def concat(key, dtype):
+            return np.concatenate([game[key] for game in games]) if games else np.array([], dtype=dtype)
+
+        self.t_stamp = concat('t_stamp', 'datetime64[us]')
+        self.stored_draw_time = concat('stored_draw_time', np.float64)
+        self.stored_overdrawn = concat('stored_overdrawn', bool)
+        self.stored_avg_move_duration = np.array([game['stored_avg_move_duration'] for game in games], dtype=np.float64)
+
+        self._calc_derived()
+
+    def __len__(self) -> int:
+        return len(self.user_id)
+
+    def _calc_derived(self) -> None:
+        # the first move of a game is timed from the game start
+        previous = np.empty_like(self.t_stamp)
+        previous[1:] = self.t_stamp[:-1]
+        previous[self.offsets] = self.start
+
+        draw_us = (self.t_stamp - previous).astype(np.int64)
+        limit_us = timedelta(seconds=self.max_user_draw_time) // timedelta(microseconds=1)
+
+        self.draw_time = _round_us(draw_us)
+        self.overdrawn = draw_us > limit_us
+        self.move_number = np.arange(len(self.t_stamp)) - np.repeat(self.offsets, self.move_count) + 1
+
+        total_us = np.add.reduceat(draw_us, self.offsets) if len(draw_us) else np.array([], dtype=np.int64)
+        self.avg_move_duration = _round_us(_divide_and_round(total_us, self.move_count))
+
+    def mismatches(self) -> Dict[str, int]:
+        """Compare the derived fields with the values stored by `calc_game_data`.
+
+        Returns:
+            Dict[str, int]: Number of differing moves or games per field.
+        """
+        return {
+            'draw_time': int(np.sum(self.draw_time != self.stored_draw_time)),
+            'overdrawn': int(np.sum(self.overdrawn != self.stored_overdrawn)),
+            'avg_move_duration': int(np.sum(self.avg_move_duration != self.stored_avg_move_duration)),
+        }
+
+    def outcome(self) -> np.ndarray:
+        """Result of each game from the view of the user (white).
+
+        Returns:
+            np.ndarray: 'win', 'loss', 'draw' or 'other' (timeouts and aborted games) per game.
+        """
+        # black wins are stored without winning color, see Stockfish._save_end_reason
+        return np.select(
+            [
+                self.winning_color == 'white',
+                self.end_reasons == 'CHECKMATE',
+                np.isin(self.end_reasons, DRAW_REASONS),
+            ],
+            ['win', 'loss', 'draw'],
+            default='other',
+        )
+
+    def elo_gap(self, bucket: int = 100) -> np.ndarray:
+        """Engine Elo minus user Elo of each game, rounded down to `bucket`."""
+        return (self.ki_elo - self.user_elo) // bucket * bucket
+
+    def elo_bucket(self, bucket: int = 100) -> np.ndarray:
+        """User Elo of each game, rounded down to `bucket`."""
+        return self.user_elo // bucket * bucket
+
+    def _groups(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return np.unique(keys.astype(str) if keys.dtype == object else keys, return_inverse=True)
+
+    def draw_time_stats(self, keys: np.ndarray) -> Dict:
+        """Draw time distribution and overdrawn rate per group.
+
+        Args:
+            keys (np.ndarray): Group of each game, e.g. `user_id` or `elo_bucket()`.
+
+        Returns:
+            Dict: Group mapped to moves, mean, percentiles of the draw time and overdrawn rate.
+        """
+        groups, inverse = self._groups(keys)
+        move_groups = inverse[self.game_index]
+        order = np.argsort(move_groups, kind='stable')
+        bounds = np.searchsorted(move_groups[order], np.arange(len(groups) + 1))
+
+        stats = {}
+        for i, group in enumerate(groups.tolist()):
+            moves = order[bounds[i]:bounds[i + 1]]
+            draw_times = self.draw_time[moves]
+            stats[group] = {
+                'moves': len(moves),
+                'mean': float(draw_times.mean()) if len(moves) else None,
+                **{
+                    f'p{p}': float(value)
+                    for p, value in zip(PERCENTILES, np.percentile(draw_times, PERCENTILES) if len(moves) else [np.nan] * len(PERCENTILES))
+                },
+                'overdrawn_rate': float(self.overdrawn[moves].mean()) if len(moves) else None,
+            }
+
+        return stats
+
+    def game_stats(self, keys: np.ndarray) -> Dict:
+        """Game length and outcomes per group.
+
+        Args:
+            keys (np.ndarray): Group of each game, e.g. `elo_gap()`.
+
+        Returns:
+            Dict: Group mapped to games, mean and median moves per game and the rate of each outcome.
+        """
+        groups, inverse = self._groups(keys)
+        games = np.bincount(inverse, minlength=len(groups))
+        moves = np.bincount(inverse, weights=self.move_count, minlength=len(groups))
+        outcome = self.outcome()
+
+        stats = {}
+        for i, group in enumerate(groups.tolist()):
+            members = inverse == i
+            stats[group] = {
+                'games': int(games[i]),
+                'mean_moves': float(moves[i] / games[i]),
+                'median_moves': float(np.median(self.move_count[members])),
+                **{f'{result}_rate': float(np.mean(outcome[members] == result)) for result in ('win', 'loss', 'draw', 'other')},
+            }
+
+        return stats
+
+    def per_user(self) -> Dict:
+        """Draw time and game statistics of each user."""
+        draw_times = self.draw_time_stats(self.user_id)
+        return {user: {**draw_times[user], **games} for user, games in self.game_stats(self.user_id).items()}
+
+    def per_cohort(self, cohort: Union[Callable[['GameTable'], np.ndarray], None] = None) -> Dict:
+        """Draw time and game statistics of each cohort.
+
+        Args:
+            cohort (Union[Callable[[GameTable], np.ndarray], None]): Cohort key of each game. Defaults to `elo_bucket()`.
+        """
+        keys = cohort(self) if cohort else self.elo_bucket()
+        draw_times = self.draw_time_stats(keys)
+        return {group: {**draw_times[group], **games} for group, games in self.game_stats(keys).items()}
+
+
+def load_files(
+        data_dir: Path, workers: Union[int, None] = None, cache_file: Union[Path, None] = None,
+        max_user_draw_time: float = 30.0,
+        ) -> GameTable:
+    """Load the game data files below `data_dir` in parallel.
+
+    Parsed files are cached in `cache_file` and only parsed again if their
+    size or modification time changed.
+
+    Args:
+        data_dir (Path): Game data directory (`game_data/<user_id>/*.json`).
+        workers (Union[int, None]): Worker processes. Defaults to the number of CPUs.
+        cache_file (Union[Path, None]): Cache of the parsed files. Defaults to None (no cache).
+        max_user_draw_time (float): Seconds after which a move counts as overdrawn. Defaults to 30.
+
+    Returns:
+        GameTable: All games.
+    """
+    cache: Dict[str, Tuple[int, int, Union[Dict, None]]] = {}
+    if cache_file and cache_file.exists():
+        try:
+            cache = pickle.loads(cache_file.read_bytes())
+        except Exception:
+            log.exception(f"Could not load analytics cache {cache_file}")
+
+    files = {str(path): path.stat() for path in sorted(data_dir.glob('*/*.json'))}
+    stale = [path for path, stat in files.items() if cache.get(path, (None, None))[:2] != (stat.st_mtime_ns, stat.st_size)]
+
+    if stale:
+        with ProcessPoolExecutor(workers) as executor:
+            for path, game in zip(stale, executor.map(_load_file, stale, chunksize=64)):
+                cache[path] = (files[path].st_mtime_ns, files[path].st_size, game)
+
+    log.info(f"Loaded {len(files)} game data files, {len(stale)} parsed, {len(files) - len(stale)} from cache")
+
+    cache = {path: cache[path] for path in files}
+    if cache_file and stale:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        cache_file.write_bytes(pickle.dumps(cache, protocol=pickle.HIGHEST_PROTOCOL))
+
+    return GameTable([game for _, _, game in cache.values() if game is not None], max_user_draw_time)
+
+
+async def load_database(sql_conn: SQL, max_user_draw_time: float = 30.0, **filters) -> GameTable:
+    """Load finished games from the database.
+
+    Args:
+        sql_conn (SQL): Database connection pool.
+        max_user_draw_time (float): Seconds after which a move counts as overdrawn. Defaults to 30.
+        **filters: Filters of `src.lib.bulk_export.stream_games`.
+
+    Returns:
+        GameTable: All matching games.
+    """
+    games = []
+    async for rows in stream_games(sql_conn, max_user_draw_time=max_user_draw_time, **filters):
+        games.append(_parse_game(rows))
+
+    return GameTable(games, max_user_draw_time)
+
+
+def load_games(rows: Iterable[List[Dict]], max_user_draw_time: float = 30.0) -> GameTable:
+    """Build a table from games already in memory, e.g. the return values of `calc_game_data`."""
+    return GameTable([game for game in map(_parse_game, rows) if game is not None], max_user_draw_time)
@@ -1,53 +1,175 @@
+import atexit
+import copy
+import json
 import logging
+import queue
+from datetime import datetime
 from pathlib import Path
-from typing import Union
-from logging.handlers import TimedRotatingFileHandler
+from typing import Dict, Union
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+from src.lib.request_timing import SLOW_REQUEST_LOGGER
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'file': record.filename,
+            'line': record.lineno,
+            'function': record.funcName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # formatted by `TracebackQueueHandler` before the record was queued
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TracebackQueueHandler(QueueHandler):
+    """Queue records with the traceback kept apart from the message.
+
+    `QueueHandler.prepare()` appends the traceback to the message, so the
+    formatters of the listener could not put it into a field of its own.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # the arguments and the traceback may not be picklable or may change until the listener writes the record
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
 
 
 class AstlLogger:
-    def __init__(self, log_dir: Path, loglevel: int, log_to_stdout: bool = False, log_backup_count: Union[int, None] = 7):
+    def __init__(
+            self, log_dir: Path, loglevel: int, log_to_stdout: bool = False, log_backup_count: Union[int, None] = 7,
+            json_lines: bool = False, levels: Union[Dict[str, int], None] = None, file_suffix: str = '',
+            ):
+        """Log to rotating files and optionally stdout without blocking the caller.
+
+        Loggers only put records into a queue. A background thread of a
+        `QueueListener` formats them and writes the files.
+
+        Args:
+            log_dir (Path): Directory which gets the `log` directory.
+            loglevel (int): Level of the root logger.
+            log_to_stdout (bool): Also log to stdout. Defaults to False.
+            log_backup_count (Union[int, None]): Days of rotated files to keep. Defaults to 7.
+            json_lines (bool): Write one JSON object per record instead of text lines. Defaults to False.
+            levels (Union[Dict[str, int], None]): Levels of single loggers, e.g. `{'src.lib.sql': logging.DEBUG}`. Defaults to None.
+            file_suffix (str): Appended to the file names, e.g. the pid of a worker. Defaults to ''.
+        """
         self.log_dir = log_dir / 'log'
         self.log_level = loglevel
-        self.log_name = str(log_dir.absolute().name).replace(' ', '_')
+        self.log_name = str(log_dir.absolute().name).replace(' ', '_') + file_suffix
         self.log_to_stdout = log_to_stdout
         self.log_backup_count = log_backup_count
-        
+        self.json_lines = json_lines
+        self.levels = levels or {}
+        self.listener: Union[QueueListener, None] = None
+
         self.__setup_logger()
 
+    @staticmethod
+    def parse_levels(value: str) -> Dict[str, int]:
+        """Parse per logger levels of the settings.
+
+        Args:
+            value (str): Comma separated `logger:level` pairs, e.g. `src.lib.sql:DEBUG, chess.engine:30`.
+
+        Returns:
+            Dict[str, int]: Logger name mapped to level.
+        """
+        levels = {}
+        for pair in filter(None, (pair.strip() for pair in value.split(','))):
+            name, _, level = pair.rpartition(':')
+            levels[name.strip()] = int(level) if level.strip().isdigit() else logging.getLevelName(level.strip().upper())
+        return levels
+
     def __setup_logger(self):
         print(f"self.log_backup_count: {self.log_backup_count}")
         logger = logging.getLogger()
         logger.setLevel(self.log_level)
-        log_formatter = logging.Formatter("%(asctime)s [%(levelname)-5.5s] [%(filename)s:%(lineno)s] [%(funcName)s()] %(message)s")
-        
+        for name, level in self.levels.items():
+            logging.getLogger(name).setLevel(level)
+
+        if self.json_lines:
+            log_formatter = JsonFormatter()
+        else:
+            log_formatter = logging.Formatter("%(asctime)s [%(levelname)-5.5s] [%(filename)s:%(lineno)s] [%(funcName)s()] %(message)s")
+
         # create log dir if not exist
         if not self.log_dir.exists():
             self.log_dir.mkdir(parents=True)
 
+        # the levels are set on the loggers, so a logger set to DEBUG is not cut off by its handler
+        handlers = []
+        slow_requests_only = logging.Filter(SLOW_REQUEST_LOGGER)
+        no_slow_requests = lambda record: not slow_requests_only.filter(record)
+
         # add handler to log into stdout
         if self.log_to_stdout:
             print(f"Log to stdout is active.")
             stream_handler = logging.StreamHandler()
             stream_handler.setFormatter(log_formatter)
-            stream_handler.setLevel(self.log_level)
-            logger.addHandler(stream_handler)
+            stream_handler.addFilter(no_slow_requests)
+            handlers.append(stream_handler)
 
         print(self.log_dir / f"{self.log_name}.log")
         # add default log with file rotation
         file_handler = TimedRotatingFileHandler(
             filename=self.log_dir / f"{self.log_name}.log", when='midnight', backupCount=self.log_backup_count)
         file_handler.setFormatter(log_formatter)
-        file_handler.setLevel(self.log_level)
-        logger.addHandler(file_handler)
-                
+        file_handler.addFilter(no_slow_requests)
+        handlers.append(file_handler)
+
         # add error log
         error_file_handler = TimedRotatingFileHandler(
             filename=self.log_dir / f'{self.log_name}_error.log', when='midnight', backupCount=self.log_backup_count)
         error_file_handler.setFormatter(log_formatter)
         error_file_handler.setLevel(logging.ERROR)
-        logger.addHandler(error_file_handler)
-        
-            
+        error_file_handler.addFilter(no_slow_requests)
+        handlers.append(error_file_handler)
+
+        # add slow request log, the messages are JSON objects
+        slow_request_file_handler = TimedRotatingFileHandler(
+            filename=self.log_dir / f'{self.log_name}_slow_requests.log', when='midnight', backupCount=self.log_backup_count)
+        slow_request_file_handler.setFormatter(logging.Formatter("%(message)s"))
+        slow_request_file_handler.addFilter(slow_requests_only)
+        handlers.append(slow_request_file_handler)
+
+        # the caller only formats the message and enqueues the record, the listener thread writes it
+        log_queue = queue.SimpleQueue()
+        queue_handler = TracebackQueueHandler(log_queue)
+        logger.addHandler(queue_handler)
+
+        slow_request_logger = logging.getLogger(SLOW_REQUEST_LOGGER)
+        slow_request_logger.setLevel(logging.WARNING)
+        slow_request_logger.propagate = False
+        slow_request_logger.addHandler(queue_handler)
+
+        self.listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        # write the queued records before the interpreter exits
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write the queued records and stop the listener thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+
 if __name__ == "__main__":
     AstlLogger(Path(), logging.INFO, True)
     log = logging.getLogger()
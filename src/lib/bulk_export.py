@@ -0,0 +1,183 @@
+import csv
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Union
+
+from src.lib.game_export import GAME_COLUMNS, calc_game_data, game_rows
+from src.lib.helper import json_serial
+from src.lib.sql import SQL
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+log = logging.getLogger(__name__)
+
+# columns of an exported row, the game data file columns with the game ID in front
+EXPORT_COLUMNS = (
+    'game_id', *GAME_COLUMNS,
+    'source', 'target', 'new_fen', 'old_fen', 'piece', 't_stamp', 'castling', 'color',
+    'overdrawn', 'draw_time', 'move_number', 'user_move_count', 'avg_move_duration',
+)
+FORMATS = ('jsonl', 'csv', 'parquet')
+
+
+async def stream_games(
+        sql_conn: SQL, user_id: Union[str, None] = None, start_from: Union[datetime, None] = None,
+        start_to: Union[datetime, None] = None, game_number: Union[int, None] = None,
+        shard: int = 0, shards: int = 1, max_user_draw_time: float = 30.0, batch_size: int = 1000,
+        ) -> AsyncIterator[List[Dict]]:
+    """Stream finished games with the derived fields of the game data files.
+
+    Games and moves are read with one unbuffered query ordered by game and ply,
+    so only the game which is currently assembled is held in memory.
+
+    Args:
+        sql_conn (SQL): Database connection pool.
+        user_id (Union[str, None]): Only games of this user. Defaults to None.
+        start_from (Union[datetime, None]): Only games started at or after. Defaults to None.
+        start_to (Union[datetime, None]): Only games started before. Defaults to None.
+        game_number (Union[int, None]): Only games with this number. Defaults to None.
+        shard (int): Shard of the games to export, games are split by `id % shards`. Defaults to 0.
+        shards (int): Number of shards. Defaults to 1.
+        max_user_draw_time (float): Seconds after which a move counts as overdrawn. Defaults to 30.
+        batch_size (int): Rows fetched per round trip. Defaults to 1000.
+
+    Yields:
+        List[Dict]: Rows of one game, see `EXPORT_COLUMNS`.
+    """
+    filters = ["games.end_reasons IS NOT NULL", "MOD(games.id, %(shards)s) = %(shard)s"]
+    args = {'shard': shard, 'shards': shards}
+    for column, condition, value in (
+            ('user_id', "games.user_id = %(user_id)s", user_id),
+            ('start_from', "games.start >= %(start_from)s", start_from),
+            ('start_to', "games.start < %(start_to)s", start_to),
+            ('game_number', "games.game_number = %(game_number)s", game_number),
+            ):
+        if value is not None:
+            filters.append(condition)
+            args[column] = value
+
+    query = f"""
+        SELECT
+            games.id AS game_id,
+            start, stop,
+            user_elo, ki_elo,
+            game_number,
+            user_id, end_reasons,
+            winning_color,
+            move_code, fen_checkpoint,
+            t_stamp
+        FROM
+            games
+        INNER JOIN
+            moves
+        ON
+            moves.game_id = games.id
+        WHERE
+            {' AND '.join(filters)}
+        ORDER BY
+            games.id ASC, moves.ply ASC
+    """
+
+    game: List[Dict] = []
+    async for row in sql_conn.stream(query, args, batch_size):
+        if game and game[0]['game_id'] != row['game_id']:
+            yield _export_rows(game, max_user_draw_time)
+            game = []
+        game.append(row)
+
+    if game:
+        yield _export_rows(game, max_user_draw_time)
+
+
+def _export_rows(res: List[Dict], max_user_draw_time: float) -> List[Dict]:
+    game_data = calc_game_data(game_rows(res), max_user_draw_time)
+    return [{column: row.get(column) for column in EXPORT_COLUMNS} | {'game_id': res[0]['game_id']} for row in game_data]
+
+
+class ExportWriter:
+    """Write exported rows as JSON lines, CSV or Parquet.
+
+    Parquet needs the optional `pyarrow` package. Rows are written in row
+    groups of `batch_size` rows.
+    """
+
+    def __init__(self, path: Path, file_format: str = 'jsonl', batch_size: int = 10000) -> None:
+        """
+        Args:
+            path (Path): Output file.
+            file_format (str): One of `FORMATS`. Defaults to 'jsonl'.
+            batch_size (int): Rows per Parquet row group. Defaults to 10000.
+
+        Raises:
+            ValueError: Raised for an unknown format.
+            ImportError: Raised for Parquet without pyarrow.
+        """
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown export format '{file_format}', use one of {FORMATS}")
+        if file_format == 'parquet' and pyarrow is None:
+            raise ImportError("Parquet export needs pyarrow, install it or use jsonl or csv")
+
+        self.path = path
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.rows = 0
+
+        self._batch: List[Dict] = []
+        self._file = None
+        self._csv = None
+        self._parquet = None
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if file_format == 'parquet':
+            self._parquet = pyarrow.parquet.ParquetWriter(path, self._parquet_schema())
+        else:
+            self._file = open(path, 'w', newline='', encoding='utf-8')
+            if file_format == 'csv':
+                self._csv = csv.DictWriter(self._file, fieldnames=EXPORT_COLUMNS)
+                self._csv.writeheader()
+
+    @staticmethod
+    def _parquet_schema():
+        types = {
+            'game_id': pyarrow.int64(), 'user_elo': pyarrow.int32(), 'ki_elo': pyarrow.int32(),
+            'game_number': pyarrow.int32(), 'start': pyarrow.timestamp('ms'), 'stop': pyarrow.timestamp('ms'),
+            't_stamp': pyarrow.timestamp('ms'), 'overdrawn': pyarrow.bool_(), 'draw_time': pyarrow.float64(),
+            'move_number': pyarrow.int32(), 'user_move_count': pyarrow.int32(), 'avg_move_duration': pyarrow.float64(),
+        }
+        return pyarrow.schema([(column, types.get(column, pyarrow.string())) for column in EXPORT_COLUMNS])
+
+    def write(self, rows: List[Dict]) -> None:
+        """Write the rows of one game.
+
+        Args:
+            rows (List[Dict]): Rows with the `EXPORT_COLUMNS`.
+        """
+        self.rows += len(rows)
+        if self._csv:
+            self._csv.writerows(rows)
+        elif self._parquet:
+            self._batch.extend(rows)
+            if len(self._batch) >= self.batch_size:
+                self._flush()
+        else:
+            for row in rows:
+                self._file.write(json.dumps(row, ensure_ascii=False, default=json_serial) + '\n')
+
+    def _flush(self) -> None:
+        if self._batch:
+            self._parquet.write_table(pyarrow.Table.from_pylist(self._batch, schema=self._parquet.schema))
+            self._batch = []
+
+    def close(self) -> None:
+        """Flush and close the output file."""
+        if self._parquet:
+            self._flush()
+            self._parquet.close()
+        else:
+            self._file.close()
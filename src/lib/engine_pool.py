@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Set, Tuple, Union
+
+import chess.engine
+
+from src.lib.metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+SPAWN_SECONDS = REGISTRY.histogram('uhh_chess_engine_spawn_seconds', "Time to start and configure an engine process.")
+
+
+class EnginePool:
+    """Pool of pre-started Stockfish processes.
+
+    Games check out an engine for their request and hand it back afterwards
+    instead of spawning (and killing) a process every time. Engines are driven
+    through python-chess' asyncio `UciProtocol`, so searches never block the
+    event loop. `ucinewgame` is sent by python-chess whenever the `game` key
+    passed to `play()` differs from the last search of that process, so a
+    reused engine never carries search state from another game.
+    """
+
+    def __init__(
+            self, path: str, min_size: int = 1, max_size: int = 4, idle_timeout: float = 300.0,
+            acquire_timeout: float = 30.0, engine_options: Union[Dict, None] = None,
+            spawn_guard: Union[Callable[[], Awaitable[None]], None] = None,
+            ) -> None:
+        """Create a new pool. Processes are only started by `start()` or on demand.
+
+        Args:
+            path (str): Path to the Stockfish binary.
+            min_size (int): Processes kept alive even when idle. Defaults to 1.
+            max_size (int): Upper bound of running processes. Defaults to 4.
+            idle_timeout (float): Seconds after which an idle process above `min_size` is closed. Defaults to 300.
+            acquire_timeout (float): Seconds to wait for a free process. Defaults to 30.
+            engine_options (Union[Dict, None]): UCI options shared by all games (e.g. Threads, Hash). Defaults to None.
+            spawn_guard (Union[Callable, None]): Coroutine called before a new process is started. May raise to refuse it.
+        """
+        if min_size > max_size:
+            raise ValueError(f"min_size ({min_size}) must not be larger than max_size ({max_size})")
+
+        self.path = path
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.engine_options = engine_options or {}
+        self.spawn_guard = spawn_guard
+
+        self._idle: Deque[Tuple[chess.engine.UciProtocol, float]] = deque()
+        self._in_use: Set[chess.engine.UciProtocol] = set()
+        self._slots = asyncio.Semaphore(max_size)
+        self._eviction_task: Union[asyncio.Task, None] = None
+
+        self.spawned = 0
+        self.evicted = 0
+        self.discarded = 0
+        self.checkouts = 0
+        self.reused = 0
+
+    @property
+    def size(self) -> int:
+        """Number of running processes (idle and checked out)."""
+        return len(self._idle) + len(self._in_use)
+
+    async def start(self) -> None:
+        """Pre-start `min_size` processes and run the idle eviction loop."""
+        while self.size < self.min_size:
+            self._idle.append((await self._spawn(), time.monotonic()))
+
+        if self._eviction_task is None:
+            self._eviction_task = asyncio.create_task(self._eviction_loop())
+
+        log.info(f"Engine pool started: {self.stats()}")
+
+    async def stop(self) -> None:
+        """Stop the eviction loop and close all processes."""
+        if self._eviction_task:
+            self._eviction_task.cancel()
+            self._eviction_task = None
+
+        while self._idle:
+            engine, _ = self._idle.pop()
+            await self._close(engine)
+
+        for engine in list(self._in_use):
+            self._in_use.discard(engine)
+            await self._close(engine)
+
+    async def acquire(self, options: Union[Dict, None] = None) -> chess.engine.UciProtocol:
+        """Check out an engine and apply the per-game UCI options.
+
+        Args:
+            options (Union[Dict, None]): Per-game UCI options (e.g. UCI_Elo, Slow Mover). Defaults to None.
+
+        Raises:
+            TimeoutError: Raised if no engine becomes available within `acquire_timeout`.
+
+        Returns:
+            chess.engine.UciProtocol: Checked out engine. Must be returned with `release()`.
+        """
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No Stockfish engine available after {self.acquire_timeout}s. {self.stats()}")
+
+        engine = None
+        try:
+            engine = self._pop_idle()
+            if engine is None:
+                engine = await self._spawn()
+            else:
+                self.reused += 1
+
+            if options:
+                await engine.configure(options)
+        except BaseException:
+            try:
+                # e.g. the process died or rejected an option, do not leave it running outside the pool
+                if engine is not None:
+                    self.discarded += 1
+                    await self._close(engine)
+            finally:
+                self._slots.release()
+            raise
+
+        self._in_use.add(engine)
+        self.checkouts += 1
+        return engine
+
+    async def release(self, engine: chess.engine.UciProtocol) -> None:
+        """Return a checked out engine. Terminated processes are dropped.
+
+        Args:
+            engine (chess.engine.UciProtocol): Engine returned by `acquire()`.
+        """
+        if engine not in self._in_use:
+            return
+
+        self._in_use.discard(engine)
+        try:
+            if self._is_alive(engine):
+                self._idle.append((engine, time.monotonic()))
+            else:
+                log.warning("Discard terminated Stockfish process")
+                self.discarded += 1
+                await self._close(engine)
+        finally:
+            self._slots.release()
+
+    def pids(self) -> List[int]:
+        """Get the process IDs of all running engines.
+
+        Returns:
+            List[int]: Process IDs.
+        """
+        engines = [engine for engine, _ in self._idle] + list(self._in_use)
+        return [engine.transport.get_pid() for engine in engines if engine.transport]
+
+    def stats(self) -> Dict[str, int]:
+        """Get the current pool state.
+
+        Returns:
+            Dict[str, int]: Pool limits, process counts and lifetime counters.
+        """
+        return {
+            'min_size': self.min_size,
+            'max_size': self.max_size,
+            'size': self.size,
+            'idle': len(self._idle),
+            'in_use': len(self._in_use),
+            'spawned': self.spawned,
+            'evicted': self.evicted,
+            'discarded': self.discarded,
+            'checkouts': self.checkouts,
+            'reused': self.reused,
+        }
+
+    def _pop_idle(self) -> Union[chess.engine.UciProtocol, None]:
+        """Pop the most recently used living engine (warmest hash first)."""
+        while self._idle:
+            engine, _ = self._idle.pop()
+            if self._is_alive(engine):
+                return engine
+
+            self.discarded += 1
+            asyncio.create_task(self._close(engine))
+
+        return None
+
+    async def _spawn(self) -> chess.engine.UciProtocol:
+        if self.spawn_guard:
+            await self.spawn_guard()
+
+        with SPAWN_SECONDS.time():
+            _, engine = await chess.engine.popen_uci(self.path)
+            if self.engine_options:
+                try:
+                    await engine.configure(self.engine_options)
+                except BaseException:
+                    await self._close(engine)
+                    raise
+
+        self.spawned += 1
+        log.debug("Spawned Stockfish process. %s", self.stats())
+        return engine
+
+    async def _close(self, engine: chess.engine.UciProtocol) -> None:
+        try:
+            await asyncio.wait_for(engine.quit(), 10.0)
+        except Exception:
+            log.exception("Failed to quit Stockfish process")
+            # kills the process if it did not exit on its own
+            if engine.transport:
+                engine.transport.close()
+
+    @staticmethod
+    def _is_alive(engine: chess.engine.UciProtocol) -> bool:
+        return not engine.returncode.done()
+
+    async def evict_idle(self) -> int:
+        """Close processes idle for longer than `idle_timeout` while keeping `min_size` alive.
+
+        Returns:
+            int: Number of closed processes.
+        """
+        now = time.monotonic()
+        evicted = 0
+        # oldest entries are on the left side
+        while self._idle and self.size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            engine, _ = self._idle.popleft()
+            await self._close(engine)
+            evicted += 1
+
+        self.evicted += evicted
+        if evicted:
+            log.debug("Evicted %s idle Stockfish processes. %s", evicted, self.stats())
+
+        return evicted
+
+    async def _eviction_loop(self) -> None:
+        interval = max(1.0, min(self.idle_timeout / 2, 60.0))
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.evict_idle()
+            except Exception:
+                log.exception("Idle engine eviction failed")
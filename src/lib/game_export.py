@@ -0,0 +1,331 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Union
+
+from src.lib.helper import json_serial
+from src.lib.move_codec import decode_game
+from src.lib.sql import SQL, Session
+
+log = logging.getLogger(__name__)
+
+# game columns repeated in every row of the output
+GAME_COLUMNS = ('start', 'stop', 'user_elo', 'ki_elo', 'game_number', 'user_id', 'end_reasons', 'winning_color')
+
+# queries run for every finished game, checked for full scans by `migrate.py --explain`
+GAME_OUTPUT_DATA_QUERY = """
+    SELECT
+        start, stop,
+        user_elo, ki_elo,
+        game_number,
+        user_id, end_reasons,
+        winning_color,
+        move_code, fen_checkpoint,
+        t_stamp
+    FROM
+        games
+    INNER JOIN
+        moves
+    ON
+        moves.game_id = games.id
+    WHERE
+        games.id = %(game_id)s
+    ORDER BY
+        moves.ply ASC
+"""
+EXPORT_JOBS_QUERY = """
+    SELECT game_id, token, attempts FROM game_exports
+    WHERE attempts < %(max_attempts)s AND (claimed_until IS NULL OR claimed_until < %(now)s)
+    ORDER BY created
+    LIMIT 10
+"""
+CLAIM_EXPORT_QUERY = """
+    UPDATE game_exports SET
+        attempts = attempts + 1,
+        claimed_until = %(claimed_until)s
+    WHERE
+        game_id = %(game_id)s AND attempts = %(attempts)s
+        AND (claimed_until IS NULL OR claimed_until < %(now)s)
+"""
+EXPORT_FAILED_QUERY = """
+    UPDATE game_exports SET
+        claimed_until = %(claimed_until)s,
+        last_error = %(error)s
+    WHERE
+        game_id = %(game_id)s
+"""
+EXPORT_DONE_QUERY = "DELETE FROM game_exports WHERE game_id = %(game_id)s"
+
+
+async def load_game_output_data(db: Union[SQL, Session], game_id: int) -> List[Dict]:
+    """Load all required game data wich must be stored in the output file.
+
+    The move columns (source, target, FENs, piece, castling, color) are rebuilt from the move codes.
+
+    Args:
+        db (Union[SQL, Session]): Connection to read with.
+        game_id (int): Game ID.
+
+    Returns:
+        List[Dict]: One row per ply.
+    """
+    res = await db.query(GAME_OUTPUT_DATA_QUERY, {'game_id': game_id})
+    return game_rows(res)
+
+
+def game_rows(res: List[Dict]) -> List[Dict]:
+    """Rebuild the output rows of one game from its joined game and move rows.
+
+    Args:
+        res (List[Dict]): Game columns with move_code, fen_checkpoint and t_stamp of each ply, in ply order.
+
+    Returns:
+        List[Dict]: One row per ply.
+    """
+    decoded_moves = decode_game(
+        [row['move_code'] for row in res],
+        [row['fen_checkpoint'] for row in res],
+    )
+
+    return [
+        {
+            **{column: row[column] for column in GAME_COLUMNS},
+            'source': decoded['source'], 'target': decoded['target'],
+            'new_fen': decoded['new_fen'], 'old_fen': decoded['old_fen'],
+            'piece': decoded['piece'], 't_stamp': row['t_stamp'],
+            'castling': decoded['castling'], 'color': decoded['color'],
+        }
+        for row, decoded in zip(res, decoded_moves)
+    ]
+
+
+def calc_game_data(game_data: List[Dict], max_user_draw_time: float = 30.0) -> List[Dict]:
+    """Calculate data wich must be stored in the output file.
+
+    Calculated entries: draw_time, overdrawn, move_number, user_move_count, avg_move_duration
+
+    Args:
+        game_data (List[Dict]): Rows loaded by `load_game_output_data`, updated in place.
+        max_user_draw_time (float): Seconds after which a move counts as overdrawn. Defaults to 30.
+
+    Returns:
+        List[Dict]: Game data with the calculated entries.
+    """
+    user_draw_times = []
+
+    for i in range(0 ,len(game_data)):
+        # check if move tooks more than in max_user_draw_time allowed
+        game_data[i]['overdrawn'] = False
+        prev_draw_ts = game_data[i-1]['t_stamp'] if not i == 0 else game_data[0]['start']
+        cur_draw_ts = game_data[i]['t_stamp']
+        if prev_draw_ts + timedelta(seconds=max_user_draw_time) < cur_draw_ts:
+            game_data[i]['overdrawn'] = True
+
+        # get move duration
+        draw_time: timedelta = cur_draw_ts - prev_draw_ts
+
+        game_data[i]['draw_time'] = round(draw_time.total_seconds(), 3)
+        user_draw_times.append(
+            draw_time
+        )
+
+        game_data[i]['move_number'] = i + 1
+
+    user_move_count = len(user_draw_times)
+    game_data[-1]['user_move_count'] = user_move_count
+    game_data[-1]['avg_move_duration'] = round(
+        (sum(user_draw_times, timedelta()) / user_move_count).total_seconds(), 3
+    )
+
+    return game_data
+
+
+def get_output_path(output_dir: Path, user_id: str, game_number: int, token: str) -> Path:
+    """Get the filepath where to store the game output data.
+
+    Args:
+        output_dir (Path): Game data directory.
+        user_id (str): Current user ID
+        game_number (int): Number of the Game of current user
+        token (str): Token the game was played with.
+
+    Returns:
+        Path: Target filepath
+    """
+    output_dir = output_dir / f"{user_id}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    return output_dir / f"{user_id}_{game_number}_{token}.json"
+
+
+def write_json(file_path: Path, game_data: List[Dict]) -> None:
+    """Write the game data to a temporary file and move it in place, so readers never see a partial file."""
+    tmp_path = file_path.with_suffix('.json.tmp')
+    with open(tmp_path, 'w') as file:
+        json.dump(game_data, file, indent=4, ensure_ascii=False, default=json_serial)
+
+    tmp_path.replace(file_path)
+
+
+class GameExporter:
+    """Write the game data files of finished games in the background.
+
+    Finished games are queued in the `game_exports` table in the same
+    transaction which saves the game end, so no export is lost if the process
+    stops. The worker claims queued games for `claim_timeout` seconds, writes
+    the file and removes the job. Failed exports are retried with a growing
+    delay up to `max_attempts` times. Exports are at least once: a game can be
+    written again if the process stops between writing and removing the job.
+    """
+
+    def __init__(
+            self, sql_conn: SQL, output_dir: Path, max_user_draw_time: float = 30.0, poll_interval: float = 5.0,
+            max_attempts: int = 10, retry_delay: float = 30.0, claim_timeout: float = 300.0,
+            ) -> None:
+        """
+        Args:
+            sql_conn (SQL): Database connection pool.
+            output_dir (Path): Game data directory.
+            max_user_draw_time (float): Seconds after which a move counts as overdrawn. Defaults to 30.
+            poll_interval (float): Seconds between two scans of the queue without notification. Defaults to 5.
+            max_attempts (int): Attempts before an export is given up. Defaults to 10.
+            retry_delay (float): Seconds before the first retry, multiplied by the attempt. Defaults to 30.
+            claim_timeout (float): Seconds a claimed export is hidden from other workers. Defaults to 300.
+        """
+        self.sql_conn = sql_conn
+        self.output_dir = output_dir
+        self.max_user_draw_time = max_user_draw_time
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.claim_timeout = claim_timeout
+
+        self._wakeup = asyncio.Event()
+        self._task: Union[asyncio.Task, None] = None
+
+        self.exported = 0
+        self.failed = 0
+
+    @staticmethod
+    async def enqueue(db: Union[SQL, Session], game_id: int, token: str) -> None:
+        """Queue the export of a finished game. Call it in the transaction which saves the game end.
+
+        Args:
+            db (Union[SQL, Session]): Connection or transaction to write with.
+            game_id (int): Game ID.
+            token (str): Token the game was played with, part of the file name.
+        """
+        await db.query(
+            "INSERT IGNORE INTO game_exports (game_id, token) VALUES (%(game_id)s, %(token)s)",
+            {'game_id': game_id, 'token': token},
+        )
+
+    def notify(self) -> None:
+        """Wake the worker after a game was queued."""
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        """Start the worker. Exports left over from a previous run are picked up by the first scan."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the worker. Unfinished exports stay queued."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                while await self.export_next():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("Game export scan failed")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim(self) -> Union[Dict, None]:
+        # timestamps are computed here, date arithmetic differs between the SQL dialects
+        now = datetime.now()
+        jobs = await self.sql_conn.query(EXPORT_JOBS_QUERY, {'max_attempts': self.max_attempts, 'now': now})
+
+        for job in jobs:
+            # only one worker wins the claim of a job
+            res = await self.sql_conn.query(
+                CLAIM_EXPORT_QUERY,
+                {'claimed_until': now + timedelta(seconds=self.claim_timeout), 'now': now, **job},
+            )
+            if res.get('rowcount') == 1:
+                return job
+
+        return None
+
+    async def export_next(self) -> bool:
+        """Export the oldest queued game.
+
+        Returns:
+            bool: True if a job was processed, False if the queue is empty.
+        """
+        job = await self._claim()
+        if job is None:
+            return False
+
+        try:
+            await self.export(job['game_id'], job['token'])
+        except Exception as e:
+            self.failed += 1
+            attempt = job['attempts'] + 1
+            log.exception(f"Export of game {job['game_id']} failed (attempt {attempt}/{self.max_attempts})")
+            await self.sql_conn.query(
+                EXPORT_FAILED_QUERY,
+                {
+                    'claimed_until': datetime.now() + timedelta(seconds=self.retry_delay * attempt),
+                    'error': repr(e)[:1000], 'game_id': job['game_id'],
+                },
+            )
+            return True
+
+        await self.sql_conn.query(EXPORT_DONE_QUERY, {'game_id': job['game_id']})
+        self.exported += 1
+        return True
+
+    async def export(self, game_id: int, token: str) -> Path:
+        """Save the game data as JSON.
+
+        Args:
+            game_id (int): Game ID.
+            token (str): Token the game was played with.
+
+        Returns:
+            Path: Written file.
+        """
+        game_data = calc_game_data(await load_game_output_data(self.sql_conn, game_id), self.max_user_draw_time)
+        file_path = get_output_path(self.output_dir, game_data[-1]['user_id'], game_data[-1]['game_number'], token)
+
+        await asyncio.to_thread(write_json, file_path, game_data)
+        log.info("Saved game data to: %s", file_path)
+
+        return file_path
+
+    def stats(self) -> Dict[str, int]:
+        """Get the export counters.
+
+        Returns:
+            Dict[str, int]: Exported games and failed attempts since start.
+        """
+        return {
+            'exported': self.exported,
+            'failed': self.failed,
+        }
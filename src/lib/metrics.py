@@ -0,0 +1,150 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Union
+
+log = logging.getLogger(__name__)
+
+# seconds, from a cached SQL query up to a long engine search
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames: Sequence[str], labels: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return f"{{{','.join(pairs)}}}" if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+class Histogram:
+    """Prometheus histogram with optional labels.
+
+    An observation only increments one bucket counter; the cumulative bucket
+    values of the exposition format are summed up when the metrics are rendered.
+    """
+
+    def __init__(self, registry: 'Registry', name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values mapped to [bucket counts (last one is +Inf), sum]
+        self._series: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        """Record one value.
+
+        Args:
+            value (float): Observed value, usually seconds.
+            *labels: Label values in the order of `labelnames`.
+        """
+        if not self.registry.enabled:
+            return
+
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *labels) -> Iterator[None]:
+        """Observe the duration of the context in seconds, also if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """Prometheus gauge whose value is read from a callback when the metrics are rendered."""
+
+    def __init__(self, registry: 'Registry', name: str, documentation: str, func: Callable[[], float]) -> None:
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            lines.append(f"{self.name} {float(self.func())}")
+        except Exception:
+            log.exception(f"Could not read gauge {self.name}")
+        return lines
+
+
+class Registry:
+    """Metrics of this process in the Prometheus text format.
+
+    Metrics are created at import time and stay cheap when the registry is
+    disabled: an observation returns after one attribute check.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self._metrics: Dict[str, Union[Histogram, Gauge]] = {}
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get or create a histogram.
+
+        Args:
+            name (str): Metric name.
+            documentation (str): Help text.
+            labelnames (Sequence[str]): Label names. Defaults to no labels.
+            buckets (Sequence[float]): Upper bounds of the buckets. Defaults to `DEFAULT_BUCKETS`.
+
+        Returns:
+            Histogram: Registered histogram.
+        """
+        if name not in self._metrics:
+            self._metrics[name] = Histogram(self, name, documentation, labelnames, buckets)
+        return self._metrics[name]
+
+    def gauge(self, name: str, documentation: str, func: Callable[[], float]) -> Gauge:
+        """Create or replace a gauge.
+
+        Args:
+            name (str): Metric name.
+            documentation (str): Help text.
+            func (Callable[[], float]): Returns the current value.
+
+        Returns:
+            Gauge: Registered gauge.
+        """
+        self._metrics[name] = Gauge(self, name, documentation, func)
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """Render all metrics.
+
+        Returns:
+            str: Metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
@@ -0,0 +1,171 @@
+import logging
+import re
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+from src.lib.game_export import (
+    CLAIM_EXPORT_QUERY, EXPORT_DONE_QUERY, EXPORT_FAILED_QUERY, EXPORT_JOBS_QUERY, GAME_OUTPUT_DATA_QUERY,
+)
+from src.lib.sql import SQL, Session
+from src.lib.stockfish import MOVE_DURATION_QUERY, REDIRECT_DATA_QUERY
+from src.lib.stockfish_wrapper import GAME_INFO_QUERY, LOAD_BOARD_QUERY, VALIDATE_SESSION_QUERY
+
+log = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).parent.parent.parent.joinpath('queries', 'migrations')
+MIGRATION_LOCK = 'uhh_chess_schema_migrations'
+
+# queries of the request path and the export worker with example arguments, checked by `Migrations.explain()`
+HOT_QUERIES: Dict[str, Tuple[str, Dict]] = {
+    'game_info': (GAME_INFO_QUERY, {'token': ''}),
+    'load_board': (LOAD_BOARD_QUERY, {'game_id': 0}),
+    'validate_session': (VALIDATE_SESSION_QUERY, {'token': ''}),
+    'move_duration': (MOVE_DURATION_QUERY, {'game_id': 0}),
+    'redirect_data': (REDIRECT_DATA_QUERY, {'game_id': 0}),
+    'game_output_data': (GAME_OUTPUT_DATA_QUERY, {'game_id': 0}),
+    'export_jobs': (EXPORT_JOBS_QUERY, {'max_attempts': 0, 'now': datetime(2000, 1, 1)}),
+    'claim_export': (
+        CLAIM_EXPORT_QUERY,
+        {'claimed_until': datetime(2000, 1, 1), 'now': datetime(2000, 1, 1), 'game_id': 0, 'attempts': 0},
+    ),
+    'export_failed': (EXPORT_FAILED_QUERY, {'claimed_until': datetime(2000, 1, 1), 'error': '', 'game_id': 0}),
+    'export_done': (EXPORT_DONE_QUERY, {'game_id': 0}),
+}
+
+# EXPLAIN access types which read a whole table or index
+FULL_SCAN_TYPES = ('ALL', 'index')
+# start of the EXPLAIN QUERY PLAN detail of SQLite for a full table or index scan
+SQLITE_FULL_SCAN = 'SCAN'
+# scan of a subquery without a table, e.g. `(SELECT TRUE)`, reads no rows
+SQLITE_CONSTANT_ROW = 'SCAN CONSTANT ROW'
+
+
+class Migrations:
+    """Apply the versioned SQL files in `queries/migrations`.
+
+    Files are named `<version>_<name>.sql` and applied in version order. Applied
+    versions are recorded in the `schema_migrations` table. A named database
+    lock keeps concurrently starting workers from applying the same migration.
+
+    Other dialects than MariaDB have their files in a subdirectory named after
+    the dialect, e.g. `queries/migrations/sqlite`, with the same versions.
+    """
+
+    def __init__(self, sql_conn: SQL, migrations_dir: Union[Path, None] = None) -> None:
+        self.sql_conn = sql_conn
+        if migrations_dir is None:
+            migrations_dir = MIGRATIONS_DIR if sql_conn.dialect == 'mariadb' else MIGRATIONS_DIR.joinpath(sql_conn.dialect)
+        self.migrations_dir = migrations_dir
+
+    def available(self) -> List[Tuple[int, str, Path]]:
+        """List all migration files.
+
+        Returns:
+            List[Tuple[int, str, Path]]: Version, name and path sorted by version.
+        """
+        migrations = []
+        for path in self.migrations_dir.glob('*.sql'):
+            version, _, name = path.stem.partition('_')
+            migrations.append((int(version), name, path))
+
+        return sorted(migrations)
+
+    async def applied(self, db: Session) -> List[int]:
+        """Get the applied versions.
+
+        Args:
+            db (Session): Connection to read with.
+
+        Returns:
+            List[int]: Applied versions.
+        """
+        await db.query("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT UNSIGNED NOT NULL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL
+            )
+        """)
+        return [row['version'] for row in await db.query("SELECT version FROM schema_migrations ORDER BY version")]
+
+    async def pending(self) -> List[Tuple[int, str, Path]]:
+        """List migrations which are not applied yet.
+
+        Returns:
+            List[Tuple[int, str, Path]]: Version, name and path sorted by version.
+        """
+        async with self.sql_conn.session() as db:
+            applied = await self.applied(db)
+
+        return [migration for migration in self.available() if migration[0] not in applied]
+
+    async def apply(self) -> List[int]:
+        """Apply all pending migrations.
+
+        Raises:
+            TimeoutError: Raised if another process holds the migration lock for too long.
+
+        Returns:
+            List[int]: Newly applied versions.
+        """
+        newly_applied = []
+        async with self.sql_conn.lock(MIGRATION_LOCK) as db:
+            applied = await self.applied(db)
+            for version, name, path in self.available():
+                if version in applied:
+                    continue
+
+                log.info(f"Apply migration {version}: {name}")
+                # DDL statements commit implicitly, so a migration is not atomic
+                for statement in self.split_statements(path.read_text()):
+                    await db.query(statement)
+
+                await db.query(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%(version)s, %(name)s)",
+                    {'version': version, 'name': name},
+                )
+                newly_applied.append(version)
+
+        return newly_applied
+
+    async def explain(self, queries: Dict[str, Tuple[str, Dict]] = HOT_QUERIES) -> Dict[str, List[Dict]]:
+        """Run EXPLAIN for the request path queries and collect full table or index scans.
+
+        Args:
+            queries (Dict[str, Tuple[str, Dict]]): Query name mapped to query and example arguments. Defaults to `HOT_QUERIES`.
+
+        Returns:
+            Dict[str, List[Dict]]: Query name mapped to the EXPLAIN rows doing a full scan. Empty if no query scans.
+        """
+        full_scans = {}
+        async with self.sql_conn.session() as db:
+            for name, (query, query_args) in queries.items():
+                if self.sql_conn.dialect == 'sqlite':
+                    rows = await db.query(f"EXPLAIN QUERY PLAN {query}", query_args)
+                    scans = [
+                        row for row in rows
+                        if row['detail'].startswith(SQLITE_FULL_SCAN) and row['detail'] != SQLITE_CONSTANT_ROW
+                    ]
+                else:
+                    rows = await db.query(f"EXPLAIN {query}", query_args)
+                    scans = [row for row in rows if row.get('type') in FULL_SCAN_TYPES]
+                log.debug(f"EXPLAIN {name}: {rows}")
+
+                if scans:
+                    full_scans[name] = scans
+
+        return full_scans
+
+    @staticmethod
+    def split_statements(sql: str) -> List[str]:
+        """Split a migration file into statements. Removes `--` comments.
+
+        Args:
+            sql (str): Content of a migration file.
+
+        Returns:
+            List[str]: Statements without the trailing semicolon.
+        """
+        sql = re.sub(r'--[^\n]*', '', sql)
+        return [statement.strip() for statement in sql.split(';') if statement.strip()]
@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import random
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+import chess
+import chess.engine
+import chess.polyglot
+
+log = logging.getLogger(__name__)
+
+CacheKey = Tuple[int, int, Union[float, None], Union[int, None], Union[int, None]]
+
+
+class MoveCache:
+    """Opening book and position cache in front of the engine.
+
+    Positions are keyed by their Zobrist hash, the bucket of the target
+    `UCI_Elo` and the search limit. Each key collects up to `samples` engine
+    replies and is only served from the cache once all samples are there, by
+    picking one of them at random. With `samples` > 1 a strength limited engine
+    therefore keeps its variety instead of repeating one reply per position.
+    """
+
+    def __init__(
+            self, max_entries: int = 100000, samples: int = 8, elo_bucket: int = 50,
+            book_path: Union[str, None] = None, book_max_ply: int = 16, cache_file: Union[str, None] = None,
+            ) -> None:
+        """
+        Args:
+            max_entries (int): Maximum number of cached positions, 0 disables the cache. Defaults to 100000.
+            samples (int): Engine replies collected per position before it is served from cache. Defaults to 8.
+            elo_bucket (int): Width of the `UCI_Elo` buckets. Defaults to 50.
+            book_path (Union[str, None]): Polyglot opening book. Defaults to None (no book).
+            book_max_ply (int): Book moves are only played before this ply. Defaults to 16.
+            cache_file (Union[str, None]): JSON file the cache is loaded from and saved to. Defaults to None.
+        """
+        self.max_entries = max_entries
+        self.samples = max(1, samples)
+        self.elo_bucket = max(1, elo_bucket)
+        self.book_path = book_path
+        self.book_max_ply = book_max_ply
+        self.cache_file = Path(cache_file) if cache_file else None
+
+        self._book: Union[chess.polyglot.MemoryMappedReader, None] = None
+        # replies are stored as UCI strings to keep the cache file plain JSON
+        self._entries: OrderedDict[CacheKey, List[str]] = OrderedDict()
+
+        self.hits = 0
+        self.book_hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def open(self) -> None:
+        """Open the opening book and load the saved cache."""
+        if self.book_path:
+            self._book = chess.polyglot.open_reader(self.book_path)
+            log.info(f"Opened opening book: {self.book_path}")
+
+        if self.cache_file and self.cache_file.exists():
+            try:
+                for key, moves in json.loads(self.cache_file.read_text()):
+                    self._entries[tuple(key)] = moves
+                self._evict()
+                log.info(f"Loaded {len(self._entries)} cached positions from {self.cache_file}")
+            except Exception:
+                log.exception(f"Could not load move cache from {self.cache_file}")
+
+    def close(self) -> None:
+        """Close the opening book and save the cache."""
+        if self._book:
+            self._book.close()
+            self._book = None
+
+        if self.cache_file and self.max_entries:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            # every server worker saves its cache on shutdown, the replace is atomic
+            temp_file = self.cache_file.with_name(f"{self.cache_file.name}.{os.getpid()}.tmp")
+            temp_file.write_text(json.dumps(list(self._entries.items())))
+            temp_file.replace(self.cache_file)
+
+    def _key(self, board: chess.Board, elo: Union[int, None], limit: chess.engine.Limit) -> CacheKey:
+        return (
+            chess.polyglot.zobrist_hash(board),
+            (elo or 0) // self.elo_bucket,
+            limit.time,
+            limit.depth,
+            limit.nodes,
+        )
+
+    def lookup(
+            self, board: chess.Board, elo: Union[int, None], limit: chess.engine.Limit,
+            ) -> Tuple[Union[chess.Move, None], Union[str, None]]:
+        """Get a reply without asking the engine.
+
+        Args:
+            board (chess.Board): Current position.
+            elo (Union[int, None]): Target `UCI_Elo` of the engine.
+            limit (chess.engine.Limit): Search limit the reply must have been found with.
+
+        Returns:
+            Tuple[Union[chess.Move, None], Union[str, None]]: Book or cached move and its source ('book' or 'cache'),
+                (None, None) if the engine has to search.
+        """
+        if self._book and len(board.move_stack) < self.book_max_ply:
+            try:
+                move = self._book.weighted_choice(board).move
+                self.book_hits += 1
+                return move, 'book'
+            except IndexError:
+                pass
+
+        if self.max_entries:
+            key = self._key(board, elo, limit)
+            moves = self._entries.get(key)
+            if moves is not None and len(moves) >= self.samples:
+                self._entries.move_to_end(key)
+                move = chess.Move.from_uci(random.choice(moves))
+                # guard against hash collisions
+                if board.is_legal(move):
+                    self.hits += 1
+                    return move, 'cache'
+
+        self.misses += 1
+        return None, None
+
+    def store(self, board: chess.Board, elo: Union[int, None], limit: chess.engine.Limit, move: chess.Move) -> None:
+        """Remember an engine reply as sample of the position.
+
+        Args:
+            board (chess.Board): Position before the move.
+            elo (Union[int, None]): Target `UCI_Elo` of the engine.
+            limit (chess.engine.Limit): Search limit of the reply.
+            move (chess.Move): Engine reply.
+        """
+        if not self.max_entries:
+            return
+
+        key = self._key(board, elo, limit)
+        moves = self._entries.setdefault(key, [])
+        if len(moves) < self.samples:
+            moves.append(move.uci())
+
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache size and counters.
+
+        Returns:
+            Dict[str, int]: Cache state.
+        """
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'samples': self.samples,
+            'hits': self.hits,
+            'book_hits': self.book_hits,
+            'misses': self.misses,
+            'evicted': self.evicted,
+        }
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
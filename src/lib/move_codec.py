@@ -0,0 +1,127 @@
+import logging
+from typing import Dict, Iterable, List, Union
+
+import chess
+from chess import COLOR_NAMES, SQUARE_NAMES, piece_symbol, square_file
+
+log = logging.getLogger(__name__)
+
+# plies between two stored FEN checkpoints
+FEN_CHECKPOINT_INTERVAL = 20
+
+
+def encode_move(move: chess.Move) -> int:
+    """Pack a move into 15 bits: from square, to square and promotion piece type.
+
+    Args:
+        move (chess.Move): Move to encode.
+
+    Returns:
+        int: `from | to << 6 | promotion << 12`
+    """
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(code: int) -> chess.Move:
+    """Unpack a move encoded by `encode_move`.
+
+    Args:
+        code (int): Encoded move.
+
+    Returns:
+        chess.Move: Decoded move.
+    """
+    return chess.Move(code & 63, code >> 6 & 63, promotion=(code >> 12 & 7) or None)
+
+
+def fen_checkpoint(board: chess.Board) -> Union[str, None]:
+    """Get the FEN to store with the last pushed move, only every `FEN_CHECKPOINT_INTERVAL` plies.
+
+    Args:
+        board (chess.Board): Board after the move.
+
+    Returns:
+        Union[str, None]: FEN or None if no checkpoint is due.
+    """
+    return board.fen() if len(board.move_stack) % FEN_CHECKPOINT_INTERVAL == 0 else None
+
+
+def get_castling(board: chess.Board, move: chess.Move) -> str:
+    """Get castling notation.
+
+    https://de.wikipedia.org/wiki/Forsyth-Edwards-Notation#Rochaderechte-Kodierung
+
+    Args:
+        board (chess.Board): Board before the move.
+        move (chess.Move): Current move.
+
+    Returns:
+        str: Castle notation
+    """
+    if board.is_castling(move):
+        if square_file(move.to_square) > square_file(move.from_square):  # kingside castling move
+            return '0-0'
+        elif square_file(move.to_square) < square_file(move.from_square):  # queenside castling move
+            return '0-0-0'
+
+    return ''
+
+
+def replay(codes: Iterable[int], board: Union[chess.Board, None] = None) -> chess.Board:
+    """Push encoded moves onto a board.
+
+    Args:
+        codes (Iterable[int]): Encoded moves in ply order.
+        board (Union[chess.Board, None]): Board to push on. Defaults to the start position.
+
+    Returns:
+        chess.Board: Board after the last move.
+    """
+    board = board if board is not None else chess.Board()
+    for code in codes:
+        board.push(decode_move(code))
+
+    return board
+
+
+def decode_game(codes: Iterable[int], checkpoints: Union[Iterable[Union[str, None]], None] = None) -> List[Dict]:
+    """Rebuild the per move columns which were stored before moves were encoded.
+
+    Stored FEN checkpoints are compared with the replayed position. On a
+    mismatch the replay continues from the checkpoint.
+
+    Args:
+        codes (Iterable[int]): Encoded moves in ply order.
+        checkpoints (Union[Iterable[Union[str, None]], None]): FEN checkpoint of each ply. Defaults to None.
+
+    Returns:
+        List[Dict]: source, target, new_fen, old_fen, piece, castling, color and promotion_symbol of each ply.
+    """
+    codes = list(codes)
+    checkpoints = list(checkpoints) if checkpoints is not None else [None] * len(codes)
+    board = chess.Board()
+    rows = []
+
+    for ply, (code, checkpoint) in enumerate(zip(codes, checkpoints), start=1):
+        move = decode_move(code)
+        old_fen = board.fen()
+        piece = board.piece_at(move.from_square)
+        castling = get_castling(board, move)
+        board.push(move)
+
+        if checkpoint and board.fen() != checkpoint:
+            log.warning(f"Replayed position of ply {ply} differs from the stored checkpoint. Continue from checkpoint.")
+            board = chess.Board(checkpoint)
+
+        rows.append({
+            'source': SQUARE_NAMES[move.from_square],
+            'target': SQUARE_NAMES[move.to_square],
+            'new_fen': board.fen(),
+            'old_fen': old_fen,
+            'piece': piece.symbol() if piece else None,
+            'castling': castling,
+            'color': COLOR_NAMES[piece.color] if piece else None,
+            'promotion_symbol': piece_symbol(move.promotion) if move.promotion else None,
+        })
+
+    return rows
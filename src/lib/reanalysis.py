@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import multiprocessing
+import multiprocessing.util
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Set, Tuple, Union
+
+import chess
+import chess.engine
+
+from src.lib.move_codec import decode_move, encode_move
+from src.lib.settings import CLI_LOG_FORMAT
+from src.lib.sql import SQL
+
+log = logging.getLogger(__name__)
+
+MATE_SCORE = 10000
+
+# engine of the current worker process, started by `_init_worker`
+_engine: Union[chess.engine.SimpleEngine, None] = None
+_engine_path: Union[str, None] = None
+_hash_size = 64
+_limit: Union[chess.engine.Limit, None] = None
+
+# (game_id, ply, FEN before the move, move code)
+Task = Tuple[int, int, str, int]
+
+
+def _init_worker(engine_path: str, limit: chess.engine.Limit, hash_size: int, log_level: int) -> None:
+    global _engine_path, _hash_size, _limit
+    # spawned workers start without the logging setup of the parent
+    logging.basicConfig(level=log_level, format=CLI_LOG_FORMAT)
+    _engine_path = engine_path
+    _hash_size = hash_size
+    _limit = limit
+    _start_engine()
+
+
+def _start_engine() -> None:
+    global _engine
+    _engine = chess.engine.SimpleEngine.popen_uci(_engine_path)
+    # full strength, one search thread per process
+    _engine.configure({'UCI_LimitStrength': False, 'Threads': 1, 'Hash': _hash_size})
+    # quit the engine when the pool stops the worker, its thread would keep the process alive
+    multiprocessing.util.Finalize(_engine, _engine.quit, exitpriority=10)
+
+
+def _evaluate(board: chess.Board, color: chess.Color) -> Tuple[int, Union[chess.Move, None]]:
+    if board.is_checkmate():
+        return (-MATE_SCORE if board.turn == color else MATE_SCORE), None
+    if board.is_game_over():
+        return 0, None
+
+    info = _engine.analyse(board, _limit)
+    return info['score'].pov(color).score(mate_score=MATE_SCORE), (info.get('pv') or [None])[0]
+
+
+def analyse_move(task: Task, blunder_threshold: int = 300) -> Dict:
+    """Score one move with the engine of the worker process.
+
+    Args:
+        task (Task): Game ID, ply, FEN before the move and move code.
+        blunder_threshold (int): Centipawn loss from which a move is a blunder. Defaults to 300.
+
+    Returns:
+        Dict: Row of the `move_analysis` table.
+    """
+    game_id, ply, fen, move_code = task
+    board = chess.Board(fen)
+    move = decode_move(move_code)
+    color = board.turn
+
+    try:
+        eval_before, best_move = _evaluate(board, color)
+        board.push(move)
+        eval_after, _ = _evaluate(board, color)
+    except chess.engine.EngineTerminatedError:
+        # the task fails, the next one gets a new engine
+        log.warning("Engine terminated while analysing game %s ply %s, restart it", game_id, ply)
+        _start_engine()
+        raise
+
+    is_best = best_move == move
+    # two searches of the same line differ slightly, the best move loses nothing by definition
+    loss = 0 if is_best else max(0, eval_before - eval_after)
+
+    return {
+        'game_id': game_id,
+        'ply': ply,
+        'best_move_code': encode_move(best_move) if best_move else None,
+        'eval_before': eval_before,
+        'eval_after': eval_after,
+        'centipawn_loss': loss,
+        'best_move': is_best,
+        'blunder': loss >= blunder_threshold,
+        'depth': _limit.depth,
+    }
+
+
+class Reanalysis:
+    """Score the stored user moves with full strength engines in a process pool.
+
+    Finished games are read page by page and replayed; every user
+    move without a row in `move_analysis` becomes a task. Results are inserted
+    in batches, so an interrupted run loses at most one batch and a new run
+    continues with the moves which are not analysed yet.
+    """
+
+    def __init__(
+            self, sql_conn: SQL, engine_path: str, workers: int = 1, depth: int = 16, hash_size: int = 64,
+            blunder_threshold: int = 300, batch_size: int = 200, report_interval: float = 10.0,
+            ) -> None:
+        """
+        Args:
+            sql_conn (SQL): Database connection pool.
+            engine_path (str): Path of the Stockfish binary.
+            workers (int): Engine processes. Defaults to 1.
+            depth (int): Search depth of each analysis. Defaults to 16.
+            hash_size (int): Hash of each engine in MB. Defaults to 64.
+            blunder_threshold (int): Centipawn loss from which a move is a blunder. Defaults to 300.
+            batch_size (int): Rows per INSERT. Defaults to 200.
+            report_interval (float): Seconds between two progress logs. Defaults to 10.
+        """
+        self.sql_conn = sql_conn
+        self.engine_path = engine_path
+        self.workers = max(1, workers)
+        self.limit = chess.engine.Limit(depth=depth)
+        self.hash_size = hash_size
+        self.blunder_threshold = blunder_threshold
+        self.batch_size = batch_size
+        self.report_interval = report_interval
+
+        self.analysed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.failed_games: Set[int] = set()
+
+    async def tasks(self, user_moves_only: bool = True, games_per_query: int = 100) -> AsyncIterator[Task]:
+        """Yield the moves which are not analysed yet.
+
+        Finished games are read in pages of `games_per_query` games, so no
+        cursor stays open while the engines are working.
+
+        Args:
+            user_moves_only (bool): Only the moves of the user (white, odd plies). Defaults to True.
+            games_per_query (int): Games loaded per query. Defaults to 100.
+        """
+        last_game_id = 0
+
+        while True:
+            games = await self.sql_conn.query("""
+                SELECT id FROM games
+                WHERE end_reasons IS NOT NULL AND id > %(last_game_id)s
+                ORDER BY id ASC
+                LIMIT %(limit)s
+                """,
+                {'last_game_id': last_game_id, 'limit': games_per_query},
+            )
+            if not games:
+                return
+
+            game_ids = [game['id'] for game in games]
+            last_game_id = game_ids[-1]
+
+            rows = await self.sql_conn.query(f"""
+                SELECT
+                    moves.game_id, moves.ply, moves.move_code,
+                    move_analysis.ply IS NOT NULL AS analysed
+                FROM
+                    moves
+                LEFT JOIN
+                    move_analysis
+                ON
+                    move_analysis.game_id = moves.game_id AND move_analysis.ply = moves.ply
+                WHERE
+                    moves.game_id IN ({', '.join(str(int(game_id)) for game_id in game_ids)})
+                ORDER BY
+                    moves.game_id ASC, moves.ply ASC
+                """)
+
+            game_id = None
+            for row in rows:
+                if row['game_id'] != game_id:
+                    game_id = row['game_id']
+                    board = chess.Board()
+
+                if row['analysed'] or (user_moves_only and row['ply'] % 2 == 0):
+                    self.skipped += bool(row['analysed'])
+                else:
+                    yield game_id, row['ply'], board.fen(), row['move_code']
+
+                board.push(decode_move(row['move_code']))
+
+    async def _save(self, rows: List[Dict]) -> None:
+        if not rows:
+            return
+
+        columns = ('game_id', 'ply', 'best_move_code', 'eval_before', 'eval_after', 'centipawn_loss', 'best_move', 'blunder', 'depth')
+        args = {}
+        values = []
+        for i, row in enumerate(rows):
+            values.append("(" + ", ".join(f"%({column}_{i})s" for column in columns) + ")")
+            args.update({f"{column}_{i}": row[column] for column in columns})
+
+        # a move analysed by an overlapping run is kept
+        await self.sql_conn.query(
+            f"INSERT IGNORE INTO move_analysis ({', '.join(columns)}) VALUES {', '.join(values)}",
+            args,
+        )
+
+    async def run(self, user_moves_only: bool = True) -> Dict[str, float]:
+        """Analyse all pending moves.
+
+        Args:
+            user_moves_only (bool): Only the moves of the user. Defaults to True.
+
+        Returns:
+            Dict[str, float]: Analysed, skipped and failed moves, seconds and positions per second.
+        """
+        loop = asyncio.get_running_loop()
+        start = last_report = time.monotonic()
+        # futures mapped to their task, to report failed moves
+        pending: Dict[asyncio.Future, Task] = {}
+        results: List[Dict] = []
+
+        async def collect(wait_for: int) -> None:
+            nonlocal results, last_report
+            done = (await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))[0] if len(pending) > wait_for else set()
+            for future in done:
+                game_id, ply, _, _ = pending.pop(future)
+                try:
+                    results.append(future.result())
+                    self.analysed += 1
+                except Exception:
+                    # the move stays without analysis, a new run tries it again
+                    log.exception("Could not analyse game %s ply %s", game_id, ply)
+                    self.failed += 1
+                    self.failed_games.add(game_id)
+
+            if len(results) >= self.batch_size:
+                await self._save(results)
+                results = []
+
+            if time.monotonic() - last_report > self.report_interval:
+                last_report = time.monotonic()
+                log.info(f"Analysed {self.analysed} moves, {2 * self.analysed / (last_report - start):.1f} positions/s")
+
+        # spawn, so no worker inherits the threads of the parent like the log listener of the app
+        with ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+                initargs=(self.engine_path, self.limit, self.hash_size, logging.getLogger().getEffectiveLevel()),
+                ) as executor:
+            # a few tasks per process in flight keep the engines busy without queueing the whole database
+            async for task in self.tasks(user_moves_only):
+                pending[loop.run_in_executor(executor, analyse_move, task, self.blunder_threshold)] = task
+                await collect(self.workers * 4)
+
+            while pending:
+                await collect(0)
+
+        await self._save(results)
+        if self.failed:
+            log.error(f"{self.failed} moves of {len(self.failed_games)} games could not be analysed: {sorted(self.failed_games)}")
+
+        seconds = time.monotonic() - start
+        # each move is two positions, before and after the move
+        return {
+            'analysed': self.analysed,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'seconds': round(seconds, 1),
+            'positions_per_second': round(2 * self.analysed / seconds, 1) if seconds else 0.0,
+        }
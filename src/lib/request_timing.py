@@ -0,0 +1,133 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Dict, Iterator, Union
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+log = logging.getLogger(__name__)
+
+# written by AstlLogger to its own file, one JSON object per line
+SLOW_REQUEST_LOGGER = 'slow_requests'
+slow_log = logging.getLogger(SLOW_REQUEST_LOGGER)
+
+# phase name mapped to seconds of the current request, None outside of a request
+_spans: ContextVar[Union[Dict[str, float], None]] = ContextVar('request_spans', default=None)
+# route template mapped to a callback with the seconds of each request, see `time_route()`
+_route_timers: Dict[str, Callable[[float], None]] = {}
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Add the duration of the context to the phase `name` of the current request.
+
+    Repeated phases are summed up. Phases may be nested, e.g. `replay` is part
+    of `auth`. Outside of a request this does nothing.
+
+    Args:
+        name (str): Phase name, a token of the `Server-Timing` header.
+    """
+    spans = _spans.get()
+    if spans is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans[name] = spans.get(name, 0.0) + time.perf_counter() - start
+
+
+def time_route(path: str, callback: Callable[[float], None]) -> None:
+    """Report the duration of every request of a route to `callback`, e.g. to observe a histogram.
+
+    The duration is measured by `RequestTimingMiddleware` from the start of the
+    request to the end of the response, so it includes the dependencies of the route.
+
+    Args:
+        path (str): Route template, e.g. `/move/{token}`.
+        callback (Callable[[float], None]): Called with the seconds of each request.
+    """
+    _route_timers[path] = callback
+
+
+def server_timing(spans: Dict[str, float], total: float) -> str:
+    """Format phases as `Server-Timing` header value in milliseconds.
+
+    Args:
+        spans (Dict[str, float]): Phase name mapped to seconds.
+        total (float): Seconds until the response started.
+
+    Returns:
+        str: Header value, e.g. `auth;dur=0.4, ki_move;dur=120.3, total;dur=125.1`.
+    """
+    return ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in (*spans.items(), ('total', total)))
+
+
+class RequestTimingMiddleware:
+    """ASGI middleware which collects the phases recorded with `span()`.
+
+    The phases go out as `Server-Timing` header. Requests which take longer
+    than `slow_threshold` are written to the slow request log with their phases.
+    """
+
+    def __init__(self, app: ASGIApp, slow_threshold: float = 1.0, send_header: bool = True) -> None:
+        """
+        Args:
+            app (ASGIApp): Wrapped application.
+            slow_threshold (float): Seconds from which a request is logged as slow. Defaults to 1.
+            send_header (bool): Add the `Server-Timing` header to the responses. Defaults to True.
+        """
+        self.app = app
+        self.slow_threshold = slow_threshold
+        self.send_header = send_header
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        spans: Dict[str, float] = {}
+        token = _spans.set(spans)
+        start = time.perf_counter()
+        status = None
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                if self.send_header:
+                    MutableHeaders(scope=message).append('Server-Timing', server_timing(spans, time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _spans.reset(token)
+            total = time.perf_counter() - start
+
+            # the route is set by the router, requests without a matching route have none
+            timer = _route_timers.get(getattr(scope.get('route'), 'path', None))
+            if timer:
+                timer(total)
+
+            if total > self.slow_threshold:
+                self._log_slow(scope, status, total, spans)
+
+    @staticmethod
+    def _log_slow(scope: Scope, status: Union[int, None], total: float, spans: Dict[str, float]) -> None:
+        route = scope.get('route')
+        slow_log.warning(json.dumps({
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'method': scope['method'],
+            # the route template keeps game tokens out of the log
+            'path': getattr(route, 'path', scope['path']),
+            'status': status,
+            'total_ms': round(total * 1000, 1),
+            'spans_ms': {name: round(seconds * 1000, 1) for name, seconds in spans.items()},
+        }))
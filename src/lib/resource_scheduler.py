@@ -0,0 +1,186 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Union
+
+import psutil
+
+log = logging.getLogger(__name__)
+
+CGROUP_ROOT = Path('/sys/fs/cgroup')
+
+
+def cgroup_cpu_limit() -> Union[float, None]:
+    """Read the CPU quota of the container (cgroup v2 or v1).
+
+    Returns:
+        Union[float, None]: Usable CPUs or None if unlimited.
+    """
+    try:
+        quota, period = (CGROUP_ROOT / 'cpu.max').read_text().split()
+        return None if quota == 'max' else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        quota = int((CGROUP_ROOT / 'cpu' / 'cpu.cfs_quota_us').read_text())
+        period = int((CGROUP_ROOT / 'cpu' / 'cpu.cfs_period_us').read_text())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def cgroup_memory_limit() -> Union[int, None]:
+    """Read the memory limit of the container (cgroup v2 or v1).
+
+    Returns:
+        Union[int, None]: Limit in bytes or None if unlimited.
+    """
+    for path in (CGROUP_ROOT / 'memory.max', CGROUP_ROOT / 'memory' / 'memory.limit_in_bytes'):
+        try:
+            value = path.read_text().strip()
+        except OSError:
+            continue
+
+        if value == 'max':
+            return None
+
+        try:
+            limit = int(value)
+        except ValueError:
+            continue
+
+        # cgroup v1 reports "unlimited" as a huge page aligned number
+        return limit if limit < psutil.virtual_memory().total else None
+
+    return None
+
+
+class ResourceScheduler:
+    """Global thread and hash budget shared by all engines.
+
+    Every engine process gets a fixed share of the hash and thread budgets when
+    it is started. The options never change afterwards, as Stockfish clears its
+    hash whenever `Threads` is set. A search takes the threads of its engine
+    from the free thread budget and returns them when it ends, so concurrent
+    games do not oversubscribe the CPUs. New engine processes are
+    refused while the measured engine RSS plus the new hash would exceed the
+    memory cap.
+
+    With several server workers every worker has its own scheduler and gets an
+    equal share of the thread budget, the hash budget and the memory cap.
+    """
+
+    def __init__(
+            self, max_engines: int, thread_budget: Union[int, None] = None, hash_budget: Union[int, None] = None,
+            max_engine_hash: int = 512, memory_reserve: int = 512, workers: int = 1,
+            ) -> None:
+        """
+        Args:
+            max_engines (int): Maximum number of engine processes (size of the engine pool).
+            thread_budget (Union[int, None]): Search threads of all engines together. Defaults to the usable CPUs.
+            hash_budget (Union[int, None]): Hash of all engines together in MB. Defaults to `max_engine_hash` * `max_engines`.
+            max_engine_hash (int): Upper bound of the hash of one engine in MB. Defaults to 512.
+            memory_reserve (int): Memory in MB kept free for the application and the OS. Defaults to 512.
+            workers (int): Server processes sharing the budgets. Defaults to 1.
+        """
+        cpus = psutil.cpu_count() or 1
+        if cpu_limit := cgroup_cpu_limit():
+            cpus = min(cpus, max(1, int(cpu_limit)))
+
+        memory_limit = psutil.virtual_memory().total
+        if cgroup_limit := cgroup_memory_limit():
+            memory_limit = min(memory_limit, cgroup_limit)
+
+        self.workers = max(1, workers)
+        self.max_engines = max(1, max_engines)
+        self.memory_reserve = memory_reserve
+        self.memory_cap = max(0, memory_limit // 1024 // 1024 - memory_reserve) // self.workers  # in MB
+        self.thread_budget = max(1, min(thread_budget or cpus, cpus) // self.workers)
+        hash_budget = hash_budget // self.workers if hash_budget else max_engine_hash * self.max_engines
+        # the hash tables must fit into the memory cap next to the engine processes
+        self.hash_budget = min(hash_budget, self.memory_cap // 2)
+        self.engine_hash = max(1, min(max_engine_hash, self.hash_budget // self.max_engines))
+        self.engine_threads = max(1, self.thread_budget // self.max_engines)
+        # searches which fit into the thread budget at once
+        self.max_searches = max(1, self.thread_budget // self.engine_threads)
+
+        self._search_slots = asyncio.Semaphore(self.max_searches)
+        self.active_searches = 0
+        self.engine_rss = 0  # in MB, updated by `track()`
+
+        log.info(f"Resource budget: {self.stats()}")
+
+    def engine_options(self) -> Dict[str, int]:
+        """UCI options of a new engine process.
+
+        Returns:
+            Dict[str, int]: Hash and thread share, fixed for the lifetime of the process.
+        """
+        return {'Hash': self.engine_hash, 'Threads': self.engine_threads}
+
+    def free_threads(self) -> int:
+        """Threads of the budget not used by a running search."""
+        return self.thread_budget - self.active_searches * self.engine_threads
+
+    @asynccontextmanager
+    async def search(self):
+        """Take the threads of one search from the budget, waits while the budget is used up."""
+        async with self._search_slots:
+            self.active_searches += 1
+            try:
+                yield
+            finally:
+                self.active_searches -= 1
+
+    def track(self, pids: Iterable[int]) -> int:
+        """Measure the memory of the engine processes.
+
+        Args:
+            pids (Iterable[int]): Engine process IDs.
+
+        Returns:
+            int: Total RSS in MB.
+        """
+        rss = 0
+        for pid in pids:
+            try:
+                rss += psutil.Process(pid).memory_info().rss
+            except psutil.Error:
+                continue
+
+        self.engine_rss = rss // 1024 // 1024
+        return self.engine_rss
+
+    def check_memory(self, pids: Iterable[int]) -> None:
+        """Check if one more engine fits into the memory cap.
+
+        Args:
+            pids (Iterable[int]): Running engine process IDs.
+
+        Raises:
+            MemoryError: Raised if the engines would exceed the memory cap.
+        """
+        if self.track(pids) + self.engine_hash > self.memory_cap:
+            raise MemoryError(
+                f"Engines use {self.engine_rss} MB, another {self.engine_hash} MB would exceed the cap of {self.memory_cap} MB!"
+            )
+
+    def stats(self) -> Dict[str, int]:
+        """Get budgets and current usage.
+
+        Returns:
+            Dict[str, int]: Scheduler state, memory values in MB.
+        """
+        return {
+            'workers': self.workers,
+            'thread_budget': self.thread_budget,
+            'hash_budget': self.hash_budget,
+            'engine_hash': self.engine_hash,
+            'engine_threads': self.engine_threads,
+            'free_threads': self.free_threads(),
+            'memory_cap': self.memory_cap,
+            'engine_rss': self.engine_rss,
+            'active_searches': self.active_searches,
+        }
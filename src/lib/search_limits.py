@@ -0,0 +1,129 @@
+import logging
+import math
+from collections import deque
+from typing import Deque, Dict, Union
+
+import chess.engine
+
+log = logging.getLogger(__name__)
+
+
+class LimitController:
+    """Pick the search limit of each engine move.
+
+    Without load every move searches `max_time` and `max_depth`, the limit
+    used before the controller existed. Optionally the base thinking time and
+    depth shrink linearly towards `min_elo_time` and `min_depth` as the target
+    `UCI_Elo` goes down from `elo_max` to `elo_min`. The time is divided by the
+    current load of the search queue and scaled by a feedback factor, which is
+    lowered while the measured p95 move latency is above `target_p95` and
+    raised again, never above the base time, while it is well below. Times are
+    rounded down from `max_time` in sqrt(2) steps, so the move cache keeps
+    seeing a small set of distinct limits.
+    """
+
+    def __init__(
+            self, min_time: float = 0.02, max_time: float = 0.1, min_elo_time: Union[float, None] = None,
+            min_depth: Union[int, None] = None, max_depth: int = 20, nodes: Union[int, None] = None,
+            target_p95: float = 0.5, elo_min: int = 1350, elo_max: int = 2850, window: int = 200,
+            ) -> None:
+        """
+        Args:
+            min_time (float): Lower bound of the thinking time in seconds. Defaults to 0.02.
+            max_time (float): Thinking time at `elo_max` without load in seconds. Defaults to 0.1.
+            min_elo_time (Union[float, None]): Thinking time at `elo_min` without load in seconds. Defaults to `max_time`.
+            min_depth (Union[int, None]): Depth at `elo_min`. Defaults to `max_depth`.
+            max_depth (int): Depth at `elo_max`. Defaults to 20.
+            nodes (Union[int, None]): Fixed node limit. Defaults to None (no node limit).
+            target_p95 (float): Target p95 latency of an engine move in seconds. Defaults to 0.5.
+            elo_min (int): Lowest `UCI_Elo` the engine is set to. Defaults to 1350.
+            elo_max (int): Highest `UCI_Elo` the engine is set to. Defaults to 2850.
+            window (int): Number of latest engine moves the p95 is computed from. Defaults to 200.
+        """
+        self.min_time = min_time
+        self.max_time = max(min_time, max_time)
+        self.min_elo_time = self.max_time if min_elo_time is None else min(self.max_time, max(min_time, min_elo_time))
+        self.max_depth = max_depth
+        self.min_depth = max_depth if min_depth is None else min(min_depth, max_depth)
+        self.nodes = nodes
+        self.target_p95 = target_p95
+        self.elo_min = elo_min
+        self.elo_max = max(elo_min + 1, elo_max)
+
+        self.scale = 1.0
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._since_adjust = 0
+
+    def _elo_fraction(self, elo: Union[int, None]) -> float:
+        if elo is None:
+            return 1.0
+
+        return min(1.0, max(0.0, (elo - self.elo_min) / (self.elo_max - self.elo_min)))
+
+    def _quantize(self, seconds: float) -> float:
+        steps = round(2 * math.log2(self.max_time / min(self.max_time, max(seconds, self.min_time))))
+        return round(max(self.min_time, self.max_time * 2 ** (-steps / 2)), 3)
+
+    def limit(self, elo: Union[int, None], load: float = 0.0) -> chess.engine.Limit:
+        """Get the limit of the next engine move.
+
+        Args:
+            elo (Union[int, None]): Target `UCI_Elo` of the engine, None for full strength.
+            load (float): Running and waiting searches per search slot. Defaults to 0.
+
+        Returns:
+            chess.engine.Limit: Time, depth and node limit.
+        """
+        fraction = self._elo_fraction(elo)
+        seconds = (self.min_elo_time + (self.max_time - self.min_elo_time) * fraction) * self.scale / max(1.0, load)
+
+        return chess.engine.Limit(
+            time=self._quantize(seconds),
+            depth=round(self.min_depth + (self.max_depth - self.min_depth) * fraction),
+            nodes=self.nodes,
+        )
+
+    def p95(self) -> Union[float, None]:
+        """Get the p95 latency of the latest engine moves.
+
+        Returns:
+            Union[float, None]: Seconds, None without measurements.
+        """
+        if not self._latencies:
+            return None
+
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)]
+
+    def record(self, latency: float) -> None:
+        """Add the latency of an engine move and adjust the scale factor every 20 moves.
+
+        Args:
+            latency (float): Seconds from queueing the search until the engine replied.
+        """
+        self._latencies.append(latency)
+        self._since_adjust += 1
+        if self._since_adjust < 20:
+            return
+
+        self._since_adjust = 0
+        p95 = self.p95()
+        if p95 > self.target_p95:
+            self.scale = max(0.05, self.scale * 0.8)
+            log.info("Move latency p95 %.3f s above target, scale search time to %.2f", p95, self.scale)
+        elif p95 < 0.7 * self.target_p95 and self.scale < 1.0:
+            self.scale = min(1.0, self.scale * 1.1)
+            log.debug("Move latency p95 %.3f s below target, scale search time to %.2f", p95, self.scale)
+
+    def stats(self) -> Dict[str, Union[float, None]]:
+        """Get the latency target and the current state.
+
+        Returns:
+            Dict[str, Union[float, None]]: Target and p95 in seconds, scale factor and number of samples.
+        """
+        return {
+            'target_p95': self.target_p95,
+            'p95': self.p95(),
+            'scale': self.scale,
+            'samples': len(self._latencies),
+        }
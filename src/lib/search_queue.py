@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable
+
+log = logging.getLogger(__name__)
+
+
+class EngineBusy(Exception):
+    """Raised if an engine search is not admitted. Answered with 503 and `Retry-After`."""
+
+    def __init__(self, message: str, retry_after: int = 1) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SearchQueue:
+    """Admission control in front of the engine searches.
+
+    At most `max_concurrent` searches run at once. Further searches wait in a
+    bounded queue with one FIFO per game; the games are served round robin, so
+    a game sending many requests cannot starve the others. A search which is
+    not admitted within `max_wait` seconds, or finds the queue full, is
+    rejected with `EngineBusy`.
+    """
+
+    def __init__(self, max_concurrent: int = 4, max_queue: int = 64, max_wait: float = 10.0) -> None:
+        """
+        Args:
+            max_concurrent (int): Maximum number of concurrent searches. Defaults to 4.
+            max_queue (int): Maximum number of waiting searches. Defaults to 64.
+            max_wait (float): Seconds a search may wait for admission. Defaults to 10.
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self.active = 0
+        self.queued = 0
+        self._waiting: OrderedDict[Hashable, Deque[asyncio.Future]] = OrderedDict()
+
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        # moving average of the search duration, used to estimate `Retry-After`
+        self.search_avg = 1.0
+
+    def load(self) -> float:
+        """Get the running and waiting searches per search slot.
+
+        Returns:
+            float: 1.0 if all slots are busy and nobody waits.
+        """
+        return (self.active + self.queued) / self.max_concurrent
+
+    def retry_after(self) -> int:
+        """Estimate the seconds until a new search could be admitted.
+
+        Returns:
+            int: Seconds, at least 1.
+        """
+        return max(1, math.ceil(self.search_avg * (self.queued + 1) / self.max_concurrent))
+
+    @asynccontextmanager
+    async def slot(self, game_id: Hashable):
+        """Wait for admission and hold a search slot.
+
+        Args:
+            game_id (Hashable): Game the search belongs to.
+
+        Raises:
+            EngineBusy: Raised if the queue is full or the search was not admitted within `max_wait`.
+        """
+        start = time.monotonic()
+
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+        else:
+            await self._wait(game_id)
+
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start - waited
+            self.search_avg = 0.9 * self.search_avg + 0.1 * duration
+            self._release()
+
+    async def _wait(self, game_id: Hashable) -> None:
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise EngineBusy(f"Search queue is full ({self.queued} waiting)", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(game_id, deque()).append(future)
+        self.queued += 1
+
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # admitted while timing out, pass the slot on
+                self._release()
+            else:
+                self._discard(game_id, future)
+
+            if isinstance(e, asyncio.CancelledError):
+                raise
+
+            self.timed_out += 1
+            raise EngineBusy(f"Search was not admitted within {self.max_wait} s", self.retry_after()) from None
+
+    def _discard(self, game_id: Hashable, future: asyncio.Future) -> None:
+        waiting = self._waiting.get(game_id)
+        if waiting and future in waiting:
+            waiting.remove(future)
+            self.queued -= 1
+            if not waiting:
+                del self._waiting[game_id]
+
+    def _release(self) -> None:
+        """Hand the slot to the next waiting game or free it."""
+        while self._waiting:
+            game_id, waiting = next(iter(self._waiting.items()))
+            future = waiting.popleft()
+            self.queued -= 1
+
+            # the game goes to the end of the round
+            if waiting:
+                self._waiting.move_to_end(game_id)
+            else:
+                del self._waiting[game_id]
+
+            if not future.done():
+                future.set_result(None)
+                return
+
+        self.active -= 1
+
+    def stats(self) -> Dict[str, float]:
+        """Get queue depth and wait times.
+
+        Returns:
+            Dict[str, float]: Queue state, times in seconds.
+        """
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'active': self.active,
+            'queued': self.queued,
+            'waiting_games': len(self._waiting),
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'wait_avg': self.wait_total / self.admitted if self.admitted else 0.0,
+            'wait_max': self.wait_max,
+            'search_avg': self.search_avg,
+        }
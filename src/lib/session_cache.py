@@ -0,0 +1,167 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Union
+
+import chess
+
+log = logging.getLogger(__name__)
+
+
+class GameSession:
+    """Live state of a running game: the board and the game metadata."""
+
+    def __init__(
+            self, token: str, game_id: int, user_elo: int, start: Union[datetime, None],
+            first_game_start: Union[datetime, None], redirect_url: Union[str, None], game_number: Union[int, None],
+            board: Union[chess.Board, None] = None,
+            ) -> None:
+        self.token = token
+        self.game_id = game_id
+        self.user_elo = user_elo
+        self.start = start
+        self.first_game_start = first_game_start
+        self.redirect_url = redirect_url
+        self.game_number = game_number
+        # None until the move history is loaded from the database
+        self.board = board
+        self.touched = time.monotonic()
+
+    def __repr__(self) -> str:
+        return f"<GameSession game_id={self.game_id} token={self.token} ply={len(self.board.move_stack) if self.board else None}>"
+
+
+class SessionCache:
+    """Token keyed LRU cache of running games with a sliding TTL.
+
+    Tokens of unknown or finished games are cached as well (negative cache),
+    so repeated requests with an invalid token do not reach the database.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 1800.0, invalid_ttl: float = 300.0) -> None:
+        """
+        Args:
+            max_entries (int): Maximum number of cached games and of cached invalid tokens. Defaults to 1000.
+            ttl (float): Seconds after the last access until a game is dropped. Defaults to 1800.
+            invalid_ttl (float): Seconds an invalid token is remembered. Defaults to 300.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.invalid_ttl = invalid_ttl
+        self._sessions: OrderedDict[str, GameSession] = OrderedDict()
+        self._invalid: OrderedDict[str, float] = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalid_hits = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, token: str) -> Union[GameSession, None]:
+        """Get a cached game.
+
+        Args:
+            token (str): Game token.
+
+        Returns:
+            Union[GameSession, None]: Cached game or None if not cached or expired.
+        """
+        session = self._sessions.get(token)
+        now = time.monotonic()
+
+        if session is None or now - session.touched > self.ttl:
+            if session is not None:
+                del self._sessions[token]
+                self.evicted += 1
+            self.misses += 1
+            return None
+
+        session.touched = now
+        self._sessions.move_to_end(token)
+        self.hits += 1
+        return session
+
+    def put(self, session: GameSession) -> None:
+        """Add or refresh a game. Evicts expired and least recently used games.
+
+        Args:
+            session (GameSession): Game with a loaded board.
+        """
+        session.touched = time.monotonic()
+        self._sessions[session.token] = session
+        self._sessions.move_to_end(session.token)
+        self._evict()
+
+    def pop(self, token: str) -> Union[GameSession, None]:
+        """Remove a game from the cache.
+
+        Args:
+            token (str): Game token.
+
+        Returns:
+            Union[GameSession, None]: Removed game if it was cached.
+        """
+        return self._sessions.pop(token, None)
+
+    def mark_invalid(self, token: str) -> None:
+        """Remember a token of an unknown or finished game.
+
+        Args:
+            token (str): Game token.
+        """
+        self._sessions.pop(token, None)
+        self._invalid[token] = time.monotonic() + self.invalid_ttl
+        self._invalid.move_to_end(token)
+
+        while len(self._invalid) > self.max_entries:
+            self._invalid.popitem(last=False)
+
+    def is_invalid(self, token: str) -> bool:
+        """Check if a token is known to be invalid.
+
+        Args:
+            token (str): Game token.
+
+        Returns:
+            bool: True if the token was marked invalid within `invalid_ttl`.
+        """
+        expires = self._invalid.get(token)
+        if expires is None:
+            return False
+
+        if expires < time.monotonic():
+            del self._invalid[token]
+            return False
+
+        self.invalid_hits += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache size and counters.
+
+        Returns:
+            Dict[str, int]: Cache state.
+        """
+        return {
+            'size': len(self._sessions),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalid': len(self._invalid),
+            'invalid_hits': self.invalid_hits,
+            'evicted': self.evicted,
+        }
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        # least recently used entries are on the left side
+        while self._sessions:
+            token, session = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_entries and now - session.touched <= self.ttl:
+                break
+
+            del self._sessions[token]
+            self.evicted += 1
@@ -0,0 +1,68 @@
+import configparser
+import logging
+import os
+from typing import Union
+
+from src.lib.sql import SQL
+from src.lib.sqlite import SQLite
+
+CLI_LOG_FORMAT = "%(asctime)s [%(levelname)-5.5s] [%(processName)s] [%(filename)s:%(lineno)s] %(message)s"
+
+# the tests point this to their own settings
+SETTINGS_FILE = os.environ.get('UHH_CHESS_SETTINGS', 'settings.ini')
+
+
+def load_config(path: Union[str, None] = None) -> configparser.ConfigParser:
+    """Read the settings without starting the web app, used by the app and the command line tools.
+
+    Args:
+        path (Union[str, None]): Settings file. Defaults to `UHH_CHESS_SETTINGS` or `settings.ini`.
+
+    Returns:
+        configparser.ConfigParser: Settings.
+    """
+    config = configparser.ConfigParser()
+    config.read(path or SETTINGS_FILE)
+    return config
+
+
+def create_sql(config: configparser.ConfigParser) -> SQL:
+    """Create the connection pool of the configured database backend. Connects with `connect()`.
+
+    Args:
+        config (configparser.ConfigParser): Settings with a `[database]` section.
+
+    Returns:
+        SQL: `SQL` for MariaDB or `SQLite`.
+    """
+    if config['database'].get('backend', 'mariadb') == 'sqlite':
+        return SQLite(
+            path=config['database'].get('path', 'data/chess.sqlite3'),
+            pool_size=config['database'].getint('pool_size', 8),
+            acquire_timeout=config['database'].getfloat('pool_acquire_timeout', 10.0),
+            health_check_interval=config['database'].getfloat('pool_health_check_interval', 30.0),
+            busy_timeout=config['database'].getfloat('busy_timeout', 5.0),
+        )
+
+    return SQL(
+        database=config['database']['name'],
+        user=config['database']['user'],
+        password=config['database']['password'],
+        port=config['database'].getint('port'),
+        host=config['database'].get('host'),
+        pool_size=config['database'].getint('pool_size', 8),
+        acquire_timeout=config['database'].getfloat('pool_acquire_timeout', 10.0),
+        health_check_interval=config['database'].getfloat('pool_health_check_interval', 30.0),
+    )
+
+
+def setup_cli_logging(config: configparser.ConfigParser) -> None:
+    """Log to stderr with the configured level, for the command line tools.
+
+    Args:
+        config (configparser.ConfigParser): Settings with a `[log]` section.
+    """
+    logging.basicConfig(
+        level=config.getint('log', 'level', fallback=logging.WARNING),
+        format=CLI_LOG_FORMAT,
+    )
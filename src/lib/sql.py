@@ -1,52 +1,309 @@
+import asyncio
 import logging
-from typing import Any, Union
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Tuple, Union
+
 import mariadb
 
+from src.lib.metrics import REGISTRY
+
 
-log = logging.getLogger()
+log = logging.getLogger(__name__)
+
+QUERY_SECONDS = REGISTRY.histogram(
+    'uhh_chess_sql_query_seconds', "Duration of SQL queries including the wait for a connection, by calling function.", ('query',),
+)
 
 
 class SQL:
-    def __init__(self, database: str, user: str, password : str, port: Union[int, None] = 3306 , host: Union[str, None] = "127.0.0.1") -> None:
+    # name of the SQL dialect, selects the migrations in `queries/migrations`
+    dialect = 'mariadb'
+    # errors after which a connection is closed instead of returned to the pool
+    discard_errors: Tuple = (mariadb.InterfaceError, mariadb.OperationalError)
+    # constraint violations, e.g. a duplicate primary key
+    integrity_errors: Tuple = (mariadb.IntegrityError,)
+
+    def __init__(
+            self, database: str, user: str, password : str, port: Union[int, None] = 3306 , host: Union[str, None] = "127.0.0.1",
+            pool_size: int = 8, acquire_timeout: float = 10.0, health_check_interval: float = 30.0,
+            ) -> None:
+        """Pool of MariaDB connections used from the event loop.
+
+        The blocking connector calls run in a dedicated thread pool, so a
+        query never blocks the event loop and concurrent games use separate
+        connections.
+
+        Args:
+            pool_size (int): Maximum number of open connections. Defaults to 8.
+            acquire_timeout (float): Seconds to wait for a free connection. Defaults to 10.
+            health_check_interval (float): Idle seconds after which a connection is pinged before reuse. Defaults to 30.
+        """
         self.host = host
         self.database = database
         self.user = user
         self.password = password
         self.port = port
-        self.conn = None
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
 
-    def connect(self):
+        self._idle: Deque[Tuple[mariadb.Connection, float]] = deque()
+        self._in_use = 0
+        self._slots = asyncio.Semaphore(pool_size)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='sql')
 
-        if self.conn:
+    async def connect(self):
+        """Open the first pool connection to detect a wrong configuration early."""
+        if self._idle or self._in_use:
             return
 
-        # Connect to MariaDB Platform
         try:
-            self.conn = mariadb.connect(
-                user=self.user,
-                password=self.password,
-                host=self.host,
-                port=self.port,
-                database=self.database,
-                reconnect=True,
-            )
+            async with self.connection():
+                pass
         except mariadb.Error as e:
             log.exception(f"Error connecting to MariaDB Platform: {e}")
-            self.conn = None
-            return
 
+    async def close(self):
+        """Close all idle connections."""
+        while self._idle:
+            conn, _ = self._idle.pop()
+            await self._run(self._close, conn)
+
+    def _connect(self) -> mariadb.Connection:
+        # Connect to MariaDB Platform
+        return mariadb.connect(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            port=self.port,
+            database=self.database,
+            reconnect=True,
+            autocommit=True,
+        )
+
+    @staticmethod
+    def _close(conn: mariadb.Connection):
+        try:
+            conn.close()
+        except mariadb.Error:
+            pass
+
+    @staticmethod
+    def _is_healthy(conn: mariadb.Connection) -> bool:
+        try:
+            conn.ping()
+            return True
+        except mariadb.Error:
+            return False
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
 
-    async def query(self, query : str, query_args : Any = None, first: bool = False):
-        self.connect()
+    async def _acquire(self) -> mariadb.Connection:
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No database connection available after {self.acquire_timeout}s. {self.stats()}")
+
+        try:
+            conn = None
+            while self._idle and conn is None:
+                conn, last_used = self._idle.pop()
+                if time.monotonic() - last_used > self.health_check_interval and not await self._run(self._is_healthy, conn):
+                    log.warning("Drop unhealthy database connection")
+                    await self._run(self._close, conn)
+                    conn = None
+
+            if conn is None:
+                conn = await self._run(self._connect)
+        except BaseException:
+            self._slots.release()
+            raise
 
+        self._in_use += 1
+        return conn
+
+    def _release(self, conn: mariadb.Connection, discard: bool = False):
+        self._in_use -= 1
+        if discard:
+            self._executor.submit(self._close, conn)
+        else:
+            self._idle.append((conn, time.monotonic()))
+        self._slots.release()
+
+    @asynccontextmanager
+    async def connection(self):
+        """Check out a pooled connection for the duration of the context.
+
+        Connections which fail with an interface or operational error or
+        whose query got cancelled are closed instead of being returned.
+        """
+        conn = await self._acquire()
+        try:
+            yield conn
+        except (*self.discard_errors, asyncio.CancelledError):
+            # a cancelled query may still run in its worker thread
+            self._release(conn, discard=True)
+            raise
+        except BaseException:
+            self._release(conn)
+            raise
+        else:
+            self._release(conn)
+
+    def stats(self) -> dict:
+        """Get the current pool state.
+
+        Returns:
+            dict: Pool size, idle and checked out connections.
+        """
+        return {
+            'pool_size': self.pool_size,
+            'idle': len(self._idle),
+            'in_use': self._in_use,
+        }
+
+    @staticmethod
+    def _execute(conn: mariadb.Connection, query : str, query_args : Any = None, first: bool = False):
         # print(query, query_args)
-        with self.conn.cursor(dictionary=True) as conn:
-            conn.execute(query, query_args)
-            self.conn.commit()
+        with conn.cursor(dictionary=True) as cursor:
+            cursor.execute(query, query_args)
             try:
-                result = (conn.fetchone() if first else conn.fetchall()) or {}
+                result = (cursor.fetchone() if first else cursor.fetchall()) or {}
             except mariadb.ProgrammingError:
-                return {'rowcount': conn.rowcount}
+                return {'rowcount': cursor.rowcount}
 
         # log.debug(f"DB result: {result}")
         return result
+
+    async def query(self, query : str, query_args : Any = None, first: bool = False, name: Union[str, None] = None):
+        """Run a single statement. Connections are in autocommit mode.
+
+        The duration is recorded under `name`, by default the name of the calling function.
+        """
+        if REGISTRY.enabled:
+            # read before the first await, afterwards the calling frame is the event loop
+            name = name or sys._getframe(1).f_code.co_name
+            start = time.perf_counter()
+
+        async with self.connection() as conn:
+            result = await self._run(self._execute, conn, query, query_args, first)
+
+        if REGISTRY.enabled:
+            QUERY_SECONDS.observe(time.perf_counter() - start, name)
+        return result
+
+    @staticmethod
+    def _open_cursor(conn: mariadb.Connection, query : str, query_args : Any = None):
+        cursor = conn.cursor(dictionary=True, buffered=False)
+        cursor.execute(query, query_args)
+        return cursor
+
+    async def stream(self, query : str, query_args : Any = None, batch_size: int = 1000) -> AsyncIterator[Dict]:
+        """Yield the rows of a query with an unbuffered cursor.
+
+        Rows are fetched from the server in batches of `batch_size`, so memory
+        stays constant for any result size. The connection is held until the
+        iteration ends.
+        """
+        async with self.connection() as conn:
+            cursor = await self._run(self._open_cursor, conn, query, query_args)
+            try:
+                while rows := await self._run(cursor.fetchmany, batch_size):
+                    for row in rows:
+                        yield row
+            finally:
+                await self._run(cursor.close)
+
+    @asynccontextmanager
+    async def session(self):
+        """Run several autocommitted statements on the same connection.
+
+        Needed for connection bound state such as `GET_LOCK()`.
+        """
+        async with self.connection() as conn:
+            yield Session(self, conn)
+
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: int = 300):
+        """Hold a named lock shared by all processes using the database.
+
+        Args:
+            name (str): Lock name.
+            timeout (int): Seconds to wait for the lock. Defaults to 300.
+
+        Raises:
+            TimeoutError: Raised if another process holds the lock for longer than `timeout`.
+
+        Yields:
+            Session: Connection which holds the lock.
+        """
+        async with self.session() as db:
+            res = await db.query("SELECT GET_LOCK(%(name)s, %(timeout)s) AS locked", {'name': name, 'timeout': timeout}, first=True)
+            if not res.get('locked'):
+                raise TimeoutError(f"Could not get the lock {name}")
+
+            try:
+                yield db
+            finally:
+                await db.query("SELECT RELEASE_LOCK(%(name)s)", {'name': name})
+
+    @staticmethod
+    def _begin(conn: mariadb.Connection):
+        conn.begin()
+
+    @staticmethod
+    def _rollback(conn: mariadb.Connection):
+        try:
+            conn.rollback()
+        except mariadb.Error:
+            log.exception("Rollback failed")
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Group statements into one transaction on one connection.
+
+        The transaction is committed when the context exits and rolled back
+        if it raises.
+
+        Example:
+            async with sql_conn.transaction() as tx:
+                await tx.query("INSERT ...", {...})
+                await tx.query("UPDATE ...", {...})
+        """
+        async with self.connection() as conn:
+            await self._run(self._begin, conn)
+            try:
+                yield Transaction(self, conn)
+            except Exception:
+                await self._run(self._rollback, conn)
+                raise
+
+            await self._run(conn.commit)
+
+
+class Session:
+    """Statements on one pooled connection created by `SQL.session()`. Offers the same `query()` as `SQL`."""
+
+    def __init__(self, sql: SQL, conn: mariadb.Connection) -> None:
+        self.sql = sql
+        self.conn = conn
+
+    async def query(self, query : str, query_args : Any = None, first: bool = False, name: Union[str, None] = None):
+        if REGISTRY.enabled:
+            name = name or sys._getframe(1).f_code.co_name
+            start = time.perf_counter()
+
+        result = await self.sql._run(self.sql._execute, self.conn, query, query_args, first)
+
+        if REGISTRY.enabled:
+            QUERY_SECONDS.observe(time.perf_counter() - start, name)
+        return result
+
+
+class Transaction(Session):
+    """Unit of work created by `SQL.transaction()`."""
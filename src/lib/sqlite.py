@@ -0,0 +1,186 @@
+import asyncio
+import fcntl
+import logging
+import re
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from src.lib.sql import SQL
+
+log = logging.getLogger(__name__)
+
+# TIMESTAMP columns are read as datetime like with MariaDB, datetimes are stored as ISO text
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+PARAMETER_PATTERN = re.compile(r'%\((\w+)\)s')
+INSERT_IGNORE_PATTERN = re.compile(r'\bINSERT\s+IGNORE\b', re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def translate(query: str) -> str:
+    """Rewrite a query written for MariaDB to SQLite.
+
+    Replaces the `%(name)s` parameters with `:name` and `INSERT IGNORE` with
+    `INSERT OR IGNORE`. `NOW()` and `MOD()` are provided as functions on each
+    connection.
+
+    Args:
+        query (str): MariaDB query.
+
+    Returns:
+        str: SQLite query.
+    """
+    query = PARAMETER_PATTERN.sub(r':\1', query)
+    return INSERT_IGNORE_PATTERN.sub('INSERT OR IGNORE', query)
+
+
+def _dict_factory(cursor: sqlite3.Cursor, row: Tuple) -> Dict:
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+def _now() -> str:
+    return datetime.now().isoformat(' ', 'milliseconds')
+
+
+def _mod(dividend, divisor):
+    if dividend is None or not divisor:
+        return None
+    # the result has the sign of the dividend like in MariaDB
+    remainder = abs(dividend) % abs(divisor)
+    return remainder if dividend >= 0 else -remainder
+
+
+class SQLite(SQL):
+    """Embedded SQLite database with the interface of `SQL`.
+
+    The database file is opened in WAL mode, so readers do not block the
+    writer and every pooled connection reads concurrently. Writes are
+    serialized by SQLite; a connection waits up to `busy_timeout` for the write
+    lock. Queries are written for MariaDB and translated by `translate()`.
+    """
+
+    dialect = 'sqlite'
+    discard_errors: Tuple = (sqlite3.InterfaceError,)
+    integrity_errors: Tuple = (sqlite3.IntegrityError,)
+
+    def __init__(
+            self, path: str, pool_size: int = 8, acquire_timeout: float = 10.0, health_check_interval: float = 30.0,
+            busy_timeout: float = 5.0,
+            ) -> None:
+        """
+        Args:
+            path (str): Database file, created if missing.
+            pool_size (int): Maximum number of open connections. Defaults to 8.
+            acquire_timeout (float): Seconds to wait for a free connection. Defaults to 10.
+            health_check_interval (float): Idle seconds after which a connection is checked before reuse. Defaults to 30.
+            busy_timeout (float): Seconds to wait for the write lock of the database. Defaults to 5.
+        """
+        super().__init__(
+            database=str(path), user=None, password=None, port=None, host=None,
+            pool_size=pool_size, acquire_timeout=acquire_timeout, health_check_interval=health_check_interval,
+        )
+        self.path = Path(path)
+        self.busy_timeout = busy_timeout
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            # autocommit, transactions are started by `_begin`
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.row_factory = _dict_factory
+        conn.create_function('NOW', 0, _now)
+        conn.create_function('MOD', 2, _mod, deterministic=True)
+        conn.execute("PRAGMA journal_mode = WAL")
+        # WAL stays consistent without a sync per commit, only the last commits can be lost on power failure
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    @staticmethod
+    def _close(conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    @staticmethod
+    def _execute(conn: sqlite3.Connection, query : str, query_args : Any = None, first: bool = False):
+        cursor = conn.execute(translate(query), query_args or ())
+        try:
+            if cursor.description is None:
+                return {'rowcount': cursor.rowcount}
+            return (cursor.fetchone() if first else cursor.fetchall()) or {}
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _open_cursor(conn: sqlite3.Connection, query : str, query_args : Any = None):
+        return conn.execute(translate(query), query_args or ())
+
+    @staticmethod
+    def _begin(conn: sqlite3.Connection):
+        # take the write lock at the start, a deferred transaction can fail to upgrade its read lock
+        conn.execute("BEGIN IMMEDIATE")
+
+    @staticmethod
+    def _rollback(conn: sqlite3.Connection):
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            log.exception("Rollback failed")
+
+    @staticmethod
+    def _try_lock(lock_file) -> bool:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    @asynccontextmanager
+    async def lock(self, name: str, timeout: int = 300):
+        """Hold a named lock shared by all processes using the database file.
+
+        SQLite has no named locks, a lock file next to the database is locked instead.
+
+        Args:
+            name (str): Lock name.
+            timeout (int): Seconds to wait for the lock. Defaults to 300.
+
+        Raises:
+            TimeoutError: Raised if another process holds the lock for longer than `timeout`.
+
+        Yields:
+            Session: Connection which holds the lock.
+        """
+        with open(self.path.with_name(f"{self.path.name}.{name}.lock"), 'w') as lock_file:
+            deadline = time.monotonic() + timeout
+            while not self._try_lock(lock_file):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Could not get the lock {name}")
+                await asyncio.sleep(0.1)
+
+            try:
+                async with self.session() as db:
+                    yield db
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from pathlib import Path, PurePosixPath
+from typing import Dict, Tuple, Union
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+# text formats worth compressing, images and web fonts like woff2 are compressed already
+COMPRESSIBLE_SUFFIXES = ('.css', '.js', '.json', '.map', '.svg', '.html', '.txt', '.md', '.ttf', '.otf', '.eot')
+# a variant is only kept if it saves at least this share of the size
+MIN_SAVING = 0.1
+HASH_LENGTH = 12
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'
+# unhashed URLs, e.g. imports in scripts, are revalidated with the ETag on every use
+CACHE_REVALIDATE = 'no-cache'
+
+
+class Asset:
+    """A static file with its content hash and precompressed variants."""
+
+    def __init__(self, path: Path, digest: str, variants: Dict[str, Path]) -> None:
+        self.path = path
+        self.digest = digest
+        self.variants = variants
+        self.media_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+
+
+def hashed_path(path: str, digest: str) -> str:
+    """Insert the content hash before the suffix, e.g. `js/game.js` to `js/game.3f9a1c0e2b4d.js`.
+
+    The file stays in its directory, so relative URLs in stylesheets still resolve.
+    """
+    path = PurePosixPath(path)
+    return str(path.with_name(f"{path.stem}.{digest[:HASH_LENGTH]}{path.suffix}"))
+
+
+def _accepted_encodings(accept_encoding: str) -> Tuple[str, ...]:
+    encodings = []
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        params = params.strip()
+        try:
+            quality = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            quality = 1.0
+
+        if quality > 0:
+            encodings.append(name.strip().lower())
+    return tuple(encodings)
+
+
+class StaticAssets(StaticFiles):
+    """Serve `src/static` with content hashed URLs and precompressed variants.
+
+    All files are hashed when the app starts. Text files get gzip and, if the
+    optional `brotli` package is installed, brotli variants in `cache_dir`,
+    named by content hash, so a restart only compresses changed files.
+
+    Hashed URLs (see `url()`) are cached by browsers for a year without
+    revalidation. The original URLs stay available with `no-cache`. Both send a
+    strong ETag and answer a matching `If-None-Match` with 304.
+    """
+
+    def __init__(self, directory: Path, cache_dir: Path, url_prefix: str = '/static') -> None:
+        """
+        Args:
+            directory (Path): Directory of the static files.
+            cache_dir (Path): Directory of the compressed variants, created if missing.
+            url_prefix (str): Path the app is mounted at. Defaults to '/static'.
+        """
+        super().__init__(directory=directory)
+        self.source_dir = Path(directory)
+        self.cache_dir = Path(cache_dir)
+        self.url_prefix = url_prefix.rstrip('/')
+
+        # URL path below the prefix mapped to the asset and whether the URL is hashed
+        self.assets: Dict[str, Tuple[Asset, bool]] = {}
+        # original path mapped to hashed path
+        self.hashed: Dict[str, str] = {}
+
+        self.build()
+
+    def build(self) -> None:
+        """Hash all files and write the missing compressed variants."""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        variants = 0
+
+        for file in sorted(self.source_dir.rglob('*')):
+            if not file.is_file():
+                continue
+
+            content = file.read_bytes()
+            digest = hashlib.sha256(content).hexdigest()
+            asset = Asset(file, digest, self._compress(content, digest, file.suffix) if file.suffix in COMPRESSIBLE_SUFFIXES else {})
+            variants += len(asset.variants)
+
+            path = file.relative_to(self.source_dir).as_posix()
+            self.hashed[path] = hashed_path(path, digest)
+            self.assets[path] = (asset, False)
+            self.assets[self.hashed[path]] = (asset, True)
+
+        log.info("Prepared %s static files with %s compressed variants", len(self.hashed), variants)
+
+    def _compress(self, content: bytes, digest: str, suffix: str) -> Dict[str, Path]:
+        compressors = [('gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            compressors.insert(0, ('br', '.br', lambda data: brotli.compress(data, quality=11)))
+
+        variants = {}
+        for encoding, extension, compress in compressors:
+            path = self.cache_dir / f"{digest}{suffix}{extension}"
+            if not path.exists():
+                data = compress(content)
+                if len(data) > len(content) * (1 - MIN_SAVING):
+                    continue
+
+                # several workers may build at the same time, the replace is atomic
+                temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                temp_path.write_bytes(data)
+                temp_path.replace(path)
+
+            variants[encoding] = path
+
+        return variants
+
+    def url(self, path: str) -> str:
+        """Get the URL of a static file, hashed if the file is known.
+
+        Available as `static_url()` in the templates.
+
+        Args:
+            path (str): Path below the static directory, e.g. `js/game.js`.
+
+        Returns:
+            str: URL, e.g. `/static/js/game.3f9a1c0e2b4d.js`.
+        """
+        return f"{self.url_prefix}/{self.hashed.get(path, path)}"
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        entry = self.assets.get(PurePosixPath(*Path(path).parts).as_posix())
+        if entry is None or scope['method'] not in ('GET', 'HEAD'):
+            # files added after the start are served without variants
+            return await super().get_response(path, scope)
+
+        asset, immutable = entry
+        request_headers = Headers(scope=scope)
+        accepted = _accepted_encodings(request_headers.get('accept-encoding', ''))
+        encoding: Union[str, None] = next((encoding for encoding in asset.variants if encoding in accepted), None)
+
+        # each variant has its own strong ETag
+        etag = f"{asset.digest[:2 * HASH_LENGTH]}-{encoding}" if encoding else asset.digest[:2 * HASH_LENGTH]
+        headers = {
+            'cache-control': CACHE_IMMUTABLE if immutable else CACHE_REVALIDATE,
+            'etag': f'"{etag}"',
+            'vary': 'Accept-Encoding',
+        }
+
+        if_none_match = request_headers.get('if-none-match')
+        if if_none_match and (if_none_match.strip() == '*' or headers['etag'] in (tag.strip() for tag in if_none_match.split(','))):
+            return Response(status_code=304, headers=headers)
+
+        if encoding:
+            headers['content-encoding'] = encoding
+            return FileResponse(asset.variants[encoding], headers=headers, media_type=asset.media_type)
+
+        return FileResponse(asset.path, headers=headers, media_type=asset.media_type)
@@ -1,222 +1,151 @@
-from configparser import NoOptionError, NoSectionError
+import asyncio
 import logging
-import json
+import time
 import traceback
-from typing import Tuple, Union, List, Dict
+from typing import Union, List, Dict
 from datetime import datetime, timedelta
-from pathlib import Path
 
-from fastapi import Request
 import chess
 import chess.engine
-from chess import BLACK, SQUARE_NAMES, COLOR_NAMES, PIECE_SYMBOLS, Piece, piece_symbol, square_file
-from fastapi.responses import JSONResponse
-
-from src import log, config
-from src.lib.constants import TIMESTAMP_FORMAT, GAME_DATA_SAVE_DIR
-from src.lib.helper import json_serial
-from src.lib.sql import SQL
-
-log = logging.getLogger()
+from chess import SQUARE_NAMES, COLOR_NAMES
+
+from src.lib.constants import TIMESTAMP_FORMAT
+from src.lib.engine_pool import EnginePool
+from src.lib.game_export import GameExporter
+from src.lib.metrics import REGISTRY
+from src.lib.move_cache import MoveCache
+from src.lib.request_timing import span
+from src.lib.resource_scheduler import ResourceScheduler
+from src.lib.search_limits import LimitController
+from src.lib.search_queue import EngineBusy, SearchQueue
+from src.lib.move_codec import encode_move, fen_checkpoint
+from src.lib.session_cache import GameSession, SessionCache
+from src.lib.sql import SQL, Transaction
+
+log = logging.getLogger(__name__)
+
+PLAY_SECONDS = REGISTRY.histogram('uhh_chess_engine_play_seconds', "Duration of engine searches, without the wait for an engine.")
+
+# queries of the request path, checked for full scans by `migrate.py --explain`
+MOVE_DURATION_QUERY = """
+    SELECT
+        t_stamp
+    FROM
+        moves
+    WHERE
+        game_id = %(game_id)s AND
+        MOD(ply, 2) = 0  -- engine moves
+    ORDER BY
+        ply DESC
+    LIMIT 1
+"""
+REDIRECT_DATA_QUERY = """
+    SELECT
+        id as game_id,
+        game_number + 1 as new_game_number,
+        first_game_start,
+        redirect_url,
+        user_id,
+        user_elo,
+        (SELECT TRUE) as game_end
+    FROM
+        games
+    WHERE
+        id = %(game_id)s
+"""
 
 
 class Stockfish():
-    async def __init__(self, path: str, token: str, sql_conn: SQL, game_id: int, 
-        depth: int = 20, nodes: int = None, redirect_url: str | None = None,
-        max_user_draw_time: float = 30.0,  engine_options = None, game_number: int | None = None,
-        first_game_start: datetime | None = datetime.now() ) -> None:
-
-        self.start = datetime.now()
-        self.engine = chess.engine.SimpleEngine.popen_uci(str(path))
-
-        self.board = chess.Board()
-        self.game_id = game_id
+    async def __init__(self, engine_pool: EnginePool, session: GameSession, sql_conn: SQL, session_cache: SessionCache,
+        move_cache: MoveCache, scheduler: ResourceScheduler, search_queue: SearchQueue, limits: LimitController, exporter: GameExporter, max_user_draw_time: float = 30.0,  engine_options = None,
+        game_lock: Union[asyncio.Lock, None] = None) -> None:
+
+        self.start = session.start or datetime.now()
+        # engines are only checked out for the duration of a search
+        self.engine_pool = engine_pool
+        self.engine_options = engine_options or {}
+        self.move_cache = move_cache
+        self.scheduler = scheduler
+        self.search_queue = search_queue
+        self.limits = limits
+        self.exporter = exporter
+
+        self.board = session.board.copy()
+        self.session = session
+        self.session_cache = session_cache
+        self.game_id = session.game_id
         self.end_reason = "Unkown (Default value)"
-        self.first_game_start = first_game_start
+        self.first_game_start = session.first_game_start or datetime.now()
         self.max_game_time = 20  # in minutes
-        self.token = token
+        self.token = session.token
         self.sql_conn = sql_conn
+        self._pending_moves: List[Dict] = []
+        # shared by all handlers of this game, see `move()`
+        self.game_lock = game_lock or asyncio.Lock()
 
-        self.redirect_url = redirect_url
-        self.game_number = game_number
+        self.redirect_url = session.redirect_url
+        self.game_number = session.game_number
         self.max_user_draw_time = max_user_draw_time
-        self.thinking_time = chess.engine.Limit(
-            time=0.1,
-            depth=depth,
-            nodes=nodes,
-            )
-
-        #  make shure the white player starts
-        if self.board.turn == BLACK:
-            self.chess.Move.null()
-
-        # set UCI settings
-        if engine_options:
-            self.engine.configure(engine_options)
 
-        await self._load_existing_game_data()
-        log.info(f"Start engine with: {self.__dict__}")
-
-
-    async def close(self):
-        """Stop and close engine."""
-        if self.engine:
-            self.engine.close()
+        log.debug("Start engine with: %s", self.__dict__)
 
     async def __new__(cls, *a, **kw):
         instance = super().__new__(cls)
         await instance.__init__(*a, **kw)
         return instance
 
-    async def _load_existing_game_data(self):
-        """Load existing game data into current instance."""
-        await self.load_fen()
-        await self._load_existing_start_time()
-
-    async def _load_existing_start_time(self):
-        """Load game start time."""
-        res = await self.sql_conn.query("""
-            SELECT
-                start
-            FROM
-                games
-            WHERE
-                games.id = %(game_id)s
-            """,
-            {'game_id': self.game_id},
-            first=True,
-        )
-
-        if res.get('start'):
-            self.start = res['start']
-
     async def _save_move(
-            self,source: str, target: str, piece: Union[Piece, None], 
-            old_fen: str, new_fen: str, timestamp: Union[datetime, None] = None, promotion_symbol: PIECE_SYMBOLS = None
+            self, move: chess.Move, timestamp: Union[datetime, None] = None,
+            limit: Union[chess.engine.Limit, None] = None, source: Union[str, None] = None,
             ) -> None:
-        """Insert move into database.
+        """Queue a move for insertion. The moves are written by `_save_moves`.
+
+        Must be called after the move was pushed to `self.board`, its length is the ply number.
+        Moves are stored as 16 bit code, see `src.lib.move_codec`.
 
         Arguments:
-            source(str): Move source field
-            target(str): Move target field
-            piece(Union[Piece, None]): Moved piece. If None it will be calculated by old_fen and new_fen.
-            old_fen(str): FEN before move
-            new_fen(str): FEN after move
+            move(chess.Move): Pushed move
             timestamp(Union[datetime, None]): date and time of move. Defaults to None.
-            promotion_symbol(chess.PIECE_SYMBOLS): Symbol of promotion, Defaults to None.
+            limit(Union[chess.engine.Limit, None]): Search limit of an engine move. Defaults to None.
+            source(Union[str, None]): Where an engine move came from: 'engine', 'cache' or 'book'. Defaults to None.
 
         """
-        if piece is None:
-            piece = chess.Board(old_fen).piece_at(chess.parse_square(source))
+        self._pending_moves.append({
+            'ply': len(self.board.move_stack),
+            'move_code': encode_move(move),
+            'fen_checkpoint': fen_checkpoint(self.board),
+            't_stamp': timestamp or datetime.now(),
+            'search_time': limit.time if limit else None,
+            'search_depth': limit.depth if limit else None,
+            'search_nodes': limit.nodes if limit else None,
+            'search_source': source,
+        })
+
+    async def _save_moves(self, db: Union[SQL, Transaction]) -> None:
+        """Insert all queued moves with one multi-row INSERT.
 
-        await self.sql_conn.query("""
-            INSERT INTO chess.moves
-                (game_id, source, target, old_fen, new_fen, piece, promotion_symbol, t_stamp, castling, color)
+        Args:
+            db (Union[SQL, Transaction]): Connection or transaction to write with.
+        """
+        if not self._pending_moves:
+            return
+
+        columns = ('ply', 'move_code', 'fen_checkpoint', 't_stamp', 'search_time', 'search_depth', 'search_nodes', 'search_source')
+        args = {'game_id': self.game_id}
+        rows = []
+        for i, pending_move in enumerate(self._pending_moves):
+            rows.append("(%(game_id)s, " + ", ".join(f"%({column}_{i})s" for column in columns) + ")")
+            args.update({f"{column}_{i}": pending_move[column] for column in columns})
+
+        await db.query(f"""
+            INSERT INTO moves
+                (game_id, {', '.join(columns)})
             VALUES
-                (
-                    (SELECT id FROM games WHERE token = %(token)s), %(source)s, %(target)s, %(old_fen)s, %(new_fen)s, %(piece)s, %(promotion_symbol)s, NOW(3), %(castling)s, %(color)s
-                )
-
+                {', '.join(rows)}
             """,
-            {
-                'token': self.token,
-                'source': source,
-                'target': target,
-                'old_fen': old_fen,
-                'new_fen': new_fen,
-                'castling': await self.get_castling(
-                    old_fen=old_fen,
-                    move = chess.Move(
-                        chess.parse_square(source),
-                        chess.parse_square(target),
-                    )
-                ),
-                'piece': piece.symbol(),
-                'color': COLOR_NAMES[piece.color],
-                'promotion_symbol': promotion_symbol,
-                't_stamp': timestamp.strftime(TIMESTAMP_FORMAT)[:3] if timestamp else None,
-            },
-        )
-
-    async def _get_all_moves(self) -> Tuple[chess.Move]:
-        """Load all moves from database
-
-        Returns:
-            Tuple[chess.Move]: List of moves
-
-        """
-        res = await self.sql_conn.query("""
-            SELECT
-                moves.source, moves.target, moves.promotion_symbol
-            FROM
-                chess.moves
-            RIGHT JOIN
-                chess.games
-            ON 
-                games.id = moves.game_id
-            WHERE
-                games.token = %(token)s
-            ORDER BY
-                moves.t_stamp ASC;
-        """, 
-        {'token': self.token}
+            args,
         )
-        log.debug(f"res: {res}")
-
-        moves: List[chess.Move] = []
-        for entry in res:
-            moves.append(
-                chess.Move(
-                    chess.parse_square(entry['source']),
-                    chess.parse_square(entry['target']),
-                    promotion=PIECE_SYMBOLS.index(entry['promotion_symbol'])
-                )
-            )
-            
-        return moves
-
-    async def load_fen(self, set_fen: bool = True) -> str:
-        """Load the latest FEN from database.
-
-        Arguments:
-            set_fen(bool): Should the loaded FEN set to Stockfish. Defaults to True.
-
-        Returns:
-            str: Loaded FEN if found else an emptry string.
-        """
-        res = await self.sql_conn.query("""
-            SELECT
-                new_fen
-            FROM
-                chess.moves
-            RIGHT JOIN
-                chess.games
-            ON 
-                games.id = moves.game_id
-            WHERE
-                games.token = %(token)s
-            ORDER BY
-                moves.t_stamp DESC
-            LIMIT 1;
-        """, 
-        {'token': self.token},
-        first=True
-        )
-
-        log.debug(f"res: {res}")
-
-        #  make shure the white player starts
-        if self.board.turn == BLACK:
-            self.chess.Move.null()
-
-        if fen := res.get('new_fen'):
-            if set_fen:
-                # do each move to detect some end rules
-                for curr_move in await self._get_all_moves():
-                    self.board.push(curr_move)
-            return fen
-
-        return ""
+        self._pending_moves.clear()
 
     async def _get_move_duration(self) -> float:
         """Load last KI move and calculate user draw time.
@@ -224,18 +153,8 @@ class Stockfish():
         Returns:
             float: Move duration.
         """
-        res = await self.sql_conn.query("""
-                SELECT
-                    t_stamp
-                FROM
-                    moves
-                WHERE
-                    game_id = %(game_id)s AND
-                    piece != NULL
-                ORDER BY
-                    t_stamp DESC
-                LIMIT 1
-            """,
+        res = await self.sql_conn.query(
+            MOVE_DURATION_QUERY,
             {'game_id': self.game_id},
             first=True
         )
@@ -258,153 +177,52 @@ class Stockfish():
         }
 
     async def check_game_end(self) -> bool:
-        """Check if the game is finished. If yes then the data will be written to the output file
+        """Check if the game is finished. The end is saved by `move()` together with the moves.
 
         Returns:
             bool: Game finished
         """
         end_results = await self.get_end_results()
-        log.debug(f"end_results: {end_results}")
+        log.debug("end_results: %s", end_results)
 
         if any(end_results.values()):
-            print("Game Ends! Saving reason..")
+            log.debug("Game ends, saving reason")
             if end_results['total_timeout']:
                 self.end_reason = f"Total timeout of {self.max_game_time}min reached"
 
-            await self._save_end_reason()
-            await self.write_game_data()
             return True
 
         return False
 
-    async def _save_end_reason(self):
-        """Save the end reason with player color (only if there is a winner)"""
-        log.debug(f"self.board.outcome(): {self.board.outcome()}")
+    async def _save_end_reason(self, db: Union[SQL, Transaction]):
+        """Save the end reason with player color (only if there is a winner)
 
+        Args:
+            db (Union[SQL, Transaction]): Connection or transaction to write with.
+        """
         outcome = self.board.outcome()
-        log.debug(f"outcome: {outcome}")
+        log.debug("outcome: %s", outcome)
 
         args = {
             'end_reasons': outcome.termination.name if outcome else self.end_reason,
             'winner': COLOR_NAMES[outcome.winner] if outcome and outcome.winner else "",
-            'token': self.token
+            'stop': datetime.now(),
+            'game_id': self.game_id,
         }
 
-        log.debug(f"args: {args}")
+        log.debug("args: %s", args)
         # insert game end reason and remove token to disable loading
-        res = await self.sql_conn.query("""
+        res = await db.query("""
                 UPDATE games SET
                     end_reasons = %(end_reasons)s,
                     winning_color = %(winner)s,
-                    stop = NOW()
+                    stop = %(stop)s
                 WHERE
-                    token = %(token)s
+                    id = %(game_id)s
             """,
             query_args=args
         )
-        log.debug(f"res: {res}")
-
-    async def _load_game_output_data(self) -> List:
-        """Load all required game data wich must be stored in the output file."""
-        return await self.sql_conn.query("""
-            SELECT
-                start, stop,
-                user_elo, ki_elo,
-                game_number,
-                user_id, end_reasons,
-                winning_color,
-                source, target,
-                new_fen, old_fen,
-                piece,t_stamp,
-                castling, color
-            FROM
-                games
-            INNER JOIN
-                moves
-            ON
-                moves.game_id = games.id
-            WHERE
-                games.id = %(game_id)s
-            ORDER BY
-                moves.t_stamp ASC
-            """,
-            {'game_id': self.game_id}
-        )
-
-    async def calc_game_data(self) -> List:
-        """Load and calculate data wich must be stored in the output file.
-
-        Calculated entries: draw_time, overdrawn, move_number, user_move_count, avg_move_duration
-
-        Returns:
-            List: _description_
-        """
-        game_data = await self._load_game_output_data()
-        user_draw_times = []
-
-        for i in range(0 ,len(game_data)):
-            # check if move tooks more than in self.max_user_draw_time allowed
-            game_data[i]['overdrawn'] = False
-            prev_draw_ts = game_data[i-1]['t_stamp'] if not i == 0 else game_data[0]['start']
-            cur_draw_ts = game_data[i]['t_stamp']
-            if prev_draw_ts + timedelta(seconds=self.max_user_draw_time) < cur_draw_ts:
-                game_data[i]['overdrawn'] = True
-
-            # get move duration
-            draw_time: timedelta = cur_draw_ts - prev_draw_ts
-
-            game_data[i]['draw_time'] = round(draw_time.total_seconds(), 3)
-            user_draw_times.append(
-                draw_time
-            )
-
-            game_data[i]['move_number'] = i + 1
-
-        user_move_count = len(user_draw_times)
-        game_data[-1]['user_move_count'] = user_move_count
-        game_data[-1]['avg_move_duration'] = round(
-            (sum(user_draw_times, timedelta()) / user_move_count).total_seconds(), 3
-        )
-
-        return game_data
-
-    async def get_output_path(self, user_id: int, game_number: int) -> Path:
-        """Get the filepath where to store the game output data.
-
-        Args:
-            user_id (int): Current user ID
-            game_number (int): Number of the Game of current user
-
-        Returns:
-            Path: Target filepath
-        """
-        try:
-            output_dir = Path(config.get('game', 'data_save_dir'))
-        except (NoOptionError, NoSectionError):
-            output_dir = GAME_DATA_SAVE_DIR
-
-        output_dir = output_dir / f"{user_id}"
-        output_dir.mkdir(parents=True, exist_ok=True)
-
-        file_path = output_dir  / f"{user_id}_{game_number}_{self.token}.json"
-        log.info(f"Save game data to: {file_path.absolute()}")
-
-        return file_path
-
-    async def write_game_data(self) -> None:
-        """Save game data as JSON in `constants.GAME_DATA_SAVE_DIR`."""
-        game_data = await self.calc_game_data()
-        file_path = await self.get_output_path(
-            game_data[-1]['user_id'],
-            game_data[-1]['game_number']
-        )
-
-        try:
-            with open(file_path, 'w+') as file:
-                json.dump(game_data, file, indent=4, ensure_ascii=False, default=json_serial)
-        except Exception:
-            log.exception(traceback.format_exc())
-            log.error(f"Save game data Failed! Token: {self.token}")
+        log.debug("res: %s", res)
 
     async def _ki_move(self) -> chess.Move:
         """Run engine move and write to database.
@@ -413,71 +231,58 @@ class Stockfish():
             Tuple[chess.Move, bool]: KI move and whether the game was finished. 
         """
 
-        old_fen = self.board.fen()
-        ki_move = self.engine.play(self.board, self.thinking_time, game=self.game_id).move
+        elo = self.engine_options.get('UCI_Elo')
+        # the limit depends on the load, so it is picked before the cache lookup which is keyed by it
+        limit = self.limits.limit(elo, self.search_queue.load())
+        ki_move, source = self.move_cache.lookup(self.board, elo, limit)
+
+        if ki_move is None:
+            source = 'engine'
+            search_start = time.monotonic()
+            # wait for admission and free threads, then check out a warm engine with the per-game UCI settings
+            async with self.search_queue.slot(self.game_id), self.scheduler.search():
+                try:
+                    engine = await self.engine_pool.acquire(self.engine_options)
+                except (TimeoutError, MemoryError) as e:
+                    raise EngineBusy(str(e), self.search_queue.retry_after()) from e
+
+                try:
+                    with PLAY_SECONDS.time(), span('search'):
+                        ki_move = (await engine.play(self.board, limit, game=self.game_id)).move
+                finally:
+                    await self.engine_pool.release(engine)
+
+            self.limits.record(time.monotonic() - search_start)
+            self.move_cache.store(self.board, elo, limit, ki_move)
+
         self.board.push(ki_move)
 
-        await self._save_move(
-            source=SQUARE_NAMES[ki_move.from_square],
-            target=SQUARE_NAMES[ki_move.to_square],
-            piece=None,
-            old_fen=old_fen,
-            new_fen=self.board.fen(),
-            timestamp=datetime.now(),
-            promotion_symbol=piece_symbol(ki_move.promotion) if ki_move.promotion else None # ki promotion can be every possible piece
-        )
+        # ki promotion can be every possible piece
+        await self._save_move(ki_move, timestamp=datetime.now(), limit=limit, source=source)
 
         return ki_move
 
-    async def _delete_token(self):
-        """Set game token in db to NULL"""
-        await self.sql_conn.query("UPDATE games SET token = %(token)s", {'token': self.token})
-
-    @staticmethod
-    async def get_castling(old_fen: str, move: chess.Move) -> str:
-        """Get castling notation.
-
-        https://de.wikipedia.org/wiki/Forsyth-Edwards-Notation#Rochaderechte-Kodierung
+    async def _delete_token(self, db: Union[SQL, Transaction]):
+        """Set game token in db to NULL
 
         Args:
-            old_fen (str): FEN before move.
-            fen2 (chess.Move): Current move.
-
-        Returns:
-            str: Castle notation
+            db (Union[SQL, Transaction]): Connection or transaction to write with.
         """
-        
-
-        if chess.Board(old_fen).is_castling(move):
-            if square_file(move.to_square) > square_file(move.from_square):  # kingside castling move
-                return '0-0'
-            elif square_file(move.to_square) < square_file(move.from_square):  # queenside castling move
-                return '0-0-0'
+        await db.query("UPDATE games SET token = NULL WHERE id = %(game_id)s", {'game_id': self.game_id})
 
-        return ''
-
-    async def get_redirect_data(self) -> Dict:
+    async def get_redirect_data(self, db: Union[SQL, Transaction, None] = None) -> Dict:
         """Load redirect data from database.
+
+        Args:
+            db (Union[SQL, Transaction, None]): Connection or transaction to read with. Defaults to `self.sql_conn`.
         
         Returns:
             dict: reqired data vor redirect.
         """
         log.debug("Load redirect data from database")
-        return await self.sql_conn.query(
-            """
-            SELECT 
-                id as game_id,
-                game_number + 1 as new_game_number,
-                first_game_start,
-                redirect_url,
-                user_id,
-                user_elo,
-                (SELECT TRUE) as game_end
-            FROM 
-                games
-            WHERE
-                token = %(token)s;
-            """, {'token': self.token},
+        return await (db or self.sql_conn).query(
+            REDIRECT_DATA_QUERY,
+            {'game_id': self.game_id},
             first=True
         )
 
@@ -491,79 +296,106 @@ class Stockfish():
         """
         user_move = chess.Move.from_uci(f"{move_data['source']}{move_data['target']}{'q' if move_data['promotion'] else ''}")
 
-        log.debug(f"promotion: {user_move.promotion}")
-        log.debug(f"move: {user_move}")
+        log.debug("promotion: %s", user_move.promotion)
+        log.debug("move: %s", user_move)
 
         # check if user move legal 
         if user_move not in self.board.legal_moves:
-            log.debug(f"Illegal move: {user_move}")
+            log.debug("Illegal move: %s", user_move)
             return {'error': True, 'info': "Illegal move!"}
 
         # user move
-        user_old_fen = self.board.fen()
         self.board.push(user_move)
 
-        # save user move
-        await self._save_move(
-            source=move_data['source'],
-            target=move_data['target'],
-            piece=Piece.from_symbol(move_data['piece'][-1]),
-            old_fen=user_old_fen,
-            new_fen=self.board.fen(),
-            timestamp=datetime.now(),
-            promotion_symbol=piece_symbol(user_move.promotion) if user_move.promotion else None  # user promotion currently only 'Q'
-        )
+        # save user move, user promotion currently only 'Q'
+        await self._save_move(user_move, timestamp=datetime.now())
 
-    async def move(self, request: Request) -> dict:
+    async def move(self, data: Dict[str, str]) -> dict:
         """Validate the move and save the results in the database.
 
+        Used by the REST route and the WebSocket channel. Moves of one game run
+        one at a time; a move waiting for the lock continues from the board
+        saved by the move before.
+
         Args:
-            request (Request): Current API request.
-            game_id (int): Game ID.
+            data (Dict[str, str]): Move of the user with source, target and promotion.
 
         Returns:
-            dict: Engine move and game end.
+            dict: Engine move and game end, or an error.
         """
-        data = (await request.json()).get('data')
-        log.debug(f"data: {data}")
-
-        if not data:
-            log.info("No data in request found!")
-            return JSONResponse({'error': True, 'info': "Missing data!"}, status_code=500)
-
+        log.debug("data: %s", data)
+
+        async with self.game_lock:
+            if self.session_cache.is_invalid(self.token):
+                return {'error': True, 'info': "Game is already finished."}
+
+            # the session board is only replaced after a move is saved
+            if len(self.session.board.move_stack) != len(self.board.move_stack):
+                self.board = self.session.board.copy()
+            self._pending_moves.clear()
+
+            try:
+                return await self._move(data)
+            except self.sql_conn.integrity_errors:
+                # a move of another handler or worker took the same ply
+                log.info("Move of game %s conflicts with a saved move", self.game_id, exc_info=True)
+                self.session_cache.pop(self.token)
+                return {'error': True, 'info': "Move conflicts with another move of this game."}
+
+    async def _move(self, data: Dict[str, str]) -> dict:
         # do user move
         try:
-            await self._user_move(data)
+            with span('user_move'):
+                error = await self._user_move(data)
+            if error:
+                return error
         except ValueError:
             return {'error': True, 'info': "Null move!"}
         except Exception:
-            print(traceback.format_exc())
+            log.info("Invalid move data: %s", data, exc_info=True)
             return {'error': True, 'info': "Invalid move or data."}
 
-        result = {
-            'game_end': await self.check_game_end(),
-        }
+        with span('game_end'):
+            result = {
+                'game_end': await self.check_game_end(),
+            }
 
         if not result['game_end']:
-            # engine move
-            ki_move= await self._ki_move()
+            # engine move, includes the wait for admission and an engine
+            with span('ki_move'):
+                ki_move= await self._ki_move()
             result['move'] = (SQUARE_NAMES[ki_move.from_square], SQUARE_NAMES[ki_move.to_square])
-
-        try:
-            result['game_end'] = await self.check_game_end() or result['game_end']
-
-            if result['game_end']:
-                if datetime.now() - self.first_game_start > timedelta(minutes=self.max_game_time):
-                    result['redirect_url'] = self.redirect_url
-                    log.info("Close current Stockfish instance")
-                else:
-                    result = await self.get_redirect_data()
-
-                await self._delete_token()
-
-        except Exception:
-            log.exception(traceback.format_exc())
+            with span('game_end'):
+                result['game_end'] = await self.check_game_end()
+
+        # save both moves and the game end in one transaction
+        with span('save'):
+            async with self.sql_conn.transaction() as tx:
+                await self._save_moves(tx)
+
+                if result['game_end']:
+                    await self._save_end_reason(tx)
+
+                    try:
+                        if datetime.now() - self.first_game_start > timedelta(minutes=self.max_game_time):
+                            result['redirect_url'] = self.redirect_url
+                            log.info("Close current Stockfish instance")
+                        else:
+                            result = await self.get_redirect_data(tx)
+                    except Exception:
+                        log.exception(traceback.format_exc())
+
+                    await self._delete_token(tx)
+                    # the game data file is written in the background
+                    await GameExporter.enqueue(tx, self.game_id, self.token)
+
+        if result['game_end']:
+            self.session_cache.mark_invalid(self.token)
+            self.exporter.notify()
+        else:
+            # a copy, a later failed move must not leave its unsaved plies in the cache
+            self.session.board = self.board.copy()
+            self.session_cache.put(self.session)
 
         log.debug(result)
-        self.close()
         return result
@@ -1,14 +1,57 @@
+import asyncio
 import logging
-from typing import Union
+import os
+import weakref
+from typing import Dict, Union
 from pathlib import Path
 from configparser import ConfigParser
 
+import chess
 import psutil
 
+from src.lib import constants
+from src.lib.engine_pool import EnginePool
+from src.lib.game_export import GameExporter
+from src.lib.metrics import REGISTRY
+from src.lib.move_cache import MoveCache
+from src.lib.move_codec import replay
+from src.lib.request_timing import span
+from src.lib.resource_scheduler import ResourceScheduler
+from src.lib.search_limits import LimitController
+from src.lib.search_queue import SearchQueue
+from src.lib.session_cache import GameSession, SessionCache
 from src.lib.stockfish import Stockfish
 from src.lib.sql import SQL
 
-log = logging.getLogger()
+log = logging.getLogger(__name__)
+
+# UCI_Elo range the engine is set to, the search limits scale within it
+ENGINE_ELO_MIN = 1350
+ENGINE_ELO_MAX = 2850
+
+# queries of the request path, checked for full scans by `migrate.py --explain`
+GAME_INFO_QUERY = "SELECT id AS game_id, user_elo, token, start, redirect_url, game_number, first_game_start FROM games WHERE token = %(token)s AND stop IS NULL AND end_reasons IS NULL"
+LOAD_BOARD_QUERY = """
+    SELECT
+        moves.move_code
+    FROM
+        moves
+    WHERE
+        moves.game_id = %(game_id)s
+    ORDER BY
+        moves.ply ASC
+"""
+VALIDATE_SESSION_QUERY = """
+    SELECT
+        COALESCE(MAX(moves.ply), 0) AS ply
+    FROM
+        games
+        LEFT JOIN moves ON moves.game_id = games.id
+    WHERE
+        games.token = %(token)s AND games.stop IS NULL AND games.end_reasons IS NULL
+    GROUP BY
+        games.id
+"""
 
 
 class StockfishWrapper():
@@ -16,47 +59,227 @@ class StockfishWrapper():
         self.config = config
 
         self.game_id: int = 0
-        self.depth = self.config['stockfish']['depth']
         self.minimum_thinking_time = minimum_thinking_time
-        self.instances = {}
         self.stockfish_path = self.config['stockfish']['path']
         self.stockfish_log_path = Path(__file__).parent.parent.joinpath('log', 'stockfish_debug.log')
         
         self.calc_elo_points = self.config['stockfish'].getint('elo_points', 400)
         self.elo_point_subtract = self.config['stockfish'].getboolean('elo_point_subtract', False)
-        self.cpu_threads = psutil.cpu_count()
 
         self.sql_conn = sql_conn
 
+        # every server worker has its own wrapper with its own pools and caches
+        self.workers = max(1, self.config.getint('server', 'workers', fallback=1))
+        # a cached game may have been moved by another worker
+        self.validate_sessions = self.workers > 1
+
         if not self.stockfish_path or not Path(self.stockfish_path).exists():
             raise FileNotFoundError(f"Could not find Stockfish at path '{self.stockfish_path}'")
 
+        # moves of one game run one at a time, a lock lives as long as a handler of its game
+        self._game_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
+
+        self.sessions = SessionCache(
+            max_entries=self.config['game'].getint('session_cache_size', 1000),
+            ttl=self.config['game'].getfloat('session_cache_ttl', 1800.0),
+            invalid_ttl=self.config['game'].getfloat('invalid_token_ttl', 300.0),
+        )
+
+        self.move_cache = MoveCache(
+            max_entries=self.config['stockfish'].getint('move_cache_size', 100000),
+            samples=self.config['stockfish'].getint('move_cache_samples', 8),
+            elo_bucket=self.config['stockfish'].getint('move_cache_elo_bucket', 50),
+            book_path=self.config['stockfish'].get('book_path') or None,
+            book_max_ply=self.config['stockfish'].getint('book_max_ply', 16),
+            cache_file=self.config['stockfish'].get('move_cache_file') or None,
+        )
+
+        pool_max_size = self.config['stockfish'].getint('pool_max_size', 4)
+        self.scheduler = ResourceScheduler(
+            max_engines=pool_max_size,
+            thread_budget=self.config['stockfish'].getint('Threads'),
+            hash_budget=self.config['stockfish'].getint('hash_budget'),
+            max_engine_hash=self.config['stockfish'].getint('hash', 512),
+            memory_reserve=self.config['stockfish'].getint('memory_reserve', 512),
+            workers=self.workers,
+        )
+
+        self.search_queue = SearchQueue(
+            max_concurrent=self.config['stockfish'].getint('max_concurrent_searches', self.scheduler.max_searches),
+            max_queue=self.config['stockfish'].getint('search_queue_size', 64),
+            max_wait=self.config['stockfish'].getfloat('search_queue_timeout', 10.0),
+        )
+
+        self.limits = LimitController(
+            min_time=self.minimum_thinking_time / 1000,
+            max_time=self.config['stockfish'].getfloat('max_thinking_time', 0.1),
+            min_elo_time=self.config['stockfish'].getfloat('min_thinking_time'),
+            min_depth=self.config['stockfish'].getint('min_depth'),
+            max_depth=self.config['stockfish'].getint('depth', 20),
+            nodes=self.config['stockfish'].getint('nodes'),
+            target_p95=self.config['stockfish'].getfloat('move_latency_p95', 0.5),
+            elo_min=ENGINE_ELO_MIN,
+            elo_max=ENGINE_ELO_MAX,
+        )
+
+        self.exporter = GameExporter(
+            sql_conn,
+            output_dir=Path(self.config['game'].get('data_save_dir', constants.GAME_DATA_SAVE_DIR)),
+            max_user_draw_time=self.config['game'].getfloat('max_draw_time', 30.0),
+            poll_interval=self.config['game'].getfloat('export_poll_interval', 5.0),
+            max_attempts=self.config['game'].getint('export_max_attempts', 10),
+            retry_delay=self.config['game'].getfloat('export_retry_delay', 30.0),
+        )
+
+        self.engine_pool = EnginePool(
+            str(self.stockfish_path),
+            min_size=self.config['stockfish'].getint('pool_min_size', 1),
+            max_size=pool_max_size,
+            idle_timeout=self.config['stockfish'].getfloat('pool_idle_timeout', 300.0),
+            acquire_timeout=self.config['stockfish'].getfloat('pool_acquire_timeout', 30.0),
+            engine_options=self._get_pool_UCI_params(),
+            spawn_guard=self.check_ram,
+        )
+
+        # gauges are only read when /metrics is scraped
+        REGISTRY.gauge('uhh_chess_engine_processes', "Running engine processes.", lambda: len(self.engine_pool.pids()))
+        REGISTRY.gauge('uhh_chess_memory_available_bytes', "Available RAM as checked before an engine is started.", lambda: psutil.virtual_memory().available)
+        REGISTRY.gauge('uhh_chess_active_games', "Running games in the session cache.", lambda: len(self.sessions))
+
         log.debug(f"Create StockfishWrapper. {self.__dict__}")
 
+    async def start(self):
+        """Start the engine pool, open the move cache and start the game export worker."""
+        self.move_cache.open()
+        await self.engine_pool.start()
+        await self.exporter.start()
+
+    async def stop(self):
+        """Stop the game export worker, close all pooled engines and save the move cache."""
+        await self.exporter.stop()
+        await self.engine_pool.stop()
+        self.move_cache.close()
+
+    def stats(self) -> Dict[str, Dict]:
+        """Get the state of the search queue, engines and caches.
+
+        Returns:
+            Dict[str, Dict]: Stats of each component.
+        """
+        return {
+            'worker': {'pid': os.getpid(), 'workers': self.workers},
+            'search_queue': self.search_queue.stats(),
+            'search_limits': self.limits.stats(),
+            'engine_pool': self.engine_pool.stats(),
+            'scheduler': self.scheduler.stats(),
+            'sessions': self.sessions.stats(),
+            'move_cache': self.move_cache.stats(),
+            'exports': self.exporter.stats(),
+        }
+
     async def check_ram(self):
         """Check if enough RAM is available to start a new Stockfish instace.
 
         Raises:
-            MemoryError: Rais if free RAM < 512 MB
+            MemoryError: Rais if free RAM < 512 MB or the engines would exceed the memory budget
         """
         if psutil.virtual_memory().available / 1024 / 1024 < 512:
             raise MemoryError("Not enough memmory to create a new Stockfish instance!")
 
+        self.scheduler.check_memory(self.engine_pool.pids())
+
     async def _get_game_info(self, token: str):
         return await self.sql_conn.query(
-            "SELECT id AS game_id, user_elo, token, redirect_url, game_number, first_game_start FROM games WHERE token = %(token)s AND stop IS NULL",
-            {'token': token}, 
+            GAME_INFO_QUERY,
+            {'token': token},
             first=True,
         )
 
-    async def get(self, token: str) -> Union[Stockfish, None]:        
-        game_info = await self._get_game_info(token)
+    async def _load_board(self, game_id: int) -> chess.Board:
+        """Replay the stored moves of a game.
+
+        Args:
+            game_id (int): Game ID.
+
+        Returns:
+            chess.Board: Board with all moves pushed, needed to detect the end rules.
+        """
+        res = await self.sql_conn.query(LOAD_BOARD_QUERY, {'game_id': game_id})
+
+        return replay(entry['move_code'] for entry in res)
+
+    async def _validate_session(self, session: GameSession) -> Union[GameSession, None]:
+        """Check a cached game against the database.
+
+        Needed with several workers: each one has its own session cache, so
+        another worker may have saved moves or finished the game since.
 
-        log.debug(f"game_info: {repr(game_info)}")
-        if not game_info:
+        Args:
+            session (GameSession): Cached game.
+
+        Returns:
+            Union[GameSession, None]: The cached game if it is up to date, else None.
+        """
+        res = await self.sql_conn.query(
+            VALIDATE_SESSION_QUERY,
+            {'token': session.token},
+            first=True,
+        )
+
+        if not res:
+            self.sessions.mark_invalid(session.token)
+            return None
+
+        if res['ply'] != len(session.board.move_stack):
+            log.debug("Cached game %s is outdated: ply %s, saved ply %s", session.game_id, len(session.board.move_stack), res['ply'])
+            self.sessions.pop(session.token)
             return None
 
-        return await self._new_instance(**game_info)
+        return session
+
+    async def load(self, token: str) -> Union[GameSession, None]:
+        """Load board and metadata of a running game without touching an engine.
+
+        Args:
+            token (str): Game token.
+
+        Returns:
+            Union[GameSession, None]: Game or None if the token is unknown or the game finished.
+        """
+        # with one worker the database is only hit if the game is not cached
+        session = self.sessions.get(token)
+        if session is not None and self.validate_sessions:
+            with span('validate'):
+                session = await self._validate_session(session)
+
+        if session is None:
+            if self.sessions.is_invalid(token):
+                return None
+
+            game_info = await self._get_game_info(token)
+
+            log.debug("game_info: %r", game_info)
+            if not game_info:
+                self.sessions.mark_invalid(token)
+                return None
+
+            with span('replay'):
+                board = await self._load_board(game_info['game_id'])
+            session = GameSession(**game_info, board=board)
+            self.sessions.put(session)
+
+        return session
+
+    async def get(self, session: GameSession) -> Stockfish:
+        """Create the move handler of a loaded game.
+
+        Args:
+            session (GameSession): Game loaded by `load()`.
+
+        Returns:
+            Stockfish: Instance which checks out an engine for its search.
+        """
+        return await self._new_instance(session)
 
     async def _calc_engine_elo(self, user_elo):
         if self.elo_point_subtract:
@@ -64,53 +287,60 @@ class StockfishWrapper():
         else:
             elo = user_elo + self.calc_elo_points
 
-        if elo < 1349:
-            log.info(f"Target ELO '{elo}' is to small! Auto set to 1350")
-            elo = 1350
-        elif elo > 2850:
-            log.info(f"Target ELO '{elo}' is to large! Auto set to 2850")
-            elo = 2850
+        if elo < ENGINE_ELO_MIN:
+            log.info(f"Target ELO '{elo}' is to small! Auto set to {ENGINE_ELO_MIN}")
+            elo = ENGINE_ELO_MIN
+        elif elo > ENGINE_ELO_MAX:
+            log.info(f"Target ELO '{elo}' is to large! Auto set to {ENGINE_ELO_MAX}")
+            elo = ENGINE_ELO_MAX
 
         return elo
 
-    async def _get_UCI_params(self, user_elo: int):
+    def _get_pool_UCI_params(self):
+        """UCI options shared by every game, set once when a pooled engine is started.
+
+        Hash and Threads are fixed shares of the resource scheduler budgets.
+        """
         return {
                     'UCI_LimitStrength': self.config['stockfish'].getboolean('UCI_LimitStrength'),
+                    **self.scheduler.engine_options(),
+                }
+
+    async def _get_UCI_params(self, user_elo: int):
+        """UCI options of a single game, set whenever a game checks out an engine."""
+        return {
                     'UCI_Elo': await self._calc_engine_elo(user_elo),
                     'Slow Mover': self.config['stockfish'].getint('Slow_Mover'),
-                    'Threads': self.cpu_threads,
-                    'Hash': self.config['stockfish'].getint('hash'),
                 }
 
-    async def _new_instance(self, token: str, game_id: int, user_elo: int, first_game_start, redirect_url: str | None, game_number: int | None):
-        await self.check_ram()
+    def _game_lock(self, game_id: int) -> asyncio.Lock:
+        lock = self._game_locks.get(game_id)
+        if lock is None:
+            lock = self._game_locks[game_id] = asyncio.Lock()
+        return lock
 
+    async def _new_instance(self, session: GameSession):
         return await Stockfish(
-            str(self.stockfish_path),
-            token=token,
+            self.engine_pool,
+            session=session,
             sql_conn=self.sql_conn,
-            game_id=game_id,
-            engine_options=await self._get_UCI_params(user_elo),
-            depth=self.depth,
-            redirect_url=redirect_url,
-            game_number=game_number,
-            first_game_start=first_game_start,
+            session_cache=self.sessions,
+            move_cache=self.move_cache,
+            scheduler=self.scheduler,
+            search_queue=self.search_queue,
+            limits=self.limits,
+            exporter=self.exporter,
+            engine_options=await self._get_UCI_params(session.user_elo),
+            game_lock=self._game_lock(session.game_id),
         )
 
-
-    async def _clear_instances(self):
-        to_delete = [e.token for e in self.instances.values() if e.should_deleted()]
-        log.debug(f"Stockfish instances to delete: {to_delete}")
-        for key in to_delete:
-            del self.instances[key]
-
-    async def new(self, elo: int, user_id: str, redirect_url: str | None, game_number: int | None, old_game_id = None) -> Stockfish:
+    async def new(self, elo: int, user_id: str, redirect_url: str | None, game_number: int | None, old_game_id = None) -> GameSession:
         res = await self.sql_conn.query("""
                 INSERT INTO games
                     (ki_elo, user_elo, user_id, redirect_url, game_number, first_game_start)
                 VALUES
-                    (%(ki_elo)s ,%(user_elo)s, %(user_id)s, %(redirect_url)s, %(game_number)s, (SELECT g.first_game_start FROM games as g WHERE g.id = %(old_game_id)s) )
-                RETURNING token, id AS game_id, user_elo, redirect_url, game_number, first_game_start;
+                    (%(ki_elo)s ,%(user_elo)s, %(user_id)s, %(redirect_url)s, %(game_number)s, COALESCE((SELECT g.first_game_start FROM games as g WHERE g.id = %(old_game_id)s), NOW()) )
+                RETURNING token, id AS game_id, user_elo, start, redirect_url, game_number, first_game_start;
             """,
             {
                 'user_id': user_id, 'user_elo': elo, 'ki_elo': await self._calc_engine_elo(elo), 'redirect_url': redirect_url, 
@@ -122,5 +352,9 @@ class StockfishWrapper():
         if not res:
             raise Exception(f"Could not create new game!")
         
-        print(res)
-        return await self._new_instance(**res)
+        log.debug("New game: %s", res)
+        # a new game has no moves, so there is nothing to load
+        session = GameSession(**res, board=chess.Board())
+        self.sessions.put(session)
+
+        return session
@@ -0,0 +1,111 @@
+import logging
+import os
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.templating import Jinja2Templates
+from pydantic_settings import BaseSettings
+
+from src.lib.astl_logger import AstlLogger
+from src.lib.metrics import REGISTRY
+from src.lib.migrations import Migrations
+from src.lib.request_timing import RequestTimingMiddleware
+from src.lib.settings import create_sql, load_config
+from src.lib.static_assets import StaticAssets
+from src.lib import constants
+
+class Settings(BaseSettings):
+    openapi_url: str = None
+
+
+config = load_config()
+
+print(f"config['log']['log_to_stdout']: {config['log']['log_to_stdout']}")
+AstlLogger(
+    Path(),
+    config['log'].getint('level', 40),
+    config['log'].getboolean('log_to_stdout', False),
+    config['log'].getint('backup_count', 7),
+    json_lines=config['log'].getboolean('json_lines', False),
+    levels=AstlLogger.parse_levels(config['log'].get('levels', '')),
+    # workers rotating the same files at midnight would rename them under each other
+    file_suffix=f"_{os.getpid()}" if config.getint('server', 'workers', fallback=1) > 1 else '',
+)
+log = logging.getLogger()
+
+# the instrumentation of the hot paths is skipped while disabled
+REGISTRY.enabled = config.getboolean('metrics', 'enabled', fallback=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await sql_conn.connect()
+    if config['database'].getboolean('migrate_on_startup', False):
+        await Migrations(sql_conn).apply()
+    await stockfish_instances.start()
+    yield
+    await stockfish_instances.stop()
+    await sql_conn.close()
+
+
+app = FastAPI(
+    openapi_url=None,
+    redoc_url=None,
+    lifespan=lifespan,
+)
+
+origins = ['*']
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+) 
+
+# phase timings as Server-Timing header and log of slow requests
+app.add_middleware(
+    RequestTimingMiddleware,
+    slow_threshold=config['log'].getfloat('slow_request_threshold', 1.0),
+    send_header=config['log'].getboolean('server_timing', True),
+)
+
+src_path = Path().cwd().joinpath('src')
+static_assets = StaticAssets(
+    directory=Path(src_path, 'static'),
+    cache_dir=Path(config.get('static', 'cache_dir', fallback='cache/static')),
+)
+app.mount("/static", static_assets, name="static")
+
+templates = Jinja2Templates(directory=Path(src_path, 'templates'))
+# content hashed URL of a static file, e.g. static_url('js/game.js')
+templates.env.globals['static_url'] = static_assets.url
+
+try:
+    constants.GAME_DATA_SAVE_DIR = Path(config['game']['data_save_dir'])
+    constants.GAME_DATA_SAVE_DIR.mkdir(parents=True, exist_ok=True)
+    log.info(f"Game data output dir: {constants.GAME_DATA_SAVE_DIR.absolute()}")
+except Exception:
+    pass
+
+# can only secure if a fqdn is available
+SECURE_COOKIE = True
+try:
+    SECURE_COOKIE = config['cookie']['secure']
+except Exception:
+    pass
+
+sql_conn = create_sql(config)
+log.info(f"Database backend: {sql_conn.dialect}")
+
+from src.lib.stockfish_wrapper import StockfishWrapper
+stockfish_instances = StockfishWrapper(
+    sql_conn,
+    minimum_thinking_time=20,
+    config=config,
+)
+
+from src.views import *
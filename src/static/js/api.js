@@ -79,4 +79,57 @@ class Api{
 }
 
 
+class GameChannel{
+    // sends the moves of a game over one WebSocket, falls back to PUT /move without it
+    constructor(token) {
+        this.token = token;
+        this.socket = null;
+        this.pending = [];
+        this.connect();
+    }
+
+    connect() {
+        if (!('WebSocket' in window)){
+            return;
+        }
+
+        let protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        let socket = new WebSocket(protocol + '//' + window.location.host + '/ws/game/' + this.token);
+
+        socket.onopen = () => {
+            this.socket = socket;
+        };
+
+        // replies arrive in the order of the moves
+        socket.onmessage = (event) => {
+            let resolve = this.pending.shift();
+            if (resolve){
+                resolve(JSON.parse(event.data));
+            }
+        };
+
+        socket.onclose = () => {
+            this.socket = null;
+            // the server may have saved a move without a reply, reload the saved game
+            if (this.pending.length){
+                window.location.reload();
+            }
+        };
+    }
+
+    sendMove(data) {
+        if (this.socket && this.socket.readyState === WebSocket.OPEN){
+            return new Promise((resolve) => {
+                this.pending.push(resolve);
+                this.socket.send(JSON.stringify({data}));
+            });
+        }
+
+        return new Promise((resolve) => {
+            resolve(api.put('/move/' + this.token, data));
+        });
+    }
+}
+
+
 let api = new Api();
@@ -9,6 +9,7 @@ var curr_countdown_time = 30;
 var curr_redirect_countdown_time = 10;
 var game_ended = false;
 var game = new chessjs.Chess(current_fen || chessjs.DEFAULT_POSITION);
+var channel = new GameChannel(api.getCookie('token'));
 
 
 document.addEventListener("DOMContentLoaded", function() {
@@ -106,17 +107,20 @@ function onDrop (source, target, piece, newPos, oldPos, orientation) {
         'promotion': _is_promotion ? 'q' : null,
     }
 
-    let api_result = api.put('\\move\\'+api.getCookie('token'), data);
+    channel.sendMove(data).then(on_move_result);
+}
+
+function on_move_result(api_result) {
     console.log(api_result);
 
     if (api_result.error){
         console.log(api_result.info + " Reset to old FEN!");
-        console.log(target + '-' +  source);
-        board.move(target + '-' + source, false);
+        game.undo();
+        board.position(game.fen());
 
-        return 'snapback';
+        return;
     }
-    
+
 
     console.log("move: " + api_result.move);
     if (api_result.move){
@@ -127,6 +131,7 @@ function onDrop (source, target, piece, newPos, oldPos, orientation) {
         });
 
         console.log("ki_move:" + ki_move);
+        board.position(game.fen());
     }
 
     console.log("game.fen(): " + game.fen());
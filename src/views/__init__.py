@@ -1,2 +1,3 @@
 from .game import *
+from .status import *
 from src.lib.sql import SQL
\ No newline at end of file
@@ -1,43 +1,36 @@
 import logging
-from functools import wraps
-
-from fastapi import HTTPException
-
-from src import sql_conn, log
-
-log = logging.getLogger()
-
-
-def token_required(func):
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        log.debug(f"Auth user: {kwargs}")
-        token = kwargs.get('token')
-        if not token:
-            raise HTTPException(403)
-        
-        res = await sql_conn.query("""
-            SELECT 
-                id
-            FROM 
-                games
-            WHERE
-                token = %(token)s AND
-                end_reasons IS NULL
-            """,
-            {'token': token},
-            first=True,
-        )
-
-        game_id = res.get('id')
-        game_number = res.get('game_number')
-        log.debug(f"game_id: {game_id}")
-        if not game_id and not game_number:
-            print(f"raw_path: {kwargs['request']['raw_path']}")
-            # print(f"headers: {kwargs['request']['headers']}")
-            raise HTTPException(404)
-
-        log.debug(f"valid token: {token}")
-        return await func(*args, **kwargs)
-
-    return wrapper
\ No newline at end of file
+from typing import Annotated
+
+from fastapi import Depends, HTTPException, Request
+
+from src import stockfish_instances
+from src.lib.request_timing import span
+from src.lib.session_cache import GameSession
+
+log = logging.getLogger(__name__)
+
+
+async def game_context(request: Request, token: str) -> GameSession:
+    """Resolve the game token once per request.
+
+    The game is loaded from the session cache or with one query for the game
+    and one for its moves. Unknown tokens are cached as invalid.
+
+    Raises:
+        HTTPException: 403 without token, 404 if the game is unknown or finished.
+    """
+    log.debug("Auth user: %s", token)
+    if not token:
+        raise HTTPException(403)
+
+    with span('auth'):
+        game = await stockfish_instances.load(token)
+    if game is None:
+        log.debug("Unknown game for raw_path: %s", request.url.path)
+        raise HTTPException(404)
+
+    log.debug("valid token: %s", token)
+    return game
+
+
+GameContext = Annotated[GameSession, Depends(game_context)]
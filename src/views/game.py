@@ -1,19 +1,29 @@
 import logging
 from typing import Union
-from fastapi import Request
+from fastapi import Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 
 from src import app, templates, stockfish_instances
-from src.views.auth import token_required
+from src.lib.metrics import REGISTRY
+from src.lib.request_timing import time_route
+from src.lib.search_queue import EngineBusy
+from src.views.auth import GameContext
 
-log = logging.getLogger()
+log = logging.getLogger(__name__)
+
+MOVE_SECONDS = REGISTRY.histogram(
+    'uhh_chess_move_request_seconds', "Duration of a move request including the game lookup, by transport.", ('transport',),
+)
+# measured by the timing middleware, so the auth and the game lookup of GameContext are included
+time_route('/move/{token}', lambda seconds: MOVE_SECONDS.observe(seconds, 'rest'))
 
 
 @app.get('/start/{user_id}/{user_elo}', response_class=HTMLResponse)
 async def index(request: Request, user_id: str, user_elo: int, redirect_url: str | None, game_number: int = 0):
     # /start/USER_ID/ELO?redirect_url=REDIRECT_URL
-    log.debug(f"redirect_url: {redirect_url}")
-    log.debug(f"game_number: {game_number}")
+    log.debug("redirect_url: %s", redirect_url)
+    log.debug("game_number: %s", game_number)
 
     return templates.TemplateResponse(
         "start.html", 
@@ -23,23 +33,16 @@ async def index(request: Request, user_id: str, user_elo: int, redirect_url: str
 @app.get('/new/{user_id}/{user_elo}', response_class=HTMLResponse)
 async def new_game(request: Request, user_id: str, user_elo: int, redirect_url: str | None, game_number: int = 0, old_game_id: Union[int, None] = None):
     game = await stockfish_instances.new(user_elo, user_id, redirect_url, game_number, old_game_id)
-    log.debug(f"Created new game: {game}")
+    log.debug("Created new game: %s", game)
 
-    token = game.token
-    
-    await game.close()
-    return RedirectResponse(url=f"/game/{token}")
+    return RedirectResponse(url=f"/game/{game.token}")
 
 
 @app.get('/game/{token}', response_class=HTMLResponse)
-@token_required
-async def game(request: Request, token: str):
-    game = await stockfish_instances.get(token)
-
+async def game(request: Request, token: str, game: GameContext):
+    # page renders only need the board, no engine
     db_fen = game.board.fen()
-    log.debug(f"game.board.gen(): {db_fen}")
-
-    await game.close()
+    log.debug("game.board.gen(): %s", db_fen)
 
     res = templates.TemplateResponse("game.html", {'request': request, 'fen': db_fen})
     res.set_cookie('token', token, secure=False)
@@ -48,11 +51,67 @@ async def game(request: Request, token: str):
 
 
 @app.put('/move/{token}', response_class=JSONResponse)
-@token_required
-async def move(request: Request, token: str):
-    game = await stockfish_instances.get(token)
+async def move(request: Request, token: str, game: GameContext):
+    data = (await request.json()).get('data')
+    if not data:
+        log.info("No data in request found!")
+        return JSONResponse({'error': True, 'info': "Missing data!"}, status_code=500)
+
+    stockfish = await stockfish_instances.get(game)
     # log.debug(game.get_board_visual())
-    move = await game.move(request)
-    await game.close()
-    return move
+    return await stockfish.move(data)
+
+
+@app.websocket('/ws/game/{token}')
+async def game_socket(websocket: WebSocket, token: str):
+    """Play a game over one connection. The game is loaded once, each message is a move like the body of PUT /move.
+
+    Replies are the results of PUT /move. The socket is closed by the server after the game end.
+    """
+    game = await stockfish_instances.load(token)
+    if game is None:
+        # closed before accept, the handshake is answered with 403
+        await websocket.close()
+        return
+
+    await websocket.accept()
+    stockfish = await stockfish_instances.get(game)
+
+    try:
+        while True:
+            message = await websocket.receive_json()
+            data = message.get('data') if isinstance(message, dict) else None
+            if not data:
+                await websocket.send_json({'error': True, 'info': "Missing data!"})
+                continue
+
+            try:
+                with MOVE_SECONDS.time('websocket'):
+                    result = await stockfish.move(data)
+            except EngineBusy as e:
+                log.warning("Engine busy: %s", e)
+                result = {'error': True, 'info': "Server is busy, please try again.", 'retry_after': e.retry_after}
+            except Exception:
+                log.exception("Move failed in game %s", game.game_id)
+                # the client resets its board and sends the next moves with PUT /move
+                await websocket.send_json({'error': True, 'info': "Internal server error."})
+                await websocket.close(code=1011)
+                return
+
+            # the redirect data of a game end holds datetimes, encoded like the REST response
+            await websocket.send_json(jsonable_encoder(result))
+
+            if result.get('game_end'):
+                await websocket.close()
+                return
+
+            if result.get('error'):
+                # the board of the handler may hold the rejected move, continue from the saved game
+                game = await stockfish_instances.load(token)
+                if game is None:
+                    await websocket.close()
+                    return
+                stockfish = await stockfish_instances.get(game)
+    except WebSocketDisconnect:
+        log.debug("Game socket closed: %s", game.game_id)
 
@@ -0,0 +1,58 @@
+import logging
+import secrets
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from src import app, config, stockfish_instances, sql_conn
+from src.lib.metrics import REGISTRY
+from src.lib.search_queue import EngineBusy
+
+log = logging.getLogger(__name__)
+
+LOCAL_CLIENTS = ('127.0.0.1', '::1', 'localhost')
+
+
+async def operator_access(request: Request) -> None:
+    """Keep the operational endpoints away from the participants.
+
+    With `[metrics] token` set, the token must be sent as bearer token.
+    Otherwise only clients on the same host are answered.
+
+    Raises:
+        HTTPException: 404 if metrics are disabled, 403 for other clients.
+    """
+    if not REGISTRY.enabled:
+        raise HTTPException(404)
+
+    token = config.get('metrics', 'token', fallback='')
+    if token:
+        authorization = request.headers.get('authorization', '')
+        if secrets.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+            return
+    elif request.client and request.client.host in LOCAL_CLIENTS:
+        return
+
+    log.info("Denied %s for %s", request.url.path, request.client.host if request.client else None)
+    raise HTTPException(403)
+
+
+@app.exception_handler(EngineBusy)
+async def engine_busy(request: Request, exc: EngineBusy):
+    log.warning("Engine busy: %s %s", exc, stockfish_instances.search_queue.stats())
+    return JSONResponse(
+        {'error': True, 'info': "Server is busy, please try again."},
+        status_code=503,
+        headers={'Retry-After': str(exc.retry_after)},
+    )
+
+
+@app.get('/status', response_class=JSONResponse, dependencies=[Depends(operator_access)])
+async def status(request: Request):
+    # queue depth, wait times and pool usage for capacity planning
+    return {**stockfish_instances.stats(), 'sql': sql_conn.stats()}
+
+
+@app.get('/metrics', response_class=PlainTextResponse, dependencies=[Depends(operator_access)])
+async def metrics(request: Request):
+    return PlainTextResponse(REGISTRY.render(), media_type='text/plain; version=0.0.4')
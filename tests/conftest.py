@@ -0,0 +1,73 @@
+"""Run the app on the SQLite backend with the stub engine of the load test.
+
+The settings are written to a temporary directory before `src` is imported.
+Every search of the stub engine takes `SEARCH_SECONDS`.
+"""
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+TEST_DIR = Path(tempfile.mkdtemp(prefix='uhh-chess-test-'))
+SEARCH_SECONDS = 0.5
+
+SETTINGS = f"""
+[database]
+backend = sqlite
+path = {TEST_DIR / 'chess.sqlite3'}
+migrate_on_startup = True
+
+[game]
+data_save_dir = {TEST_DIR / 'game_data'}
+
+[stockfish]
+path = {ROOT / 'benchmark' / 'stub_engine.py'}
+UCI_LimitStrength = True
+Threads = 4
+max_concurrent_searches = 4
+pool_min_size = 2
+pool_max_size = 4
+# searches longer than the stub engine answers, so it always takes SEARCH_SECONDS
+max_thinking_time = 10
+move_latency_p95 = 100
+move_cache_size = 0
+move_cache_file =
+Slow_Mover = 10
+
+[static]
+cache_dir = {TEST_DIR / 'static'}
+
+[metrics]
+enabled = True
+
+[log]
+level = 40
+log_to_stdout = False
+"""
+
+(TEST_DIR / 'settings.ini').write_text(SETTINGS)
+os.environ['UHH_CHESS_SETTINGS'] = str(TEST_DIR / 'settings.ini')
+os.environ['STUB_ENGINE_MAX_DELAY'] = str(SEARCH_SECONDS)
+# templates and static files are resolved from the working directory
+os.chdir(ROOT)
+
+
+@pytest.fixture(scope='session')
+def loop():
+    # the pools of the app are bound to the loop they were started in
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope='session')
+def app(loop):
+    import src
+
+    lifespan = src.app.router.lifespan_context(src.app)
+    loop.run_until_complete(lifespan.__aenter__())
+    yield src.app
+    loop.run_until_complete(lifespan.__aexit__(None, None, None))
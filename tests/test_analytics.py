@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+
+def game_rows(user_id: str, moves: int):
+    start = datetime(2024, 1, 1, 12)
+    return [
+        {
+            'user_id': user_id, 'game_number': 0, 'user_elo': 1500, 'ki_elo': 1900, 'end_reasons': 'CHECKMATE', 'winning_color': '',
+            'start': start.isoformat(), 't_stamp': (start + timedelta(seconds=10 * (ply + 1))).isoformat(),
+        }
+        for ply in range(moves)
+    ]
+
+
+def test_no_games(app, tmp_path):
+    from src.lib.analytics import load_files, load_games
+
+    for table in (load_games([]), load_files(tmp_path)):
+        assert len(table) == 0
+        assert len(table.offsets) == 0
+        assert len(table.draw_time) == 0
+        assert table.per_user() == {}
+        assert table.per_cohort() == {}
+        assert table.mismatches() == {'draw_time': 0, 'overdrawn': 0, 'avg_move_duration': 0}
+
+
+def test_offsets(app):
+    from src.lib.analytics import load_games
+
+    table = load_games([game_rows('a', 3), game_rows('b', 2)])
+    assert table.offsets.tolist() == [0, 3]
+    assert table.move_number.tolist() == [1, 2, 3, 1, 2]
+    assert table.draw_time.tolist() == [10.0] * 5
@@ -0,0 +1,38 @@
+import asyncio
+import time
+
+import httpx
+
+from tests.conftest import SEARCH_SECONDS
+
+USER_ELO = 2450
+
+
+async def play_first_move(client: httpx.AsyncClient, token: str) -> httpx.Response:
+    return await client.put(f'/move/{token}', json={'data': {'source': 'e2', 'target': 'e4', 'promotion': False}})
+
+
+def test_moves_of_two_games_overlap(app, loop, monkeypatch):
+    from src import stockfish_instances
+
+    # the stub engine needs no CPU, do not cap the searches by the cores of the test machine
+    monkeypatch.setattr(stockfish_instances.scheduler, '_search_slots', asyncio.Semaphore(2))
+
+    async def main():
+        games = [await stockfish_instances.new(USER_ELO, f'overlap-{i}', 'https://example.org', 0) for i in range(2)]
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url='http://test') as client:
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(play_first_move(client, game.token) for game in games))
+            elapsed = time.perf_counter() - start
+
+        return responses, elapsed
+
+    responses, elapsed = loop.run_until_complete(main())
+
+    for response in responses:
+        assert response.status_code == 200
+        assert 'move' in response.json()
+
+    # one after the other would take two searches
+    assert SEARCH_SECONDS <= elapsed < 2 * SEARCH_SECONDS
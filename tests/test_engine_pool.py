@@ -0,0 +1,32 @@
+import chess.engine
+import pytest
+
+from tests.conftest import ROOT
+
+STUB_ENGINE = str(ROOT / 'benchmark' / 'stub_engine.py')
+
+
+def test_engine_is_closed_if_configure_fails(loop):
+    from src.lib.engine_pool import EnginePool
+
+    pool = EnginePool(STUB_ENGINE, min_size=0, max_size=1, acquire_timeout=1)
+    engines = []
+    spawn = pool._spawn
+
+    async def recorded_spawn():
+        engines.append(await spawn())
+        return engines[-1]
+
+    pool._spawn = recorded_spawn
+
+    with pytest.raises(chess.engine.EngineError):
+        loop.run_until_complete(pool.acquire({'NoSuchOption': 1}))
+
+    assert engines[0].returncode.done()
+    assert pool.size == 0
+    assert pool.discarded == 1
+
+    # the slot was freed
+    engine = loop.run_until_complete(pool.acquire())
+    loop.run_until_complete(pool.release(engine))
+    loop.run_until_complete(pool.stop())
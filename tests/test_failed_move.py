@@ -0,0 +1,43 @@
+import pytest
+
+from src.lib.search_queue import EngineBusy
+
+FIRST_MOVE = {'source': 'e2', 'target': 'e4', 'promotion': False}
+SECOND_MOVE = {'source': 'd2', 'target': 'd4', 'promotion': False}
+
+
+def saved_plies(loop, sql_conn, game_id: int) -> int:
+    res = loop.run_until_complete(sql_conn.query(
+        "SELECT COUNT(*) AS plies FROM moves WHERE game_id = %(game_id)s", {'game_id': game_id}, first=True,
+    ))
+    return res['plies']
+
+
+def test_retry_after_failed_engine_move(app, loop, monkeypatch):
+    from src import sql_conn, stockfish_instances
+
+    game = loop.run_until_complete(stockfish_instances.new(1500, 'failed-move', 'https://example.org', 0))
+    handler = loop.run_until_complete(stockfish_instances.get(game))
+    assert 'move' in loop.run_until_complete(handler.move(FIRST_MOVE))
+
+    # the user move of the second move is pushed, then the engine is busy
+    ki_move = handler._ki_move
+
+    async def busy():
+        raise EngineBusy("busy")
+
+    monkeypatch.setattr(handler, '_ki_move', busy)
+    with pytest.raises(EngineBusy):
+        loop.run_until_complete(handler.move(SECOND_MOVE))
+
+    session = stockfish_instances.sessions.get(game.token)
+    assert len(session.board.move_stack) == saved_plies(loop, sql_conn, game.game_id) == 2
+
+    # a new handler, as the REST route creates one per request
+    assert 'move' in loop.run_until_complete(loop.run_until_complete(stockfish_instances.get(session)).move(SECOND_MOVE))
+
+    # the same handler, as the WebSocket channel keeps one
+    monkeypatch.setattr(handler, '_ki_move', ki_move)
+    result = loop.run_until_complete(handler.move({'source': 'g1', 'target': 'f3', 'promotion': False}))
+    assert 'move' in result
+    assert len(stockfish_instances.sessions.get(game.token).board.move_stack) == saved_plies(loop, sql_conn, game.game_id) == 6
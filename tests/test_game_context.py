@@ -0,0 +1,48 @@
+from starlette.requests import Request
+
+
+def count_queries(monkeypatch, sql_conn) -> list:
+    queries = []
+    query = sql_conn.query
+
+    async def counted_query(*args, **kwargs):
+        queries.append(args[0])
+        return await query(*args, **kwargs)
+
+    monkeypatch.setattr(sql_conn, 'query', counted_query)
+    return queries
+
+
+def resolve(loop, token: str):
+    from fastapi import HTTPException
+    from src.views.auth import game_context
+
+    request = Request({'type': 'http', 'method': 'GET', 'path': f'/game/{token}', 'headers': []})
+    try:
+        return loop.run_until_complete(game_context(request, token))
+    except HTTPException as e:
+        return e.status_code
+
+
+def test_queries_per_request(app, loop, monkeypatch):
+    from src import sql_conn, stockfish_instances
+
+    game = loop.run_until_complete(stockfish_instances.new(1500, 'query-count', 'https://example.org', 0))
+    queries = count_queries(monkeypatch, sql_conn)
+
+    # cached by new()
+    assert resolve(loop, game.token).game_id == game.game_id
+    assert len(queries) == 0
+
+    # game and moves
+    stockfish_instances.sessions.pop(game.token)
+    assert resolve(loop, game.token).game_id == game.game_id
+    assert len(queries) == 2
+
+    # unknown tokens are looked up once, then answered from the negative cache
+    queries.clear()
+    assert resolve(loop, 'unknown-token') == 404
+    assert len(queries) == 1
+    queries.clear()
+    assert resolve(loop, 'unknown-token') == 404
+    assert len(queries) == 0
@@ -0,0 +1,34 @@
+import chess.engine
+
+from src.lib.search_limits import LimitController
+
+
+def test_idle_limit_is_the_configured_limit_at_every_level():
+    limits = LimitController(min_time=0.02, max_time=0.1, max_depth=20, elo_min=1350, elo_max=2850)
+
+    for elo in (1350, 2000, 2850, None):
+        assert limits.limit(elo) == chess.engine.Limit(time=0.1, depth=20)
+
+
+def test_load_and_latency_only_lower_the_time():
+    limits = LimitController(min_time=0.02, max_time=0.1, max_depth=20, target_p95=0.5)
+
+    assert limits.limit(1500, load=2).time < 0.1
+    assert limits.limit(1500, load=100).time == 0.02
+
+    for _ in range(20):
+        limits.record(1.0)
+    assert limits.limit(1500).time < 0.1
+
+    # recovers, but never searches longer than the configured time
+    for _ in range(1000):
+        limits.record(0.01)
+    assert limits.scale == 1.0
+    assert limits.limit(1500).time == 0.1
+
+
+def test_lower_levels_search_less_if_configured():
+    limits = LimitController(min_time=0.02, max_time=0.1, min_elo_time=0.02, min_depth=8, max_depth=20, elo_min=1350, elo_max=2850)
+
+    assert limits.limit(1350) == chess.engine.Limit(time=0.02, depth=8)
+    assert limits.limit(2850) == chess.engine.Limit(time=0.1, depth=20)
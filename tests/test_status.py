@@ -0,0 +1,34 @@
+import httpx
+
+
+def get(app, loop, path: str, client: str = '127.0.0.1', headers=None) -> httpx.Response:
+    async def main():
+        transport = httpx.ASGITransport(app=app, client=(client, 12345))
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as http:
+            return await http.get(path, headers=headers)
+
+    return loop.run_until_complete(main())
+
+
+def test_status_only_for_local_clients(app, loop):
+    for path in ('/status', '/metrics'):
+        assert get(app, loop, path).status_code == 200
+        assert get(app, loop, path, client='203.0.113.7').status_code == 403
+
+
+def test_status_with_token(app, loop, monkeypatch):
+    from src import config
+
+    monkeypatch.setitem(config['metrics'], 'token', 'secret')
+
+    assert get(app, loop, '/status').status_code == 403
+    assert get(app, loop, '/status', client='203.0.113.7', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert get(app, loop, '/status', client='203.0.113.7', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_status_disabled_with_metrics(app, loop, monkeypatch):
+    from src.lib.metrics import REGISTRY
+
+    monkeypatch.setattr(REGISTRY, 'enabled', False)
+
+    assert get(app, loop, '/status').status_code == 404